@@ -0,0 +1,26 @@
+-- CreateTable
+CREATE TABLE "Predictions_Journalieres" (
+    "id_prediction" BIGSERIAL NOT NULL,
+    "id_pays" INTEGER NOT NULL,
+    "id_virus" INTEGER NOT NULL,
+    "date" DATE NOT NULL,
+    "version_modele" VARCHAR(64) NOT NULL,
+    "empreinte_donnees" VARCHAR(40) NOT NULL,
+    "nouveaux_cas" INTEGER NOT NULL DEFAULT 0,
+    "nouveaux_deces" INTEGER NOT NULL DEFAULT 0,
+    "taux_infection" DOUBLE PRECISION,
+    "taux_mortalite" DOUBLE PRECISION,
+    "propagation_geographique" INTEGER,
+    "calcule_le" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "Predictions_Journalieres_pkey" PRIMARY KEY ("id_prediction")
+);
+
+-- CreateIndex
+CREATE UNIQUE INDEX "Predictions_Journalieres_id_pays_id_virus_date_key" ON "Predictions_Journalieres"("id_pays", "id_virus", "date");
+
+-- AddForeignKey
+ALTER TABLE "Predictions_Journalieres" ADD CONSTRAINT "Predictions_Journalieres_id_pays_fkey" FOREIGN KEY ("id_pays") REFERENCES "Pays"("id_pays") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "Predictions_Journalieres" ADD CONSTRAINT "Predictions_Journalieres_id_virus_fkey" FOREIGN KEY ("id_virus") REFERENCES "Virus"("id_virus") ON DELETE CASCADE ON UPDATE CASCADE;
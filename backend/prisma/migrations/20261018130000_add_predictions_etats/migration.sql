@@ -0,0 +1,16 @@
+-- CreateTable
+CREATE TABLE "Predictions_Etats" (
+    "id_pays" INTEGER NOT NULL,
+    "id_virus" INTEGER NOT NULL,
+    "version_modele" VARCHAR(64) NOT NULL,
+    "empreinte_donnees" VARCHAR(40) NOT NULL,
+    "calcule_le" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "Predictions_Etats_pkey" PRIMARY KEY ("id_pays","id_virus")
+);
+
+-- AddForeignKey
+ALTER TABLE "Predictions_Etats" ADD CONSTRAINT "Predictions_Etats_id_pays_fkey" FOREIGN KEY ("id_pays") REFERENCES "Pays"("id_pays") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "Predictions_Etats" ADD CONSTRAINT "Predictions_Etats_id_virus_fkey" FOREIGN KEY ("id_virus") REFERENCES "Virus"("id_virus") ON DELETE CASCADE ON UPDATE CASCADE;
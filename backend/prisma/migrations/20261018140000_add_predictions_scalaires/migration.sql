@@ -0,0 +1,13 @@
+-- AlterTable
+ALTER TABLE "Predictions_Journalieres" ADD COLUMN "officielle" BOOLEAN NOT NULL DEFAULT false;
+
+-- AlterTable
+ALTER TABLE "Predictions_Etats" ADD COLUMN "date_debut" DATE,
+ADD COLUMN "date_fin" DATE,
+ADD COLUMN "total_cas" INTEGER,
+ADD COLUMN "total_deces" INTEGER,
+ADD COLUMN "date_pic" DATE,
+ADD COLUMN "duree_estimee_jours" INTEGER,
+ADD COLUMN "cas_30j" INTEGER,
+ADD COLUMN "deces_30j" INTEGER,
+ADD COLUMN "nouveaux_pays_semaine" INTEGER;
@@ -19,6 +19,17 @@ const resolvers = {
         throw new Error("Erreur API ML");
       }
     },
+    predictPandemicBatch: async (_, { items }, { user }) => {
+      requireAuth(user);
+      try {
+        const apiUrl = process.env.API_IA_URL || 'http://127.0.0.1:8000';
+        const response = await axios.post(`${apiUrl}/predict/batch`, { items });
+        return response.data.results;
+      } catch (error) {
+        console.error("Erreur lors de l'appel à l'API ML:", error.message);
+        throw new Error("Erreur API ML");
+      }
+    },
     me: async (_, __, { user }) => {
       requireAuth(user);
       return user;
@@ -82,6 +93,32 @@ const resolvers = {
       requireAuth(user);
       return prisma.statistiquesJournalieres.findMany();
     },
+    predictionsByPaysVirus: async (_, { id_pays, id_virus, date_start, date_end, officielle }, { user }) => {
+      requireAuth(user);
+      const date = {};
+      if (date_start) date.gte = new Date(date_start);
+      if (date_end) date.lte = new Date(date_end);
+      return prisma.predictionsJournalieres.findMany({
+        where: {
+          id_pays: parseInt(id_pays),
+          id_virus: parseInt(id_virus),
+          date,
+          ...(officielle === undefined || officielle === null ? {} : {officielle}),
+        },
+        orderBy: {date: "asc"},
+      });
+    },
+    predictionEtat: async (_, { id_pays, id_virus }, { user }) => {
+      requireAuth(user);
+      return prisma.predictionsEtats.findUnique({
+        where: {
+          id_pays_id_virus: {
+            id_pays: parseInt(id_pays),
+            id_virus: parseInt(id_virus),
+          },
+        },
+      });
+    },
   },
 
   Mutation: {
@@ -39,6 +39,44 @@ const typeDefs = gql`
     taux_mortalite_pop_vs_global: Float
   }
   
+  type PredictionsJournalieres {
+    id_prediction: ID!
+    id_pays: ID!
+    id_virus: ID!
+    date: String!
+    version_modele: String!
+    nouveaux_cas: Int
+    nouveaux_deces: Int
+    taux_infection: Float
+    taux_mortalite: Float
+    propagation_geographique: Int
+    officielle: Boolean
+    calcule_le: String
+  }
+
+  type PredictionsEtats {
+    id_pays: ID!
+    id_virus: ID!
+    version_modele: String!
+    date_debut: String
+    date_fin: String
+    total_cas: Int
+    total_deces: Int
+    date_pic: String
+    duree_estimee_jours: Int
+    cas_30j: Int
+    deces_30j: Int
+    nouveaux_pays_semaine: Int
+    calcule_le: String
+  }
+
+  input PredictionInput {
+    country: String!
+    virus: String!
+    date_start: String!
+    date_end: String!
+  }
+
   type User {
   id_user: ID!
   email: String!
@@ -63,6 +101,9 @@ type AuthPayload {
       date_start: String!
       date_end: String!
     ): JSON
+
+    # Plusieurs prédictions en un seul appel à l'API IA
+    predictPandemicBatch(items: [PredictionInput!]!): JSON
     
     # Requêtes pour Pays
     pays(id_pays: ID): Pays
@@ -81,6 +122,18 @@ type AuthPayload {
     statistiquesByVirus(id_virus: ID!): [StatistiquesJournalieres]
     statistiquesByDate(date: String!): [StatistiquesJournalieres]
     allStatistiques: [StatistiquesJournalieres]
+
+    # Prédictions matérialisées par l'API IA, lues sans l'appeler :
+    # séries lissées (officielle filtre officielles ou prédites) et valeurs
+    # scalaires
+    predictionsByPaysVirus(
+      id_pays: ID!
+      id_virus: ID!
+      date_start: String
+      date_end: String
+      officielle: Boolean
+    ): [PredictionsJournalieres]
+    predictionEtat(id_pays: ID!, id_virus: ID!): PredictionsEtats
     me: User
   }
   scalar JSON
@@ -22,6 +22,9 @@ class Config:
         
         # Configuration des fichiers
         self.csv_file_path = os.getenv('CSV_FILE_PATH')
+
+        # Snapshot des statistiques pour ml_api (pas d'export si vide)
+        self.stats_snapshot_dir = os.getenv('STATS_SNAPSHOT_DIR')
         
         # Validation des paramètres obligatoires
         self._valider_config()
@@ -1,5 +1,7 @@
 import pandas as pd
-from sqlalchemy import create_engine, MetaData, Column, Integer, BigInteger, Numeric, String, Date, ForeignKey, UniqueConstraint, Boolean, DateTime
+from sqlalchemy import (create_engine, MetaData, Column, Integer, BigInteger,
+                        Numeric, Float, String, Date, ForeignKey,
+                        UniqueConstraint, Boolean, DateTime)
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -7,6 +9,7 @@ import os
 
 from config import config
 from validator import validator
+from snapshot import exporter_snapshot
 
 # Définition des modèles SQLAlchemy
 Base = declarative_base()
@@ -126,6 +129,68 @@ class StatistiquesGlobales(Base):
     def __repr__(self):
         return f"<StatistiquesGlobales(id_global={self.id_global}, date={self.date}, virus={self.id_virus})>"
 
+
+class PredictionsJournalieres(Base):
+    __tablename__ = "Predictions_Journalieres"
+
+    # Remplie par ml_api/materialize_predictions.py
+    id_prediction = Column(BigInteger, primary_key=True, autoincrement=True)
+    id_pays = Column(Integer, ForeignKey("Pays.id_pays", ondelete="CASCADE"),
+                     nullable=False)
+    id_virus = Column(Integer,
+                      ForeignKey("Virus.id_virus", ondelete="CASCADE"),
+                      nullable=False)
+    date = Column(Date, nullable=False)
+    version_modele = Column(String(64), nullable=False)
+    empreinte_donnees = Column(String(40), nullable=False)
+    nouveaux_cas = Column(Integer, default=0, nullable=False)
+    nouveaux_deces = Column(Integer, default=0, nullable=False)
+    taux_infection = Column(Float, nullable=True)
+    taux_mortalite = Column(Float, nullable=True)
+    propagation_geographique = Column(Integer, nullable=True)
+    # Valeurs officielles lissées de la période (vrai) ou dates prédites
+    officielle = Column(Boolean, default=False, nullable=False)
+    calcule_le = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint(
+            'id_pays', 'id_virus', 'date',
+            name='Predictions_Journalieres_id_pays_id_virus_date_key'),
+    )
+
+    def __repr__(self):
+        return (f"<PredictionsJournalieres(date={self.date}, "
+                f"pays={self.id_pays}, virus={self.id_virus}, "
+                f"version={self.version_modele})>")
+
+
+class PredictionsEtats(Base):
+    __tablename__ = "Predictions_Etats"
+
+    # Dernier calcul de chaque couple, même sans date prédite
+    id_pays = Column(Integer, ForeignKey("Pays.id_pays", ondelete="CASCADE"),
+                     primary_key=True)
+    id_virus = Column(Integer,
+                      ForeignKey("Virus.id_virus", ondelete="CASCADE"),
+                      primary_key=True)
+    version_modele = Column(String(64), nullable=False)
+    empreinte_donnees = Column(String(40), nullable=False)
+    calcule_le = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Période calculée et valeurs scalaires de la réponse de /predict
+    date_debut = Column(Date, nullable=True)
+    date_fin = Column(Date, nullable=True)
+    total_cas = Column(Integer, nullable=True)
+    total_deces = Column(Integer, nullable=True)
+    date_pic = Column(Date, nullable=True)
+    duree_estimee_jours = Column(Integer, nullable=True)
+    cas_30j = Column(Integer, nullable=True)
+    deces_30j = Column(Integer, nullable=True)
+    nouveaux_pays_semaine = Column(Integer, nullable=True)
+
+    def __repr__(self):
+        return (f"<PredictionsEtats(pays={self.id_pays}, "
+                f"virus={self.id_virus}, version={self.version_modele})>")
+
 def calculer_checksum_fichier(filepath):
     import hashlib
 
@@ -258,6 +323,10 @@ def migrer_donnees():
 
         verifier_migration_finale(session)
 
+        # Snapshot lu par ml_api, écrit avant que la migration soit marquée
+        # terminée
+        exporter_snapshot_statistiques(session)
+
         # Marquer la migration comme terminée
         enregistrer_migration(session, config.csv_file_path, "completed")
 
@@ -276,6 +345,20 @@ def migrer_donnees():
             session.close()
             config.log_info("Session fermée")
 
+
+def exporter_snapshot_statistiques(session):
+    if not config.stats_snapshot_dir:
+        return
+    config.log_info("Export du snapshot des statistiques journalières...")
+    try:
+        exporter_snapshot(session, StatistiquesJournalieres.__table__,
+                          config.stats_snapshot_dir,
+                          calculer_checksum_fichier(config.csv_file_path))
+    except Exception as e:
+        # ml_api continue de lire la base : la migration n'échoue pas pour
+        # autant
+        config.log_error("Erreur lors de l'export du snapshot", e)
+
 def inserer_saisons(session, df):
     config.log_info("Traitement des saisons...")
 
@@ -0,0 +1,141 @@
+import json
+import os
+import shutil
+from datetime import date, datetime
+
+import numpy as np
+from sqlalchemy import Float, cast, func, select
+
+from config import config
+
+# Colonnes exportées, converties par la base comme dans ml_api
+# (colonnes_typees de series_cache.py) : NULL -> 0, comptes en int64, taux
+# en float64
+COLONNES_ENTIERES = ("nouveaux_cas", "nouveaux_deces", "total_cas",
+                     "total_deces")
+COLONNES_REELLES = ("taux_infection", "taux_mortalite", "croissance_cas",
+                    "taux_mortalite_population", "taux_infection_vs_global",
+                    "taux_mortalite_pop_vs_global")
+COLONNES_SNAPSHOT = COLONNES_ENTIERES + COLONNES_REELLES
+# Colonnes lissées par /predict (COLONNES_CUMULEES de ml_api/series_cache.py,
+# même ordre), dont le snapshot garde les sommes cumulées de chaque série
+COLONNES_CUMULEES = ("nouveaux_cas", "nouveaux_deces", "taux_infection",
+                     "taux_mortalite")
+
+FORMAT_SNAPSHOT = 2
+FICHIER_COURANT = "CURRENT"
+FICHIER_MANIFESTE = "manifest.json"
+FICHIER_INDEX = "index.npy"
+FICHIER_DATES = "dates.npy"
+FICHIER_CUMULS = "cumuls.npy"
+
+
+def lire_statistiques(session, table):
+    """
+    Toutes les lignes de Statistiques_Journalieres, triées par série puis
+    par date.
+    """
+    colonnes = [table.c.id_pays, table.c.id_virus, table.c.date,
+                *[func.coalesce(table.c[nom], 0) if nom in COLONNES_ENTIERES
+                  else func.coalesce(cast(table.c[nom], Float), 0.0)
+                  for nom in COLONNES_SNAPSHOT]]
+    return session.execute(
+        select(*colonnes).order_by(table.c.id_pays, table.c.id_virus,
+                                   table.c.date)
+    ).fetchall()
+
+
+def construire_tableaux(lignes):
+    """
+    Tableaux colonnes du snapshot et index (id_pays, id_virus, début, fin,
+    début des cumuls, fin des cumuls) des tranches de chaque série.
+    """
+    n = len(lignes)
+    # Une transposition puis une conversion NumPy par colonne
+    valeurs = list(zip(*lignes)) or [()] * (3 + len(COLONNES_SNAPSHOT))
+    # Dates par leurs ordinaux, bien plus rapide que
+    # np.array(..., "datetime64[D]")
+    ordinaux = np.fromiter(map(date.toordinal, valeurs[2]), dtype=np.int64,
+                           count=n)
+    epoque = date(1970, 1, 1).toordinal()
+    tableaux = {"dates": (ordinaux - epoque).astype("datetime64[D]")}
+    for indice, nom in enumerate(COLONNES_SNAPSHOT, start=3):
+        tableaux[nom] = np.array(valeurs[indice], dtype=np.int64
+                                 if nom in COLONNES_ENTIERES else np.float64)
+
+    # Une tranche commence à chaque changement de (id_pays, id_virus)
+    pays = np.array(valeurs[0], dtype=np.int64)
+    virus = np.array(valeurs[1], dtype=np.int64)
+    coupures = np.flatnonzero((pays[1:] != pays[:-1]) |
+                              (virus[1:] != virus[:-1])) + 1
+    debuts = np.concatenate([[0], coupures]) if n else coupures
+    fins = np.concatenate([coupures, [n]]) if n else coupures
+
+    # Sommes cumulées de chaque série précédées d'un 0, calculées comme
+    # sommes_prefixes de ml_api (cumul séquentiel depuis le début de la
+    # série) : la série i occupe les colonnes [début + i, fin + i + 1)
+    rangs = np.arange(len(debuts))
+    debuts_cumuls = debuts + rangs
+    fins_cumuls = fins + rangs + 1
+    valeurs_cumulees = np.array([tableaux[nom] for nom in COLONNES_CUMULEES],
+                                dtype=np.float64).reshape(
+                                    len(COLONNES_CUMULEES), n)
+    cumuls = np.zeros((len(COLONNES_CUMULEES), n + len(debuts)))
+    for debut, fin, debut_cumul in zip(debuts, fins, debuts_cumuls):
+        np.cumsum(valeurs_cumulees[:, debut:fin], axis=-1,
+                  out=cumuls[:, debut_cumul + 1:debut_cumul + 1 + fin - debut])
+    tableaux["cumuls"] = cumuls
+
+    index = np.column_stack([pays[debuts], virus[debuts], debuts, fins,
+                             debuts_cumuls, fins_cumuls])
+    return tableaux, index.astype(np.int64).reshape(-1, 6)
+
+
+def exporter_snapshot(session, table, racine, checksum, conserver=2):
+    """
+    Écrit le snapshot dans racine/<horodatage>/ puis fait pointer
+    racine/CURRENT dessus par renommage atomique : ml_api ne voit jamais
+    un snapshot à moitié écrit. Retourne le nom de la version.
+    """
+    lignes = lire_statistiques(session, table)
+    tableaux, index = construire_tableaux(lignes)
+
+    os.makedirs(racine, exist_ok=True)
+    version = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    temporaire = os.path.join(racine, f".{version}.tmp")
+    os.makedirs(temporaire)
+    try:
+        np.save(os.path.join(temporaire, FICHIER_DATES), tableaux["dates"])
+        for nom in COLONNES_SNAPSHOT:
+            np.save(os.path.join(temporaire, f"{nom}.npy"), tableaux[nom])
+        np.save(os.path.join(temporaire, FICHIER_CUMULS), tableaux["cumuls"])
+        np.save(os.path.join(temporaire, FICHIER_INDEX), index)
+        with open(os.path.join(temporaire, FICHIER_MANIFESTE), "w") as f:
+            json.dump({
+                "format": FORMAT_SNAPSHOT,
+                "checksum": checksum,
+                "created_at": datetime.now().isoformat(),
+                "rows": len(lignes),
+                "series": len(index),
+                "columns": list(COLONNES_SNAPSHOT),
+                "cumulated_columns": list(COLONNES_CUMULEES),
+            }, f, indent=2)
+        os.replace(temporaire, os.path.join(racine, version))
+    except Exception:
+        shutil.rmtree(temporaire, ignore_errors=True)
+        raise
+
+    courant = os.path.join(racine, f".{FICHIER_COURANT}.tmp")
+    with open(courant, "w") as f:
+        f.write(version)
+    os.replace(courant, os.path.join(racine, FICHIER_COURANT))
+
+    # Les noms horodatés se trient chronologiquement
+    versions = sorted(nom for nom in os.listdir(racine)
+                      if not nom.startswith(".") and nom != FICHIER_COURANT)
+    for ancienne in versions[:-conserver]:
+        shutil.rmtree(os.path.join(racine, ancienne), ignore_errors=True)
+
+    config.log_info(f"Snapshot {version} exporté: {len(lignes)} lignes, "
+                    f"{len(index)} séries")
+    return version
@@ -0,0 +1,213 @@
+import asyncio
+import math
+import time
+from collections import deque
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+from config import config
+from metrics import metrics
+from startup import demarrage
+
+
+# Classe de priorité de chaque route. Seule la classe "prediction" passe par
+# le contrôle d'admission ; les routes absentes (référentiels, métriques,
+# administration) sont servies sans attente même quand les prédictions
+# sont saturées.
+CLASSES_ROUTES = {
+    "/predict": "prediction",
+    "/predict/batch": "prediction",
+    "/predict/stream": "prediction",
+}
+
+
+class AdmissionControl:
+    def __init__(self, max_en_cours, max_attente, delai_attente):
+        """
+        Au plus max_en_cours requêtes servies en même temps et max_attente
+        en file. File pleine : refus immédiat (429) ; attente plus longue
+        que delai_attente : refus (503). Utilisé uniquement depuis la
+        boucle asyncio, sans verrou.
+        """
+        self.max_en_cours = max_en_cours
+        self.max_attente = max_attente
+        self.delai_attente = delai_attente
+        self.en_cours = 0
+        self._file = deque()
+        # Durée moyenne (moyenne mobile exponentielle) pour Retry-After
+        self.duree_moyenne = 0.0
+        self.admises = 0
+        self.refus = {"queue_full": 0, "queue_timeout": 0}
+
+    @property
+    def en_attente(self):
+        return len(self._file)
+
+    async def entrer(self):
+        """Retourne None si la requête est admise, sinon le motif du refus."""
+        if self.en_cours < self.max_en_cours and not self._file:
+            self.en_cours += 1
+            self.admises += 1
+            return None
+        if len(self._file) >= self.max_attente:
+            self.refus["queue_full"] += 1
+            return "queue_full"
+
+        place = asyncio.get_running_loop().create_future()
+        self._file.append(place)
+        try:
+            await asyncio.wait_for(asyncio.shield(place), self.delai_attente)
+        except asyncio.TimeoutError:
+            # La place a pu être cédée juste avant l'expiration du délai
+            if not place.done():
+                place.cancel()
+                self._retirer(place)
+                self.refus["queue_timeout"] += 1
+                return "queue_timeout"
+        except BaseException:
+            # Client parti pendant l'attente : la place éventuelle est rendue
+            if place.done():
+                self.sortir()
+            else:
+                place.cancel()
+                self._retirer(place)
+            raise
+        self.admises += 1
+        return None
+
+    def _retirer(self, place):
+        try:
+            self._file.remove(place)
+        except ValueError:
+            pass
+
+    def sortir(self, duree=None):
+        """Libère une place, cédée à la plus ancienne requête en file."""
+        if duree is not None:
+            self.duree_moyenne = (duree if self.duree_moyenne == 0.0
+                                  else 0.8 * self.duree_moyenne + 0.2 * duree)
+        while self._file:
+            place = self._file.popleft()
+            if not place.done():
+                place.set_result(None)
+                return
+        self.en_cours -= 1
+
+    def retry_after(self):
+        """Secondes estimées avant qu'une place se libère."""
+        vagues = (len(self._file) + 1) / self.max_en_cours
+        return max(1, math.ceil(self.duree_moyenne * vagues))
+
+    def stats(self):
+        return {
+            "max_in_flight": self.max_en_cours,
+            "max_queue": self.max_attente,
+            "in_flight": self.en_cours,
+            "queued": len(self._file),
+            "admitted": self.admises,
+            "rejected": dict(self.refus),
+        }
+
+
+controles = {}
+if config.admission_max_in_flight > 0:
+    controles["prediction"] = AdmissionControl(
+        config.admission_max_in_flight, config.admission_max_queue,
+        config.admission_queue_timeout)
+
+# Routes servies pendant le démarrage : sondes et métriques
+ROUTES_DEMARRAGE = ("/health/live", "/health/ready", "/metrics")
+
+STATUTS_REFUS = {
+    "queue_full": (429, "Trop de requêtes de prédiction en attente, "
+                        "réessayez plus tard"),
+    "queue_timeout": (503, "Service de prédiction saturé, "
+                           "réessayez plus tard"),
+}
+
+
+def _route(scope):
+    for route in scope["app"].router.routes:
+        correspondance, scope_enfant = route.matches(scope)
+        if correspondance == Match.FULL:
+            return getattr(route, "path", None), scope_enfant
+    return None, {}
+
+
+class AdmissionMiddleware:
+    def __init__(self, app):
+        """
+        Middleware ASGI : contrôle d'admission par classe de priorité de la
+        route.
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not controles:
+            await self.app(scope, receive, send)
+            return
+
+        chemin, scope_enfant = _route(scope)
+        controle = controles.get(CLASSES_ROUTES.get(chemin))
+        if controle is None:
+            await self.app(scope, receive, send)
+            return
+
+        motif = await controle.entrer()
+        if motif is not None:
+            # Route renseignée comme le ferait le routeur, pour les métriques
+            scope.update(scope_enfant)
+            statut, detail = STATUTS_REFUS[motif]
+            reponse = JSONResponse(
+                {"detail": detail}, status_code=statut,
+                headers={"Retry-After": str(controle.retry_after())})
+            await reponse(scope, receive, send)
+            return
+
+        debut = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controle.sortir(time.perf_counter() - debut)
+
+
+class ReadinessMiddleware:
+    def __init__(self, app):
+        """
+        Middleware ASGI : 503 sur les autres routes tant que le démarrage
+        n'est pas terminé.
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or demarrage.pret or
+                scope["path"] in ROUTES_DEMARRAGE):
+            await self.app(scope, receive, send)
+            return
+
+        # Route renseignée comme le ferait le routeur, pour les métriques
+        scope.update(_route(scope)[1])
+        detail = ("Échec du démarrage de l'API" if demarrage.etat == "failed"
+                  else "API en cours de démarrage, réessayez plus tard")
+        reponse = JSONResponse({"detail": detail, "status": demarrage.etat},
+                               status_code=503, headers={"Retry-After": "5"})
+        await reponse(scope, receive, send)
+
+
+@metrics.collecteur
+def collecter_admission():
+    stats = {classe: controle.stats()
+             for classe, controle in controles.items()}
+    return [
+        ("admission_in_flight", "gauge",
+         "Requêtes admises en cours de traitement",
+         [({"class": classe}, s["in_flight"]) for classe, s in stats.items()]),
+        ("admission_queued", "gauge", "Requêtes en file d'attente d'admission",
+         [({"class": classe}, s["queued"]) for classe, s in stats.items()]),
+        ("admission_admitted_total", "counter", "Requêtes admises",
+         [({"class": classe}, s["admitted"]) for classe, s in stats.items()]),
+        ("admission_rejected_total", "counter",
+         "Requêtes refusées par le contrôle d'admission",
+         [({"class": classe, "reason": motif}, n)
+          for classe, s in stats.items()
+          for motif, n in s["rejected"].items()]),
+    ]
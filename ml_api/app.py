@@ -1,49 +1,354 @@
-from fastapi import FastAPI, Query
-from predict import predict_pandemic
-from sqlalchemy import create_engine, Table, MetaData, select
+# Importé en premier : la durée de l'import des autres modules est mesurée
+from startup import demarrage
+import hmac
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+from admission import AdmissionMiddleware, ReadinessMiddleware
+from predict import (FIELD_TITLES, calculer_prediction,
+                     calculer_prediction_batch, inference_synthetique,
+                     preparer_prediction_async)
 from config import config
+from database import db
+from inference_pool import inference_pool
+from metrics import MetricsMiddleware, etape, metrics
+from model_registry import registry
+from reference_cache import reference_cache
+from prediction_cache import prediction_cache
+from profiling import echantillonner, profiler
+from streaming import generer_flux, preparer_flux
+from response_formats import (FORMATS, ResultatPrediction,
+                              negocier_encodage, negocier_format)
 
-app = FastAPI(title="Pandemic Prediction API")
+
+demarrage.noter("import", demarrage.ecoule)
+
+
+def etapes_demarrage():
+    """Étapes du démarrage, dans l'ordre, chacune chronométrée."""
+    def charger_modeles():
+        if config.models_warmup:
+            registry.warm_up()
+        registry.demarrer_surveillance(config.models_watch_interval)
+
+    etapes = [
+        # Pool de connexions et réflexion des tables, une seule fois
+        ("db_connect", db.connect),
+        ("reference_cache", reference_cache.load),
+        ("models", charger_modeles),
+    ]
+    if config.models_warmup:
+        etapes.append(("warmup_inference", inference_synthetique))
+    etapes.append(("inference_pool", inference_pool.demarrer))
+    return etapes
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if config.startup_background:
+        # Port ouvert tout de suite, /health/ready suit l'avancement
+        demarrage.lancer(etapes_demarrage())
+    else:
+        await demarrage.executer(etapes_demarrage())
+    yield
+    await demarrage.arreter()
+    inference_pool.arreter()
+    registry.arreter_surveillance()
+    await db.dispose_async()
+    db.dispose()
+
+
+app = FastAPI(title="Pandemic Prediction API", lifespan=lifespan)
+# Le dernier ajouté est le plus externe : les refus d'admission et de
+# démarrage sont comptés
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(ReadinessMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+
+def reponse_json(contenu):
+    """Sérialise la réponse ici plutôt que dans FastAPI, pour la mesurer."""
+    with etape("serialization"):
+        return JSONResponse(contenu)
 
 
 @app.get("/predict")
-def get_prediction(
+async def get_prediction(
     country: str = Query(..., description="Nom du pays"),
     virus: str = Query(..., description="Nom du virus"),
     date_start: str = Query(...,
                             description="Date de début au format YYYY-MM-DD"),
-    date_end: str = Query(..., description="Date de fin au format YYYY-MM-DD")
+    date_end: str = Query(..., description="Date de fin au format YYYY-MM-DD"),
+    format_reponse: Optional[str] = Query(
+        None, alias="format",
+        description="json (défaut), columnar ou msgpack"),
+    profile: bool = Query(
+        False, description="Profiler la requête (administration)"),
+    accept: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    x_profile: Optional[str] = Header(None),
+    x_admin_token: Optional[str] = Header(None)
 ):
     """
     Endpoint principal pour obtenir les prédictions.
+    Le format suit le paramètre format ou l'en-tête Accept (JSON historique
+    par défaut) ; la réponse est compressée en br ou gzip si le client
+    l'accepte. Les lectures en base passent par asyncpg et le calcul par le
+    pool de processus d'inférence.
+    """
+    try:
+        format_reponse = negocier_format(format_reponse, accept)
+    except ValueError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+
+    explicite = profile or x_profile not in (None, "", "0", "false")
+    if explicite and not jeton_admin_valide(x_admin_token):
+        raise HTTPException(status_code=403, detail="Accès refusé")
+
+    # Peut interroger Migration_Status : hors de la boucle asyncio
+    key = await run_in_threadpool(cle_prediction, country, virus,
+                                  date_start, date_end)
+
+    async def calculer():
+        ctx = await preparer_prediction_async(country, virus,
+                                              date_start, date_end)
+        return ResultatPrediction(ctx, await inference_pool.executer(ctx))
+
+    def calculer_profile():
+        # Profil de tout le calcul dans un seul thread, modèles compris
+        return profiler(
+            lambda: ResultatPrediction(
+                *calculer_prediction(country, virus, date_start, date_end)),
+            country, virus, date_start, date_end)
+
+    async def calculer_echantillon():
+        if echantillonner():
+            return (await run_in_threadpool(calculer_profile))[0]
+        return await calculer()
+
+    headers = {}
+    if explicite:
+        # Profil demandé : on recalcule même si la réponse est en cache
+        result, fichier_profil = await run_in_threadpool(calculer_profile)
+        prediction_cache.set(key, result)
+        if fichier_profil:
+            headers["X-Profile-File"] = fichier_profil
+    else:
+        result = await prediction_cache.get_or_compute_async(
+            key, calculer_echantillon)
+
+    # Sérialisation et compression hors de la boucle asyncio
+    return await run_in_threadpool(
+        reponse_prediction, result, format_reponse, accept_encoding, headers)
+
+
+def reponse_prediction(resultat, format_reponse, accept_encoding, headers):
+    """Corps encodé (et compressé si possible) d'un ResultatPrediction."""
+    with etape("serialization"):
+        corps, encodage = resultat.corps(
+            format_reponse, negocier_encodage(accept_encoding))
+        if encodage:
+            headers["Content-Encoding"] = encodage
+    headers["Vary"] = "Accept, Accept-Encoding"
+    return Response(corps, media_type=FORMATS[format_reponse], headers=headers)
+
+
+@app.get("/predict/stream")
+def get_prediction_stream(
+    country: str = Query(..., description="Nom du pays"),
+    virus: str = Query(..., description="Nom du virus"),
+    date_start: str = Query(...,
+                            description="Date de début au format YYYY-MM-DD"),
+    date_end: str = Query(..., description="Date de fin au format YYYY-MM-DD")
+):
+    """
+    Prédictions envoyées en NDJSON par blocs de STREAM_CHUNK_DAYS points,
+    avec une mémoire constante quelle que soit la période (limitée à
+    PREDICT_MAX_HORIZON_DAYS jours).
     """
-    result = predict_pandemic(country, virus, date_start, date_end)
-    return result
+    try:
+        ctx = preparer_flux(country, virus, date_start, date_end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(generer_flux(ctx, config.stream_chunk_days),
+                             media_type="application/x-ndjson")
+
+
+@app.get("/field-titles")
+def get_field_titles():
+    """
+    Libellés des champs, absents des réponses au format columnar et msgpack.
+    """
+    return FIELD_TITLES
+
+
+class PredictionItem(BaseModel):
+    country: str = Field(..., description="Nom du pays")
+    virus: str = Field(..., description="Nom du virus")
+    date_start: str = Field(...,
+                            description="Date de début au format YYYY-MM-DD")
+    date_end: str = Field(..., description="Date de fin au format YYYY-MM-DD")
+
+
+class BatchPredictionRequest(BaseModel):
+    items: List[PredictionItem]
+
+
+@app.post("/predict/batch")
+def get_batch_prediction(body: BatchPredictionRequest):
+    """
+    Prédictions pour plusieurs couples pays/virus en un seul appel.
+    Les résultats sont renvoyés dans l'ordre des éléments demandés.
+    """
+    if len(body.items) > config.predict_batch_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=("Trop d'éléments dans le lot "
+                    f"(maximum {config.predict_batch_max_items})"))
+
+    items = [item.model_dump() for item in body.items]
+    keys = [cle_prediction(**item) for item in items]
+    results = [prediction_cache.get(key) for key in keys]
+
+    # Seuls les éléments absents du cache sont calculés, en un seul lot
+    a_calculer = [i for i, result in enumerate(results) if result is None]
+    if a_calculer:
+        calcules = calculer_prediction_batch([items[i] for i in a_calculer])
+        for i, result in zip(a_calculer, calcules):
+            if isinstance(result, dict):
+                # Élément en erreur : renvoyé tel quel, jamais mis en cache
+                results[i] = result
+                continue
+            results[i] = ResultatPrediction(*result)
+            prediction_cache.set(keys[i], results[i])
+
+    with etape("assembly"):
+        results = [result if isinstance(result, dict) else result.legacy()
+                   for result in results]
+    return reponse_json({"results": results})
+
+
+def cle_prediction(country, virus, date_start, date_end):
+    # La version des modèles et celle de la dernière migration font partie de
+    # la clé : un ré-entraînement ou une nouvelle migration invalide le cache
+    reference_cache.refresh_if_stale()
+    return (country, virus, date_start, date_end,
+            registry.version, reference_cache.version)
+
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    """
+    Retourne les compteurs du cache de prédictions.
+    """
+    return {"model_version": registry.version,
+            "prediction_cache": prediction_cache.stats()}
+
+
+@app.get("/health/live")
+def get_health_live():
+    """
+    Le processus répond : 200 dès l'ouverture du port, 503 si le démarrage
+    a échoué (le conteneur doit être relancé).
+    """
+    stats = demarrage.stats()
+    if stats["status"] == "failed":
+        return JSONResponse(stats, status_code=503)
+    return {"status": "alive", "uptime_seconds": stats["uptime_seconds"]}
+
+
+@app.get("/health/ready")
+def get_health_ready():
+    """
+    Prêt à servir : 200 une fois modèles, inférence de préchauffage et pool
+    prêts, 503 avant. Retourne l'étape en cours et la durée de chacune.
+    """
+    stats = demarrage.stats()
+    return JSONResponse(stats, status_code=200 if demarrage.pret else 503)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Métriques au format texte Prometheus : durée par étape et par modèle,
+    requêtes par statut, pool de connexions, caches et modèles.
+    """
+    return Response(metrics.render(),
+                    media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/models")
+def get_models():
+    """
+    Retourne, pour chaque modèle, s'il est chargé, son temps de chargement
+    et sa taille en mémoire.
+    """
+    return registry.stats()
+
+
+@app.post("/admin/models/reload", status_code=202)
+def reload_models(x_admin_token: Optional[str] = Header(None)):
+    """
+    Charge en arrière-plan la version de modèles pointée par models/CURRENT.
+    L'ancienne version continue de servir jusqu'à ce que la nouvelle soit
+    prête.
+    """
+    if not jeton_admin_valide(x_admin_token):
+        raise HTTPException(status_code=403, detail="Accès refusé")
+    return registry.reload()
+
+
+def jeton_admin_valide(jeton):
+    """Refuse tout accès tant que ADMIN_TOKEN n'est pas défini."""
+    if not config.admin_token or not jeton:
+        return False
+    return hmac.compare_digest(jeton.encode("utf-8"),
+                               config.admin_token.encode("utf-8"))
+
+
+def etag_correspond(if_none_match, etag):
+    """
+    Vrai si l'en-tête If-None-Match désigne etag : liste séparée par des
+    virgules, comparaison faible (préfixe W/ ignoré) et « * » accepté.
+    """
+    if not if_none_match:
+        return False
+    for candidat in if_none_match.split(","):
+        candidat = candidat.strip()
+        if candidat == "*":
+            return True
+        if candidat.startswith("W/"):
+            candidat = candidat[2:]
+        if candidat == etag:
+            return True
+    return False
+
+
+def reponse_referentiel(request, response, cle, valeurs, etag):
+    """Répond 304 sans corps si le client possède déjà cette version."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_correspond(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return {cle: valeurs}
 
 
 @app.get("/countries")
-def get_countries():
+def get_countries(request: Request, response: Response):
     """
     Retourne la liste des pays disponibles.
     """
-    engine = create_engine(config.get_database_url())
-    meta = MetaData()
-    pays = Table('Pays', meta, autoload_with=engine)
-    with engine.connect() as conn:
-        result = conn.execute(select(pays.c.nom_pays)).fetchall()
-        countries = [row[0] for row in result]
-    return {"countries": countries}
+    countries, etag = reference_cache.countries()
+    return reponse_referentiel(request, response, "countries", countries, etag)
 
 
 @app.get("/viruses")
-def get_viruses():
+def get_viruses(request: Request, response: Response):
     """
     Retourne la liste des virus disponibles.
     """
-    engine = create_engine(config.get_database_url())
-    meta = MetaData()
-    virus = Table('Virus', meta, autoload_with=engine)
-    with engine.connect() as conn:
-        result = conn.execute(select(virus.c.nom_virus)).fetchall()
-        viruses = [row[0] for row in result]
-    return {"viruses": viruses}
+    viruses, etag = reference_cache.viruses()
+    return reponse_referentiel(request, response, "viruses", viruses, etag)
@@ -0,0 +1,347 @@
+import argparse
+import gc
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Aucune base : une URL SQLite en mémoire satisfait la configuration et
+# n'est jamais ouverte par les étapes mesurées
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+import joblib  # noqa: E402
+import numpy as np  # noqa: E402
+import sklearn  # noqa: E402
+from sklearn.base import clone  # noqa: E402
+from load_test import (DOSSIER_RAPPORTS, PREMIERE_DATE,  # noqa: E402
+                       commit_courant, generer_virus)
+from model_comparison import ModelComparison  # noqa: E402
+from model_registry import (FICHIERS_MODELES, GROUPES,  # noqa: E402
+                            creer_version, lire_courant, publier_version,
+                            registry)
+from predict import (SERIES_OFFICIELLES, annee_et_jour,  # noqa: E402
+                     calculer_series, donnees_officielles,
+                     executer_modeles, filtrer_dates_a_predire)
+from series_cache import COLONNES_SERIE, SerieOfficielle  # noqa: E402
+from smoothing import lisser_fusion, moyenne_glissante  # noqa: E402
+
+
+# Micro-benchmarks des étapes de /predict sur des modèles et des données
+# de test, sans base : les fonctions mesurées sont celles appelées par
+# l'API. Un rapport JSON par exécution dans benchmark/, à comparer d'un
+# commit à l'autre.
+
+LIGNES_PAR_DEFAUT = (1, 30, 365, 3650)
+# Algorithme de ModelComparison utilisé pour chaque modèle de test,
+# proche de ce que l'entraînement retient en production
+ALGORITHMES = {
+    "new_cases": "Random Forest",
+    "new_deaths": "Gradient Boosting",
+    "infection_rate": "Decision Tree",
+    "mortality_rate": "Linear Regression",
+    "total_cases": "Random Forest",
+    "total_deaths": "Gradient Boosting",
+    "peak_date": "Random Forest",
+    "estimated_duration": "Random Forest",
+    "cases_in_30d": "Decision Tree",
+    "deaths_in_30d": "Gradient Boosting",
+    "geographic_spread": "Linear Regression",
+    "new_countries_next_week": "MLP",
+}
+N_PAYS = 8
+N_VIRUS = 2
+JOURS = 3 * 365 + 1
+
+
+def donnees_test(graine):
+    """
+    Séries synthétiques (comme load_test.py) :
+    {id_virus: {colonne: (pays, jours)}}.
+    """
+    rng = np.random.default_rng(graine)
+    populations = rng.integers(500_000, 80_000_000, N_PAYS)
+    return {id_virus: generer_virus(rng, populations, JOURS)
+            for id_virus in range(1, N_VIRUS + 1)}
+
+
+def jeux_entrainement(series):
+    """(X, {modèle: y}) pour chaque vecteur de features de predict.py."""
+    dates = np.datetime64(PREMIERE_DATE, "D") + np.arange(JOURS)
+    annees, jours = annee_et_jour(dates)
+    semaines = (jours - 1) // 7 + 1
+    X4, X2, X3 = [], [], []
+    cibles4 = {}
+    cibles2 = {"geographic_spread": []}
+    cibles3 = {"new_countries_next_week": []}
+    for id_virus, colonnes in series.items():
+        cas, deces = colonnes["nouveaux_cas"], colonnes["nouveaux_deces"]
+        cumul_cas = np.concatenate(
+            [np.zeros((N_PAYS, 1)), np.cumsum(cas, axis=1)], axis=1)
+        cumul_deces = np.concatenate(
+            [np.zeros((N_PAYS, 1)), np.cumsum(deces, axis=1)], axis=1)
+        fin_30 = np.minimum(np.arange(JOURS) + 31, JOURS)
+        for pays in range(N_PAYS):
+            X4.append(np.column_stack([np.full(JOURS, pays + 1),
+                                       np.full(JOURS, id_virus),
+                                       annees, jours]))
+            # Pic et durée de la vague de chaque année
+            pic, duree = np.empty(JOURS), np.empty(JOURS)
+            for annee in np.unique(annees):
+                masque = annees == annee
+                pic[masque] = jours[masque][np.argmax(cas[pays, masque])]
+                duree[masque] = np.sum(
+                    cas[pays, masque] > cas[pays, masque].mean())
+            for modele, valeurs in (
+                    ("new_cases", cas[pays]), ("new_deaths", deces[pays]),
+                    ("total_cases", colonnes["total_cas"][pays]),
+                    ("total_deaths", colonnes["total_deces"][pays]),
+                    ("infection_rate", colonnes["taux_infection"][pays]),
+                    ("mortality_rate", colonnes["taux_mortalite"][pays]),
+                    ("peak_date", pic), ("estimated_duration", duree),
+                    ("cases_in_30d",
+                     cumul_cas[pays, fin_30] - cumul_cas[pays, 1:]),
+                    ("deaths_in_30d",
+                     cumul_deces[pays, fin_30] - cumul_deces[pays, 1:])):
+                cibles4.setdefault(modele, []).append(valeurs)
+        for annee in np.unique(annees):
+            masque = annees == annee
+            X2.append([id_virus, annee])
+            cibles2["geographic_spread"].append(
+                int(np.sum(cas[:, masque].sum(axis=1) > 0)))
+            for semaine in np.unique(semaines[masque]):
+                jours_semaine = masque & (semaines == semaine)
+                X3.append([id_virus, annee, semaine])
+                touches = cas[:, jours_semaine].sum(axis=1) > cas.mean() * 7
+                cibles3["new_countries_next_week"].append(
+                    int(np.sum(touches)))
+    return [
+        (np.concatenate(X4),
+         {nom: np.concatenate(y) for nom, y in cibles4.items()}),
+        (np.array(X2), {nom: np.array(y) for nom, y in cibles2.items()}),
+        (np.array(X3), {nom: np.array(y) for nom, y in cibles3.items()}),
+    ]
+
+
+def preparer_modeles(racine, series):
+    """
+    Entraîne les modèles de test et les publie comme une version de
+    models/ dans racine. Une racine qui a déjà une version est réutilisée.
+    """
+    if lire_courant(racine):
+        return lire_courant(racine)
+    debut = time.perf_counter()
+    os.makedirs(racine, exist_ok=True)
+    dossier, version = creer_version(racine)
+    algorithmes = ModelComparison().algorithms
+    for X, cibles in jeux_entrainement(series):
+        for nom, y in cibles.items():
+            modele = clone(algorithmes[ALGORITHMES[nom]]).fit(X, y)
+            joblib.dump(modele, os.path.join(dossier, FICHIERS_MODELES[nom]))
+    publier_version(racine, version)
+    print(f"🧪 Modèles de test entraînés en {time.perf_counter() - debut:.1f}s")
+    return version
+
+
+def chronometrer(fonction, repetitions, duree_min):
+    """
+    Temps par appel en secondes : boucles calibrées pour durer au moins
+    duree_min, répétées, ramasse-miettes suspendu comme dans timeit.
+    """
+    fonction()
+    boucles = 1
+    while True:
+        ecoule = _boucle(fonction, boucles)
+        if ecoule >= duree_min:
+            break
+        boucles = max(boucles * 2,
+                      int(boucles * duree_min / max(ecoule, 1e-9)))
+    temps = [ecoule / boucles] + [_boucle(fonction, boucles) / boucles
+                                  for _ in range(repetitions - 1)]
+    return boucles, temps
+
+
+def _boucle(fonction, boucles):
+    actif = gc.isenabled()
+    gc.disable()
+    try:
+        debut = time.perf_counter()
+        for _ in range(boucles):
+            fonction()
+        return time.perf_counter() - debut
+    finally:
+        if actif:
+            gc.enable()
+
+
+def serie_officielle(series):
+    """Série officielle du premier pays pour le virus 1, comme en cache."""
+    dates = np.datetime64(PREMIERE_DATE, "D") + np.arange(JOURS)
+    return SerieOfficielle(dates, {colonne: series[1][colonne][0].copy()
+                                   for colonne in COLONNES_SERIE})
+
+
+def etapes(series, lignes):
+    """
+    (étape, fonction) mesurées pour n lignes, données préparées hors mesure.
+    """
+    modeles = registry.courant
+    serie = serie_officielle(series)
+    derniere = serie.dates[-1]
+    # Fenêtre de lignes points : trois quarts officiels, le reste prédit
+    # comme dans la vue par défaut du tableau de bord
+    n_pred = lignes // 4
+    debut = derniere - (lignes - n_pred) + 1
+    ctx = {
+        "country_id": 1,
+        "virus_id": 1,
+        "d_start": datetime.fromisoformat(str(debut)),
+        "d_end": datetime.fromisoformat(str(debut + lignes - 1)),
+        "dates": debut + np.arange(lignes),
+    }
+    donnees_officielles(ctx, serie)
+    [(predictions, scalaires)] = executer_modeles([ctx])
+    officielles = np.stack([ctx["officielles"][nom]
+                            for nom in SERIES_OFFICIELLES])
+    predites = np.stack([predictions.get(colonne, np.empty(0))
+                         for colonne in SERIES_OFFICIELLES.values()])
+    # La moitié des dates demandées est postérieure à la dernière date en base
+    demandees = derniere - lignes // 2 + np.arange(lignes)
+
+    # Features des modèles : lignes dates futures
+    dates = derniere + 1 + np.arange(lignes)
+    X4 = np.column_stack([np.ones(lignes, dtype=np.int64),
+                          np.ones(lignes, dtype=np.int64),
+                          *annee_et_jour(dates)])
+    X2 = X4[:, [1, 2]]
+    X3 = np.column_stack([X4[:, 1], X4[:, 2], (X4[:, 3] - 1) // 7 + 1])
+    features = {nom: X4 for groupe in GROUPES.values()
+                for nom in groupe.values()}
+    features.update(geographic_spread=X2, new_countries_next_week=X3)
+
+    mesures = [
+        # Tranches de la série en cache, sans la requête SQL
+        ("donnees_officielles",
+         lambda: donnees_officielles(dict(ctx), serie)),
+        # get_dates_to_predict sans sa requête SQL de dernière date
+        ("get_dates_to_predict",
+         lambda: filtrer_dates_a_predire(demandees, derniere.item())),
+        ("executer_modeles", lambda: executer_modeles([ctx])),
+        ("calculer_series",
+         lambda: calculer_series(ctx, predictions, scalaires)),
+        # Lissage seul, quatre séries à la fois
+        ("smoothing.lisser_fusion",
+         lambda: lisser_fusion(officielles, predites, window_size=200,
+                               sommes_off=ctx["cumuls_officiels"])),
+        ("smoothing.moyenne_glissante",
+         lambda: moyenne_glissante(officielles,
+                                   sommes=ctx["cumuls_officiels"])),
+    ]
+    for groupe in GROUPES:
+        mesures.append((f"group.{groupe}",
+                        lambda groupe=groupe:
+                        modeles.group(groupe).predict(X4)))
+    for nom in FICHIERS_MODELES:
+        modele = modeles.model(nom)
+        mesures.append((f"model.{nom}",
+                        lambda modele=modele, X=features[nom]:
+                        modele.predict(X)))
+    return mesures
+
+
+def comparer(rapport, fichier_reference):
+    """
+    Affiche l'évolution du meilleur temps de chaque étape par rapport à un
+    rapport précédent.
+    """
+    with open(fichier_reference) as f:
+        reference = json.load(f)
+    print(f"\nComparaison avec {reference.get('commit')} "
+          f"({fichier_reference}) :")
+    for etape, resultats in rapport["stages"].items():
+        anciens = reference.get("stages", {}).get(etape, {})
+        evolutions = []
+        for lignes, resultat in resultats.items():
+            if lignes in anciens:
+                ecart = resultat["best_us"] / anciens[lignes]["best_us"] - 1
+                evolutions.append(f"{lignes}: {ecart * 100:+.0f}%")
+        if evolutions:
+            print(f"  {etape:40s} " + ", ".join(evolutions))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmarks des étapes de /predict")
+    parser.add_argument("--rows",
+                        default=",".join(map(str, LIGNES_PAR_DEFAUT)),
+                        help="nombres de lignes mesurés, séparés par des "
+                             "virgules")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="répétitions par mesure")
+    parser.add_argument("--min-time", type=float, default=0.05,
+                        help="durée minimale d'une répétition (s)")
+    parser.add_argument("--stages",
+                        help="ne mesure que les étapes contenant ce texte")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--models-dir",
+                        help="modèles de test à réutiliser ou créer "
+                             "(défaut : dossier temporaire)")
+    parser.add_argument("--output",
+                        help="rapport JSON (défaut "
+                             "benchmark/predict_stages_<commit>_<date>.json)")
+    parser.add_argument("--compare", help="rapport précédent à comparer")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    series = donnees_test(args.seed)
+    racine = args.models_dir or tempfile.mkdtemp(prefix="benchmark-models-")
+    try:
+        registry.racine = racine
+        version = preparer_modeles(racine, series)
+        rapport = {
+            "format": 1,
+            "commit": commit_courant(),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "sklearn": sklearn.__version__,
+            "cpu_count": os.cpu_count(),
+            "models": {nom: ALGORITHMES[nom] for nom in FICHIERS_MODELES},
+            "models_version": version,
+            "stages": {},
+        }
+        for lignes in (int(n) for n in args.rows.split(",")):
+            for etape, fonction in etapes(series, lignes):
+                if args.stages and args.stages not in etape:
+                    continue
+                boucles, temps = chronometrer(fonction, args.repeat,
+                                              args.min_time)
+                rapport["stages"].setdefault(etape, {})[str(lignes)] = {
+                    "loops": boucles,
+                    "best_us": round(min(temps) * 1e6, 3),
+                    "median_us": round(statistics.median(temps) * 1e6, 3),
+                    "per_row_ns": round(min(temps) * 1e9 / lignes, 1),
+                }
+                print(f"  {etape:40s} {lignes:>5} lignes  "
+                      f"{min(temps) * 1e6:12.1f} µs")
+    finally:
+        if not args.models_dir:
+            shutil.rmtree(racine, ignore_errors=True)
+
+    sortie = args.output or os.path.join(
+        DOSSIER_RAPPORTS, f"predict_stages_{rapport['commit'] or 'local'}_"
+                          f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(sortie, "w") as f:
+        json.dump(rapport, f, indent=2)
+    print(f"📄 Rapport: {sortie}")
+    if args.compare:
+        comparer(rapport, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,16 @@ class Config:
         load_dotenv()
 
         database_url = os.getenv('DATABASE_URL')
+        # Base SQLite locale (banc de charge load_test.py) : ni serveur ni
+        # identifiants
+        self.sqlite_url = None
 
-        if database_url:
+        if database_url and database_url.startswith('sqlite'):
+            self.sqlite_url = database_url
+            self.db_host = self.db_port = None
+            self.db_user = self.db_password = None
+            self.db_name = database_url
+        elif database_url:
             self._parse_database_url(database_url)
         else:
             self.db_host = os.getenv('DB_HOST', 'localhost')
@@ -17,6 +25,91 @@ class Config:
             self.db_name = os.getenv('DB_NAME')
             self.db_user = os.getenv('DB_USER')
             self.db_password = os.getenv('DB_PASSWORD')
+
+        # Paramètres du pool de connexions partagé
+        self.db_pool_size = int(os.getenv('DB_POOL_SIZE', '5'))
+        self.db_max_overflow = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+        self.db_pool_timeout = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+        self.db_pool_recycle = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+
+        # Intervalle minimal entre deux vérifications de Migration_Status
+        self.reference_cache_poll_interval = float(
+            os.getenv('REFERENCE_CACHE_POLL_SECONDS', '30'))
+
+        # Cache des réponses de /predict
+        self.prediction_cache_size = int(
+            os.getenv('PREDICTION_CACHE_SIZE', '256'))
+        self.prediction_cache_ttl = float(
+            os.getenv('PREDICTION_CACHE_TTL', '600'))
+
+        # Séries officielles en mémoire : taille maximale en octets et TTL
+        self.series_cache_max_bytes = int(
+            os.getenv('SERIES_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+        self.series_cache_ttl = float(os.getenv('SERIES_CACHE_TTL', '600'))
+
+        # Snapshot des statistiques exporté par la migration (vide :
+        # désactivé)
+        self.stats_snapshot_dir = os.getenv('STATS_SNAPSHOT_DIR', '')
+
+        # Nombre maximal d'éléments acceptés par /predict/batch
+        self.predict_batch_max_items = int(
+            os.getenv('PREDICT_BATCH_MAX_ITEMS', '50'))
+
+        # /predict/stream : période maximale et nombre de jours par bloc
+        self.predict_max_horizon_days = int(
+            os.getenv('PREDICT_MAX_HORIZON_DAYS', '3650'))
+        self.stream_chunk_days = int(os.getenv('STREAM_CHUNK_DAYS', '90'))
+
+        # Processus dédiés à l'inférence de /predict (0 = dans le processus
+        # principal) et nombre de calculs soumis en même temps (0 = un par
+        # processus) ; les requêtes suivantes attendent leur tour
+        self.inference_workers = int(os.getenv('INFERENCE_WORKERS', '2'))
+        self.inference_max_concurrency = int(
+            os.getenv('INFERENCE_MAX_CONCURRENCY', '0'))
+
+        # Contrôle d'admission de /predict* : requêtes servies en même temps
+        # (0 = désactivé), taille de la file et attente maximale en file
+        self.admission_max_in_flight = int(
+            os.getenv('ADMISSION_MAX_IN_FLIGHT', '16'))
+        self.admission_max_queue = int(os.getenv('ADMISSION_MAX_QUEUE', '32'))
+        self.admission_queue_timeout = float(
+            os.getenv('ADMISSION_QUEUE_TIMEOUT_SECONDS', '5'))
+
+        # Job materialize_predictions.py : jours prédits après la dernière
+        # date officielle de chaque couple, processus de calcul et période
+        # entre deux exécutions (0 : une seule exécution)
+        self.materialize_horizon_days = int(
+            os.getenv('MATERIALIZE_HORIZON_DAYS', '180'))
+        self.materialize_workers = int(os.getenv('MATERIALIZE_WORKERS', '2'))
+        self.materialize_interval = float(
+            os.getenv('MATERIALIZE_INTERVAL_SECONDS', '0'))
+
+        # Dossier des modèles et préchargement au démarrage
+        self.models_dir = os.getenv('MODELS_DIR', 'models')
+        self.models_warmup = os.getenv(
+            'MODELS_WARMUP', 'true').lower() in ('1', 'true', 'yes')
+        # Démarrage en arrière-plan : le port est ouvert tout de suite et
+        # /health/ready passe à 200 une fois modèles et pool prêts
+        self.startup_background = os.getenv(
+            'STARTUP_BACKGROUND', 'false').lower() in ('1', 'true', 'yes')
+        # Surveillance de models/CURRENT (0 = désactivée)
+        self.models_watch_interval = float(
+            os.getenv('MODELS_WATCH_SECONDS', '0'))
+        # Fenêtre d'années du tenseur de prédictions construit après
+        # l'entraînement (0 = pas de tenseur)
+        self.prediction_tensor_first_year = int(
+            os.getenv('PREDICTION_TENSOR_FIRST_YEAR', '0'))
+        self.prediction_tensor_last_year = int(
+            os.getenv('PREDICTION_TENSOR_LAST_YEAR', '0'))
+        # Jeton des endpoints d'administration (désactivés si vide)
+        self.admin_token = os.getenv('ADMIN_TOKEN')
+
+        # Profilage de /predict : fraction de requêtes profilées d'office,
+        # dossier des profils et nombre de fichiers conservés
+        self.profile_sample_rate = float(
+            os.getenv('PROFILE_SAMPLE_RATE', '0'))
+        self.profile_dir = os.getenv('PROFILE_DIR', 'profiles')
+        self.profile_max_files = int(os.getenv('PROFILE_MAX_FILES', '100'))
         self._valider_config()
 
     def _parse_database_url(self, database_url):
@@ -33,6 +126,8 @@ class Config:
             raise ValueError(f"DATABASE_URL invalide: {database_url}")
 
     def _valider_config(self):
+        if self.sqlite_url:
+            return
         params_obligatoires = {
             'DB_NAME': self.db_name,
             'DB_USER': self.db_user,
@@ -46,8 +141,19 @@ class Config:
             )
 
     def get_database_url(self):
+        if self.sqlite_url:
+            return self.sqlite_url
         password = quote_plus(self.db_password)
         return f"postgresql://{self.db_user}:{password}@{self.db_host}:{self.db_port}/{self.db_name}?client_encoding=utf8"
 
+    def get_async_database_url(self):
+        if self.sqlite_url:
+            # Pilote aiosqlite pour le moteur async
+            return self.sqlite_url.replace('sqlite', 'sqlite+aiosqlite', 1)
+        # asyncpg échange toujours en UTF-8 : pas de client_encoding
+        password = quote_plus(self.db_password)
+        return (f"postgresql+asyncpg://{self.db_user}:{password}"
+                f"@{self.db_host}:{self.db_port}/{self.db_name}")
+
 
 config = Config()
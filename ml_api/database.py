@@ -0,0 +1,111 @@
+from sqlalchemy import create_engine, MetaData, inspect
+from sqlalchemy.ext.asyncio import create_async_engine
+from config import config
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+TABLES_REFLECHIES = ("Pays", "Virus", "Statistiques_Journalieres")
+# Créées par csv_to_postgres (et les migrations Prisma pour
+# Predictions_Journalieres et Predictions_Etats) : absentes tant qu'aucune
+# migration n'a tourné
+TABLES_OPTIONNELLES = ("Migration_Status", "Predictions_Journalieres",
+                       "Predictions_Etats")
+
+
+class Database:
+    def __init__(self):
+        """Couche d'accès partagée : un seul pool de connexions et des tables
+        réfléchies une seule fois pour toute la durée de vie du processus."""
+        self.engine = None
+        self.engine_async = None
+        self.tables = {}
+
+    def connect(self):
+        """Crée le pool et réfléchit les tables (idempotent)."""
+        if self.engine is not None:
+            return
+        engine = create_engine(
+            config.get_database_url(),
+            pool_size=config.db_pool_size,
+            max_overflow=config.db_max_overflow,
+            pool_timeout=config.db_pool_timeout,
+            pool_recycle=config.db_pool_recycle,
+            pool_pre_ping=True,
+        )
+        meta = MetaData()
+        inspecteur = inspect(engine)
+        optionnelles = [nom for nom in TABLES_OPTIONNELLES
+                        if inspecteur.has_table(nom)]
+        meta.reflect(bind=engine,
+                     only=list(TABLES_REFLECHIES) + optionnelles)
+        self.tables = {nom: meta.tables[nom]
+                       for nom in list(TABLES_REFLECHIES) + optionnelles}
+        self.engine = engine
+        # Pool asyncpg pour les endpoints async, mêmes tables réfléchies
+        self.engine_async = create_async_engine(
+            config.get_async_database_url(),
+            pool_size=config.db_pool_size,
+            max_overflow=config.db_max_overflow,
+            pool_timeout=config.db_pool_timeout,
+            pool_recycle=config.db_pool_recycle,
+            pool_pre_ping=True,
+        )
+        logger.info("Pool de connexions initialisé et tables réfléchies")
+
+    def dispose(self):
+        """Ferme toutes les connexions du pool."""
+        if self.engine is not None:
+            self.engine.dispose()
+            self.engine = None
+            self.tables = {}
+            logger.info("Pool de connexions fermé")
+
+    async def dispose_async(self):
+        """Ferme les connexions du pool async (avant dispose)."""
+        if self.engine_async is not None:
+            await self.engine_async.dispose()
+            self.engine_async = None
+
+    def table(self, nom):
+        self.connect()
+        return self.tables[nom]
+
+    def connection(self):
+        self.connect()
+        return self.engine.connect()
+
+    def connection_async(self):
+        self.connect()
+        return self.engine_async.connect()
+
+    @property
+    def pays(self):
+        return self.table("Pays")
+
+    @property
+    def virus(self):
+        return self.table("Virus")
+
+    @property
+    def stats(self):
+        return self.table("Statistiques_Journalieres")
+
+    @property
+    def migration_status(self):
+        self.connect()
+        return self.tables.get("Migration_Status")
+
+    @property
+    def predictions(self):
+        self.connect()
+        return self.tables.get("Predictions_Journalieres")
+
+    @property
+    def predictions_etats(self):
+        self.connect()
+        return self.tables.get("Predictions_Etats")
+
+
+db = Database()
@@ -0,0 +1,109 @@
+import json
+import os
+import numpy as np
+from tree_inference import (LIGNES_MAX_COMPILE, CompiledModel, CompiledTrees,
+                            accumuler, decomposer, sonde_parite,
+                            verifier_parite)
+
+
+class FusedForecaster:
+    def __init__(self, noms, arbres, blocs, charger_modele):
+        """
+        Regroupe des modèles qui partagent le même vecteur de features.
+        Les arbres de tous les modèles du groupe sont compilés dans un seul
+        jeu de tableaux plats (voir tree_inference) : un appel predict du
+        groupe fait un seul parcours vectorisé, sans le coût fixe de chaque
+        appel predict de sklearn.
+
+        blocs donne, pour chaque modèle compilé, sa tranche d'arbres et sa
+        combinaison (debut, fin, echelle, diviseur, init). Les autres
+        modèles, et les matrices trop grandes, passent par le predict
+        sklearn obtenu via charger_modele(nom), appelé seulement au besoin.
+        """
+        self.noms = list(noms)
+        self._arbres = arbres
+        self._blocs = dict(blocs)
+        self._charger_modele = charger_modele
+
+    @classmethod
+    def compiler(cls, modeles, verifier=True, charger_modele=None):
+        """
+        Compile un groupe de modèles sklearn. Les modèles qui ne sont pas des
+        arbres, ou dont la version compilée s'écarte de sklearn, gardent leur
+        predict. Par défaut le groupe garde une référence aux modèles donnés.
+        """
+        modeles = dict(modeles)
+        blocs = {}
+        arbres = []
+        for nom, modele in modeles.items():
+            decomposition = decomposer(modele)
+            if decomposition is None:
+                continue
+            if verifier and not cls._parite(modele, decomposition):
+                continue
+            arbres_modele, echelle, diviseur, init = decomposition
+            blocs[nom] = (len(arbres), len(arbres) + len(arbres_modele),
+                          echelle, diviseur, init)
+            arbres.extend(arbres_modele)
+        return cls(modeles, CompiledTrees(arbres) if arbres else None,
+                   blocs, charger_modele or modeles.__getitem__)
+
+    @staticmethod
+    def _parite(modele, decomposition):
+        X = sonde_parite(decomposition[0], modele.n_features_in_)
+        return verifier_parite(modele, CompiledModel(modele).predict, X)
+
+    def save(self, dossier):
+        """Écrit les tableaux compilés et la description des blocs."""
+        os.makedirs(dossier, exist_ok=True)
+        if self._arbres is not None:
+            self._arbres.save(dossier)
+        with open(os.path.join(dossier, "groupe.json"), "w") as f:
+            blocs = {nom: list(bloc) for nom, bloc in self._blocs.items()}
+            json.dump({"noms": self.noms, "blocs": blocs}, f)
+
+    @classmethod
+    def load(cls, dossier, charger_modele):
+        """Relit un groupe écrit par save, tableaux en memory-map."""
+        with open(os.path.join(dossier, "groupe.json")) as f:
+            description = json.load(f)
+        blocs = {nom: tuple(bloc)
+                 for nom, bloc in description["blocs"].items()}
+        arbres = CompiledTrees.load(dossier) if blocs else None
+        return cls(description["noms"], arbres, blocs, charger_modele)
+
+    def warm_up(self):
+        """Charge dès maintenant les modèles qui ne sont pas compilés."""
+        for nom in self.noms:
+            if nom not in self._blocs:
+                self._charger_modele(nom)
+
+    @property
+    def nbytes(self):
+        return self._arbres.nbytes if self._arbres is not None else 0
+
+    def predict(self, X):
+        """Retourne {nom du modèle: prédictions} pour la matrice X."""
+        X = np.asarray(X)
+        if X.shape[0] == 0:
+            return {nom: np.empty(0) for nom in self.noms}
+
+        if X.shape[0] > LIGNES_MAX_COMPILE:
+            return {nom: self._charger_modele(nom).predict(X)
+                    for nom in self.noms}
+
+        valeurs = None
+        if self._arbres is not None:
+            X32 = np.ascontiguousarray(X, dtype=np.float32)
+            # Un seul parcours pour tous les arbres du groupe
+            valeurs = self._arbres.leaf_values(X32)
+
+        sorties = {}
+        for nom in self.noms:
+            if nom not in self._blocs:
+                sorties[nom] = self._charger_modele(nom).predict(X)
+                continue
+            debut, fin, echelle, diviseur, init = self._blocs[nom]
+            sorties[nom] = accumuler(valeurs[debut:fin], echelle, diviseur,
+                                     init)
+        return sorties
@@ -25,7 +25,9 @@ pdf.cell(0, 10, "Rapport de benchmark des modèles IA", ln=True, align="C")
 pdf.ln(10)
 
 for filename in sorted(os.listdir(BENCHMARK_DIR)):
-    if not filename.endswith(".json"):
+    # Seuls les résultats de ModelComparison (pas les rapports de load_test.py)
+    if not (filename.startswith("comparison_results_") and
+            filename.endswith(".json")):
         continue
     path = os.path.join(BENCHMARK_DIR, filename)
     with open(path, "r", encoding="utf-8") as f:
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import config
+from metrics import etape, metrics
+from model_registry import registry
+from predict import calculer_inference, inference_synthetique
+
+
+logger = logging.getLogger(__name__)
+
+# Seules ces clés du contexte traversent la frontière entre processus
+CLES_INFERENCE = ("country_id", "virus_id", "d_start", "d_end",
+                  "dates_to_predict", "official_dates", "officielles",
+                  "cumuls_officiels")
+
+# Observations des histogrammes d'un processus d'inférence, rejouées par le
+# processus principal
+_observations = []
+
+
+def _initialiser_processus(prechauffer):
+    metrics.relayer(_observations)
+    if prechauffer:
+        registry.warm_up()
+        # Premier passage dans les modèles avant la première requête
+        inference_synthetique()
+
+
+def _pret():
+    return registry.version
+
+
+def inferer(ctx, version):
+    """
+    Exécuté dans un processus du pool : modèles de la version donnée, puis
+    lissage.
+    """
+    del _observations[:]
+    registry.utiliser(version)
+    series = calculer_inference(ctx)
+    return series, list(_observations)
+
+
+class InferencePool:
+    def __init__(self, workers=None, max_concurrency=None):
+        """
+        Pool de processus pour la partie CPU de /predict (modèles et
+        lissage), hors du GIL du serveur. Chaque processus précharge les
+        modèles au démarrage. Au-delà de max_concurrency calculs soumis,
+        les requêtes attendent leur tour dans la boucle asyncio.
+        """
+        self.workers = config.inference_workers if workers is None else workers
+        concurrence = (config.inference_max_concurrency
+                       if max_concurrency is None else max_concurrency)
+        self.max_concurrency = concurrence or max(1, self.workers)
+        self._executor = None
+        self._semaphore = None
+        self.en_attente = 0
+        self.en_cours = 0
+
+    async def demarrer(self):
+        """Lance les processus et attend qu'ils aient chargé les modèles."""
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.workers <= 0 or self._executor is not None:
+            return
+        debut = time.perf_counter()
+        self._executor = self._creer()
+        # Une tâche par processus : chacun est démarré et initialisé
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self._executor, _pret)
+                               for _ in range(self.workers)])
+        logger.info(f"{self.workers} processus d'inférence prêts en "
+                    f"{time.perf_counter() - debut:.2f}s")
+
+    def _creer(self):
+        # spawn : pas de fork d'un processus qui a déjà des threads et un
+        # pool SQL
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_initialiser_processus,
+            initargs=(config.models_warmup,))
+
+    def arreter(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def executer(self, ctx):
+        """Séries de la requête préparée ctx, calculées dans le pool."""
+        ctx = {cle: ctx[cle] for cle in CLES_INFERENCE}
+        self.en_attente += 1
+        try:
+            with etape("inference_queue"):
+                await self._semaphore.acquire()
+        finally:
+            self.en_attente -= 1
+        self.en_cours += 1
+        try:
+            if self._executor is None:
+                # Sans processus dédié : thread du processus principal
+                return await asyncio.to_thread(calculer_inference, ctx)
+            executor = self._executor
+            loop = asyncio.get_running_loop()
+            try:
+                series, observations = await loop.run_in_executor(
+                    executor, inferer, ctx, registry.version)
+            except BrokenProcessPool:
+                # Processus tué (mémoire...) : pool recréé pour les suivantes
+                if self._executor is executor:
+                    logger.error("Pool d'inférence interrompu, redémarrage")
+                    self._executor = self._creer()
+                    executor.shutdown(wait=False)
+                raise
+            metrics.rejouer(observations)
+            return series
+        finally:
+            self.en_cours -= 1
+            self._semaphore.release()
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.en_attente,
+            "in_flight": self.en_cours,
+        }
+
+
+inference_pool = InferencePool()
+
+
+@metrics.collecteur
+def collecter_inference():
+    stats = inference_pool.stats()
+    return [
+        ("inference_queue_depth", "gauge",
+         "Requêtes en attente d'une place dans le pool d'inférence",
+         [({}, stats["queue_depth"])]),
+        ("inference_in_flight", "gauge",
+         "Calculs en cours dans le pool d'inférence",
+         [({}, stats["in_flight"])]),
+        ("inference_max_concurrency", "gauge",
+         "Nombre maximal de calculs simultanés",
+         [({}, stats["max_concurrency"])]),
+        ("inference_workers", "gauge", "Processus dédiés à l'inférence",
+         [({}, stats["workers"])]),
+    ]
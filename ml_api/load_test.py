@@ -0,0 +1,540 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+import numpy as np
+from sqlalchemy import (BigInteger, Column, Date, DateTime, Integer, MetaData,
+                        Numeric, String, Table, create_engine, delete, func,
+                        insert, select)
+
+
+# Banc de charge : base synthétique (SQLite locale ou Postgres dédiée),
+# API lancée avec uvicorn, mélange concurrent de /predict, /countries et
+# /viruses, rapport JSON comparable d'un commit à l'autre.
+
+DOSSIER_API = os.path.dirname(os.path.abspath(__file__))
+DOSSIER_RAPPORTS = os.path.join(DOSSIER_API, "benchmark")
+BASE_PAR_DEFAUT = (
+    f"sqlite:///{os.path.join(DOSSIER_RAPPORTS, 'load_test.sqlite')}")
+PREMIERE_DATE = date(2020, 1, 1)
+MELANGE_PAR_DEFAUT = "predict=8,countries=1,viruses=1"
+LIGNES_PAR_INSERTION = 5000
+
+
+def definir_tables(meta):
+    """
+    Tables lues par ml_api, telles que créées par Prisma et csv_to_postgres.
+    """
+    Table("Pays", meta,
+          Column("id_pays", Integer, primary_key=True),
+          Column("nom_pays", String(100), unique=True, nullable=False),
+          Column("population", BigInteger))
+    Table("Virus", meta,
+          Column("id_virus", Integer, primary_key=True),
+          Column("nom_virus", String(50), unique=True, nullable=False))
+    Table("Statistiques_Journalieres", meta,
+          Column("id_stat", Integer, primary_key=True, autoincrement=True),
+          Column("id_pays", Integer, nullable=False),
+          Column("id_virus", Integer, nullable=False),
+          Column("id_saison", Integer),
+          Column("date", Date, nullable=False),
+          *[Column(nom, Integer, nullable=False, default=0)
+            for nom in ("nouveaux_cas", "nouveaux_deces", "total_cas",
+                        "total_deces")],
+          *[Column(nom, Numeric(10, 4))
+            for nom in ("croissance_cas", "taux_mortalite", "taux_infection",
+                        "taux_mortalite_population",
+                        "taux_infection_vs_global",
+                        "taux_mortalite_pop_vs_global")])
+    Table("Migration_Status", meta,
+          Column("id", Integer, primary_key=True, autoincrement=True),
+          Column("filename", String(255), unique=True, nullable=False),
+          Column("checksum", String(64), nullable=False),
+          Column("migrated_at", DateTime),
+          Column("status", String(20)))
+    return meta
+
+
+def generer_virus(rng, populations, jours):
+    """
+    Séries synthétiques d'un virus pour tous les pays, en tableaux (pays,
+    jours) : vagues gaussiennes bruitées, décès tirés parmi les cas,
+    cumuls et taux dérivés comme dans la migration.
+    """
+    t = np.arange(jours)
+    vagues = np.zeros((len(populations), jours))
+    for ligne in vagues:
+        for _ in range(rng.integers(2, 6)):
+            centre, largeur = rng.uniform(0, jours), rng.uniform(15, 90)
+            ligne += (rng.uniform(0.2, 1.0) *
+                      np.exp(-((t - centre) / largeur) ** 2))
+    attendus = populations[:, None] * 2e-4 * (vagues + 0.02)
+    cas = rng.poisson(attendus)
+    deces = rng.binomial(cas, rng.uniform(0.002, 0.03, (len(populations), 1)))
+    total_cas, total_deces = np.cumsum(cas, axis=1), np.cumsum(deces, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precedents = np.concatenate([cas[:, :1], cas[:, :-1]], axis=1)
+        croissance = np.where(precedents > 0,
+                              (cas - precedents) / precedents * 100, 0.0)
+        taux_mortalite = np.where(total_cas > 0,
+                                  total_deces / total_cas * 100, 0.0)
+    taux_infection = total_cas / populations[:, None] * 100
+    taux_mortalite_population = total_deces / populations[:, None] * 1e5
+
+    def relatif(valeurs):
+        # Rapport à la moyenne de tous les pays le même jour
+        return (valeurs / np.maximum(valeurs.mean(axis=0), 1e-9)).round(4)
+
+    return {
+        "nouveaux_cas": cas,
+        "nouveaux_deces": deces,
+        "total_cas": total_cas,
+        "total_deces": total_deces,
+        # Bornés à Numeric(10, 4)
+        "croissance_cas": np.clip(croissance, -999999, 999999).round(4),
+        "taux_mortalite": taux_mortalite.round(4),
+        "taux_infection": taux_infection.round(4),
+        "taux_mortalite_population": taux_mortalite_population.round(4),
+        "taux_infection_vs_global": relatif(taux_infection),
+        "taux_mortalite_pop_vs_global": relatif(taux_mortalite_population),
+    }
+
+
+def semer(database_url, n_pays, n_virus, jours, graine, reinitialiser=False):
+    """
+    Crée les tables manquantes et les remplit de données synthétiques.
+    Refuse une base qui contient déjà des statistiques, sauf avec
+    reinitialiser (toutes les lignes sont alors supprimées : base dédiée
+    au banc uniquement). Retourne la description du jeu de données.
+    """
+    debut = time.perf_counter()
+    engine = create_engine(database_url)
+    meta = definir_tables(MetaData())
+    meta.create_all(engine)
+    tables = meta.tables
+    rng = np.random.default_rng(graine)
+    noms_pays = [f"Pays {numero:03d}" for numero in range(1, n_pays + 1)]
+    noms_virus = [f"virus-{numero}" for numero in range(1, n_virus + 1)]
+    populations = rng.integers(500_000, 80_000_000, n_pays)
+    dates = [PREMIERE_DATE + timedelta(days=jour) for jour in range(jours)]
+
+    with engine.begin() as conn:
+        if conn.execute(select(func.count()).select_from(
+                tables["Statistiques_Journalieres"])).scalar_one():
+            if not reinitialiser:
+                raise SystemExit("La base contient déjà des statistiques : "
+                                 "--reset pour la vider (base dédiée au banc)")
+            for nom in ("Statistiques_Journalieres", "Pays", "Virus",
+                        "Migration_Status"):
+                conn.execute(delete(tables[nom]))
+        conn.execute(insert(tables["Pays"]), [
+            {"id_pays": numero, "nom_pays": nom, "population": int(population)}
+            for numero, (nom, population)
+            in enumerate(zip(noms_pays, populations), start=1)])
+        conn.execute(insert(tables["Virus"]), [
+            {"id_virus": numero, "nom_virus": nom}
+            for numero, nom in enumerate(noms_virus, start=1)])
+
+        statistiques = tables["Statistiques_Journalieres"]
+        lignes = []
+        for id_virus in range(1, n_virus + 1):
+            colonnes = {nom: valeurs.tolist() for nom, valeurs in
+                        generer_virus(rng, populations, jours).items()}
+            for i in range(n_pays):
+                for jour, jour_date in enumerate(dates):
+                    lignes.append({
+                        "id_pays": i + 1, "id_virus": id_virus,
+                        "date": jour_date,
+                        **{nom: valeurs[i][jour]
+                           for nom, valeurs in colonnes.items()}})
+                    if len(lignes) == LIGNES_PAR_INSERTION:
+                        conn.execute(insert(statistiques), lignes)
+                        lignes = []
+        if lignes:
+            conn.execute(insert(statistiques), lignes)
+
+        # Nouvelle migration terminée : les caches de ml_api repartent de zéro
+        horodatage = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        parametres = f"{n_pays}:{n_virus}:{jours}:{graine}:{horodatage}"
+        conn.execute(insert(tables["Migration_Status"]).values(
+            filename=f"load_test_{horodatage}.csv",
+            checksum=hashlib.sha256(parametres.encode("utf-8")).hexdigest(),
+            migrated_at=datetime.utcnow(), status="completed"))
+    engine.dispose()
+
+    jeu = {
+        "countries": noms_pays,
+        "viruses": noms_virus,
+        "days": jours,
+        "rows": n_pays * n_virus * jours,
+        "first_date": dates[0].isoformat(),
+        "last_date": dates[-1].isoformat(),
+        "seed": graine,
+    }
+    print(f"🌱 {jeu['rows']} lignes synthétiques écrites en "
+          f"{time.perf_counter() - debut:.1f}s")
+    return jeu
+
+
+def decrire_base(database_url):
+    """Description du jeu de données d'une base déjà remplie (--skip-seed)."""
+    engine = create_engine(database_url)
+    tables = definir_tables(MetaData()).tables
+    stats = tables["Statistiques_Journalieres"]
+    with engine.connect() as conn:
+        pays = conn.execute(
+            select(tables["Pays"].c.nom_pays)).scalars().all()
+        virus = conn.execute(
+            select(tables["Virus"].c.nom_virus)).scalars().all()
+        lignes, premiere, derniere = conn.execute(select(
+            func.count(), func.min(stats.c.date),
+            func.max(stats.c.date))).one()
+    engine.dispose()
+    premiere, derniere = (date.fromisoformat(str(valeur)[:10])
+                          for valeur in (premiere, derniere))
+    return {
+        "countries": pays,
+        "viruses": virus,
+        "days": (derniere - premiere).days + 1,
+        "rows": lignes,
+        "first_date": premiere.isoformat(),
+        "last_date": derniere.isoformat(),
+        "seed": None,
+    }
+
+
+def rss_processus(pid):
+    """
+    RSS en octets du processus et de ses descendants (workers d'inférence),
+    None hors Linux.
+    """
+    total = 0
+    a_visiter = [pid]
+    while a_visiter:
+        courant = a_visiter.pop()
+        try:
+            with open(f"/proc/{courant}/status") as f:
+                total += next(int(ligne.split()[1]) * 1024 for ligne in f
+                              if ligne.startswith("VmRSS:"))
+            for tache in os.listdir(f"/proc/{courant}/task"):
+                with open(f"/proc/{courant}/task/{tache}/children") as f:
+                    a_visiter.extend(int(enfant)
+                                     for enfant in f.read().split())
+        except (OSError, ValueError, StopIteration):
+            if courant == pid:
+                return None
+    return total
+
+
+def lancer_api(database_url, port, env_api, journal):
+    """
+    Démarre l'API avec uvicorn sur la base du banc et attend qu'elle
+    réponde. Retourne (processus, durée de démarrage en secondes).
+    """
+    import httpx
+
+    env = {**os.environ, **env_api, "DATABASE_URL": database_url}
+    debut = time.perf_counter()
+    processus = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1",
+         "--port", str(port)],
+        cwd=DOSSIER_API, env=env, stdout=journal, stderr=subprocess.STDOUT)
+    while time.perf_counter() - debut < 180:
+        if processus.poll() is not None:
+            raise SystemExit(f"L'API s'est arrêtée au démarrage "
+                             f"(code {processus.returncode})")
+        try:
+            reponse = httpx.get(f"http://127.0.0.1:{port}/countries",
+                                timeout=2)
+            if reponse.status_code == 200:
+                return processus, time.perf_counter() - debut
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    processus.terminate()
+    raise SystemExit("L'API n'a pas répondu en 180s")
+
+
+def lire_melange(texte):
+    """"predict=8,countries=1" -> {"predict": 8.0, "countries": 1.0}"""
+    melange = {}
+    for element in texte.split(","):
+        nom, _, poids = element.partition("=")
+        if nom.strip() not in ("predict", "countries", "viruses"):
+            raise argparse.ArgumentTypeError(
+                f"Route inconnue dans le mélange: {nom}")
+        melange[nom.strip()] = float(poids or 1)
+    return melange
+
+
+def tirer_requete(rng, jeu, melange):
+    """
+    Requête suivante d'un utilisateur simulé : (route, chemin, paramètres).
+    Les périodes de /predict imitent le tableau de bord : surtout la vue
+    par défaut (90 jours passés et 30 prédits), puis une année de
+    l'historique, puis de longues périodes qui débordent sur les
+    prédictions.
+    """
+    route = rng.choices(list(melange), weights=list(melange.values()))[0]
+    if route != "predict":
+        return route, f"/{route}", None
+    premiere = date.fromisoformat(jeu["first_date"])
+    derniere = date.fromisoformat(jeu["last_date"])
+    tirage = rng.random()
+    if tirage < 0.6:
+        debut = derniere - timedelta(days=90)
+        fin = derniere + timedelta(days=30)
+    elif tirage < 0.85:
+        debut = premiere + timedelta(
+            days=rng.randrange(max(1, jeu["days"] - 365)))
+        fin = debut + timedelta(days=364)
+    else:
+        debut = premiere + timedelta(days=rng.randrange(jeu["days"]))
+        fin = derniere + timedelta(days=rng.randrange(30, 366))
+    return route, "/predict", {
+        "country": rng.choice(jeu["countries"]),
+        "virus": rng.choice(jeu["viruses"]),
+        "date_start": debut.isoformat(),
+        "date_end": fin.isoformat(),
+    }
+
+
+async def executer_charge(base_url, jeu, duree, echauffement, concurrence,
+                          melange, graine, pid):
+    """
+    concurrence utilisateurs enchaînent leurs requêtes pendant
+    echauffement puis duree secondes ; seules les réponses de la seconde
+    phase sont mesurées. Retourne (mesures, durée mesurée, RSS).
+    """
+    import httpx
+
+    mesures = []
+    etags = {}
+    rss = {"start": rss_processus(pid) if pid else None, "peak": None,
+           "end": None}
+    debut_mesure = time.perf_counter() + echauffement
+    fin = debut_mesure + duree
+
+    async def utilisateur(client, numero):
+        rng = random.Random(graine * 1000 + numero)
+        while time.perf_counter() < fin:
+            route, chemin, params = tirer_requete(rng, jeu, melange)
+            # Le frontend renvoie l'ETag des référentiels qu'il a déjà
+            headers = {}
+            if route in etags and rng.random() < 0.5:
+                headers["If-None-Match"] = etags[route]
+            debut = time.perf_counter()
+            try:
+                reponse = await client.get(chemin, params=params,
+                                           headers=headers)
+                statut = reponse.status_code
+                if route != "predict" and "etag" in reponse.headers:
+                    etags[route] = reponse.headers["etag"]
+            except httpx.HTTPError:
+                statut = None
+            if debut >= debut_mesure:
+                mesures.append((route, time.perf_counter() - debut, statut))
+
+    async def surveiller_rss():
+        while time.perf_counter() < fin:
+            valeur = rss_processus(pid)
+            if valeur is not None and time.perf_counter() >= debut_mesure:
+                rss["peak"] = max(rss["peak"] or 0, valeur)
+            await asyncio.sleep(0.5)
+
+    limites = httpx.Limits(max_connections=concurrence,
+                           max_keepalive_connections=concurrence)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120,
+                                 limits=limites) as client:
+        taches = [utilisateur(client, numero) for numero in range(concurrence)]
+        if pid:
+            taches.append(surveiller_rss())
+        await asyncio.gather(*taches)
+        try:
+            statistiques = (await client.get("/cache/stats")).json()
+        except (httpx.HTTPError, ValueError):
+            statistiques = None
+    duree_mesuree = max(time.perf_counter() - debut_mesure, 1e-9)
+    rss["end"] = rss_processus(pid) if pid else None
+    return mesures, duree_mesuree, rss, statistiques
+
+
+def resumer(mesures, duree):
+    """Percentiles (ms), débit et statuts des mesures d'une route."""
+    latences = np.array([latence for _, latence, _ in mesures]) * 1000
+    statuts = {}
+    for _, _, statut in mesures:
+        statuts[str(statut)] = statuts.get(str(statut), 0) + 1
+    resume = {
+        "requests": len(mesures),
+        "throughput_rps": round(len(mesures) / duree, 2),
+        "errors": sum(1 for _, _, statut in mesures
+                      if statut is None or statut >= 500),
+        "status": dict(sorted(statuts.items())),
+    }
+    if len(latences):
+        p50, p95, p99 = np.percentile(latences, [50, 95, 99])
+        resume.update({"mean_ms": round(float(latences.mean()), 3),
+                       "p50_ms": round(float(p50), 3),
+                       "p95_ms": round(float(p95), 3),
+                       "p99_ms": round(float(p99), 3),
+                       "max_ms": round(float(latences.max()), 3)})
+    return resume
+
+
+def commit_courant():
+    """
+    Commit mesuré, suffixé de -dirty si des fichiers suivis sont modifiés.
+    """
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty", "--abbrev=7"],
+            cwd=DOSSIER_API, capture_output=True, text=True,
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparer(rapport, fichier_reference):
+    """
+    Affiche l'évolution de chaque route par rapport à un rapport précédent.
+    """
+    with open(fichier_reference) as f:
+        reference = json.load(f)
+    print(f"\nComparaison avec {reference.get('commit')} "
+          f"({fichier_reference}) :")
+    for route, resume in rapport["endpoints"].items():
+        ancien = reference.get("endpoints", {}).get(route)
+        if not ancien:
+            continue
+        evolutions = []
+        for cle in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            if resume.get(cle) is not None and ancien.get(cle):
+                ecart = (resume[cle] / ancien[cle] - 1) * 100
+                evolutions.append(f"{cle} {ancien[cle]} -> {resume[cle]} "
+                                  f"({ecart:+.1f}%)")
+        print(f"  {route:9s} " + ", ".join(evolutions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc de charge de l'API IA")
+    parser.add_argument("--database-url", default=BASE_PAR_DEFAUT,
+                        help="base du banc, SQLite (défaut) ou Postgres "
+                             "dédiée")
+    parser.add_argument("--countries", type=int, default=20,
+                        help="nombre de pays synthétiques")
+    parser.add_argument("--viruses", type=int, default=3,
+                        help="nombre de virus synthétiques")
+    parser.add_argument("--days", type=int, default=1095,
+                        help="jours d'historique par série")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true",
+                        help="vide la base avant de la remplir si elle "
+                             "contient déjà des données")
+    parser.add_argument("--skip-seed", action="store_true",
+                        help="réutilise la base telle quelle")
+    parser.add_argument("--url",
+                        help="API déjà lancée (sinon démarrée avec uvicorn)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--models-dir", help="MODELS_DIR de l'API lancée")
+    parser.add_argument("--inference-workers", type=int,
+                        help="INFERENCE_WORKERS de l'API lancée")
+    parser.add_argument("--duration", type=float, default=30,
+                        help="secondes mesurées")
+    parser.add_argument("--warmup", type=float, default=5,
+                        help="secondes non mesurées")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="utilisateurs simultanés")
+    parser.add_argument("--mix", type=lire_melange,
+                        default=lire_melange(MELANGE_PAR_DEFAUT),
+                        help=f"poids des routes (défaut {MELANGE_PAR_DEFAUT})")
+    parser.add_argument("--output",
+                        help="rapport JSON (défaut "
+                             "benchmark/load_test_<commit>_<date>.json)")
+    parser.add_argument("--compare", help="rapport précédent à comparer")
+    args = parser.parse_args()
+
+    if args.skip_seed:
+        jeu = decrire_base(args.database_url)
+    else:
+        if args.database_url.startswith("sqlite:///"):
+            fichier = args.database_url[len("sqlite:///"):]
+            os.makedirs(os.path.dirname(os.path.abspath(fichier)),
+                        exist_ok=True)
+        jeu = semer(args.database_url, args.countries, args.viruses,
+                    args.days, args.seed, args.reset)
+
+    processus, demarrage = None, None
+    base_url = args.url
+    if base_url is None:
+        env_api = {}
+        if args.models_dir:
+            env_api["MODELS_DIR"] = os.path.abspath(args.models_dir)
+        if args.inference_workers is not None:
+            env_api["INFERENCE_WORKERS"] = str(args.inference_workers)
+        journal = open(os.path.join(DOSSIER_RAPPORTS,
+                                    "load_test_server.log"), "w")
+        processus, demarrage = lancer_api(args.database_url, args.port,
+                                          env_api, journal)
+        base_url = f"http://127.0.0.1:{args.port}"
+        print(f"🚀 API démarrée en {demarrage:.1f}s (pid {processus.pid})")
+
+    try:
+        print(f"⏱️  {args.concurrency} utilisateurs, {args.warmup:g}s "
+              f"d'échauffement puis {args.duration:g}s mesurées...")
+        mesures, duree, rss, statistiques = asyncio.run(executer_charge(
+            base_url, jeu, args.duration, args.warmup, args.concurrency,
+            args.mix, args.seed, processus.pid if processus else None))
+    finally:
+        if processus is not None:
+            processus.terminate()
+            processus.wait(timeout=30)
+            journal.close()
+
+    rapport = {
+        "format": 1,
+        "commit": commit_courant(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+        "dataset": {
+            **{cle: valeur for cle, valeur in jeu.items()
+               if cle not in ("countries", "viruses")},
+            "countries": len(jeu["countries"]),
+            "viruses": len(jeu["viruses"]),
+            "database": args.database_url.split(":", 1)[0]},
+        "load": {"concurrency": args.concurrency, "duration_s": args.duration,
+                 "warmup_s": args.warmup, "mix": args.mix},
+        "startup_s": round(demarrage, 3) if demarrage is not None else None,
+        "total": resumer(mesures, duree),
+        "endpoints": {route: resumer([m for m in mesures if m[0] == route],
+                                     duree)
+                      for route in args.mix},
+        "rss_bytes": rss,
+        "server_stats": statistiques,
+    }
+    sortie = args.output or os.path.join(
+        DOSSIER_RAPPORTS, f"load_test_{rapport['commit'] or 'local'}_"
+                          f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(sortie, "w") as f:
+        json.dump(rapport, f, indent=2)
+
+    total = rapport["total"]
+    print(f"✅ {total['requests']} requêtes, {total['throughput_rps']} req/s, "
+          f"p50 {total.get('p50_ms')} ms, p95 {total.get('p95_ms')} ms, "
+          f"p99 {total.get('p99_ms')} ms, {total['errors']} erreurs")
+    if rss["peak"]:
+        print(f"   RSS max {rss['peak'] / 2**20:.0f} Mio")
+    print(f"📄 Rapport: {sortie}")
+    if args.compare:
+        comparer(rapport, args.compare)
+
+
+if __name__ == "__main__":
+    main()
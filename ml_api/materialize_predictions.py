@@ -0,0 +1,269 @@
+import argparse
+import hashlib
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, insert, func, tuple_
+from config import config
+from database import db
+from model_registry import localiser_version, registry
+from predict import _as_date, calculer_prediction_batch
+from reference_cache import reference_cache
+
+
+logger = logging.getLogger(__name__)
+
+# Séries de la réponse de /predict -> colonnes de Predictions_Journalieres
+COLONNES_PREDICTIONS = {
+    "new_cases": "nouveaux_cas",
+    "new_deaths": "nouveaux_deces",
+    "transmission_rate": "taux_infection",
+    "mortality_rate": "taux_mortalite",
+    "geographic_spread": "propagation_geographique",
+}
+# Valeurs scalaires de la réponse de /predict -> colonnes de
+# Predictions_Etats
+COLONNES_SCALAIRES = {
+    "total_cases": "total_cas",
+    "total_deaths": "total_deces",
+    "peak_date": "date_pic",
+    "estimated_duration_days": "duree_estimee_jours",
+    "cases_in_30d": "cas_30j",
+    "deaths_in_30d": "deces_30j",
+    "new_countries_next_week": "nouveaux_pays_semaine",
+}
+
+
+def empreintes_donnees(conn):
+    """
+    {(pays, virus): (dernière date, empreinte)} de chaque série officielle.
+    L'empreinte change dès qu'une ligne de la série est ajoutée, supprimée
+    ou modifiée (migration ou API GraphQL).
+    """
+    stats = db.stats
+    lignes = conn.execute(select(
+        stats.c.id_pays, stats.c.id_virus, func.max(stats.c.date),
+        func.count(),
+        func.sum(stats.c.nouveaux_cas), func.sum(stats.c.nouveaux_deces),
+        func.sum(stats.c.taux_infection), func.sum(stats.c.taux_mortalite),
+    ).group_by(stats.c.id_pays, stats.c.id_virus)).fetchall()
+    return {(ligne[0], ligne[1]): (
+        _as_date(ligne[2]),
+        hashlib.sha1(repr(tuple(ligne[2:])).encode("utf-8")).hexdigest())
+        for ligne in lignes}
+
+
+def etats_materialises(conn, etats):
+    """
+    {(pays, virus): (version des modèles, empreinte)} du dernier calcul de
+    chaque couple.
+    """
+    return {(pays, virus): (version, empreinte)
+            for pays, virus, version, empreinte in conn.execute(select(
+                etats.c.id_pays, etats.c.id_virus,
+                etats.c.version_modele, etats.c.empreinte_donnees))}
+
+
+def colonnes_serie(valeurs_series):
+    """Séries d'un bloc de la réponse -> {colonne: tableau}."""
+    valeurs_series = valeurs_series or {}
+    return {colonne: valeurs_series[serie]
+            for serie, colonne in COLONNES_PREDICTIONS.items()
+            if serie in valeurs_series}
+
+
+def calculer_lot(requetes, version):
+    """
+    Exécuté dans un processus du pool : prédictions d'un lot de couples en
+    une passe (calculer_prediction_batch). Retourne pour chaque couple la
+    période calculée, ses séries lissées (officielles puis prédites) et
+    ses valeurs scalaires : tout ce que /predict renvoie.
+    """
+    registry.utiliser(version)
+    lot = []
+    for resultat in calculer_prediction_batch(requetes):
+        if isinstance(resultat, dict):
+            raise ValueError(resultat["error"])
+        ctx, series = resultat
+        blocs = ((series["official_dates"],
+                  colonnes_serie(series["official"]), True),
+                 (series["prediction_dates"],
+                  colonnes_serie(series["predictions"]), False))
+        lot.append(((ctx["country_id"], ctx["virus_id"]),
+                    (ctx["d_start"].date(), ctx["d_end"].date()),
+                    blocs, series["scalaires"]))
+    return lot
+
+
+def ecrire_lot(table, etats, lot, version, empreintes):
+    """
+    Remplace en une transaction les séries des couples du lot et enregistre
+    leur état avec leurs valeurs scalaires, y compris pour les couples sans
+    date prédite : ils ne sont pas recalculés tant que rien ne change.
+    """
+    calcule_le = datetime.utcnow()
+    lignes = []
+    lignes_etats = []
+    for paire, (date_debut, date_fin), blocs, scalaires in lot:
+        commun = {"id_pays": paire[0], "id_virus": paire[1],
+                  "version_modele": version,
+                  "empreinte_donnees": empreintes[paire][1],
+                  "calcule_le": calcule_le}
+        for dates, colonnes, officielle in blocs:
+            valeurs = {colonne: tableau.tolist()
+                       for colonne, tableau in colonnes.items()}
+            for i, date in enumerate(dates.tolist()):
+                lignes.append({
+                    **commun, "date": date, "officielle": officielle,
+                    **{colonne: serie[i]
+                       for colonne, serie in valeurs.items()},
+                })
+        lignes_etats.append({
+            **commun, "date_debut": date_debut, "date_fin": date_fin,
+            **{colonne: scalaires[cle]
+               for cle, colonne in COLONNES_SCALAIRES.items()},
+            "date_pic": _as_date(scalaires["peak_date"]),
+        })
+    paires = [paire for paire, _, _, _ in lot]
+    with db.engine.begin() as conn:
+        for cible in (table, etats):
+            conn.execute(delete(cible).where(
+                tuple_(cible.c.id_pays, cible.c.id_virus).in_(paires)))
+        if lignes:
+            conn.execute(insert(table), lignes)
+        conn.execute(insert(etats), lignes_etats)
+    return len(lignes)
+
+
+def materialiser(force=False, horizon=None, workers=None):
+    """
+    Recalcule les prédictions des couples (pays, virus) dont les données ou
+    la version des modèles ont changé depuis la dernière exécution.
+    Chaque couple est prédit sur la requête canonique [dernière date -
+    horizon, dernière date + horizon] ; ses séries lissées (officielles et
+    prédites) et ses valeurs scalaires sont écrites, de sorte que la
+    réponse de /predict se relise en SQL seul. Retourne un résumé de
+    l'exécution.
+    """
+    horizon = config.materialize_horizon_days if horizon is None else horizon
+    workers = config.materialize_workers if workers is None else workers
+    debut = time.perf_counter()
+    table = db.predictions
+    etats_table = db.predictions_etats
+    if table is None or etats_table is None:
+        raise RuntimeError("Tables Predictions_Journalieres et "
+                           "Predictions_Etats absentes : appliquer les "
+                           "migrations Prisma ou lancer csv_to_postgres")
+    reference_cache.load()
+    noms_pays = {identifiant: nom
+                 for nom, identifiant in reference_cache.pays.items()}
+    noms_virus = {identifiant: nom
+                  for nom, identifiant in reference_cache.virus.items()}
+    version = registry.version
+
+    with db.connection() as conn:
+        empreintes = empreintes_donnees(conn)
+        etats = etats_materialises(conn, etats_table)
+
+    a_calculer = sorted(paire for paire, (_, empreinte) in empreintes.items()
+                        if force or etats.get(paire) != (version, empreinte))
+    disparues = [paire for paire in etats if paire not in empreintes]
+    if disparues:
+        with db.engine.begin() as conn:
+            for cible in (table, etats_table):
+                conn.execute(delete(cible).where(
+                    tuple_(cible.c.id_pays, cible.c.id_virus).in_(disparues)))
+    logger.info(f"Prédictions à recalculer: {len(a_calculer)} couples sur "
+                f"{len(empreintes)} (modèles {version})")
+
+    lots = []
+    taille = max(1, config.predict_batch_max_items)
+    for i in range(0, len(a_calculer), taille):
+        lots.append([{
+            "country": noms_pays[pays], "virus": noms_virus[virus],
+            "date_start": (empreintes[(pays, virus)][0] -
+                           timedelta(days=horizon)).isoformat(),
+            "date_end": (empreintes[(pays, virus)][0] +
+                         timedelta(days=horizon)).isoformat(),
+        } for pays, virus in a_calculer[i:i + taille]])
+
+    lignes = 0
+    echecs = 0
+    if workers > 0 and len(lots) > 1:
+        # spawn : comme le pool d'inférence, pas de fork d'un processus qui
+        # a un pool SQL
+        contexte = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=contexte) as executor:
+            futurs = [executor.submit(calculer_lot, requetes, version)
+                      for requetes in lots]
+            for futur in as_completed(futurs):
+                try:
+                    lignes += ecrire_lot(table, etats_table, futur.result(),
+                                         version, empreintes)
+                except Exception as e:
+                    logger.error(f"Échec d'un lot de prédictions: {e}")
+                    echecs += 1
+    else:
+        for requetes in lots:
+            try:
+                lot = calculer_lot(requetes, version)
+                lignes += ecrire_lot(table, etats_table, lot, version,
+                                     empreintes)
+            except Exception as e:
+                logger.error(f"Échec d'un lot de prédictions: {e}")
+                echecs += 1
+
+    resume = {
+        "model_version": version,
+        "pairs": len(empreintes),
+        "recomputed": len(a_calculer),
+        "deleted": len(disparues),
+        "rows": lignes,
+        "failed_batches": echecs,
+        "seconds": round(time.perf_counter() - debut, 3),
+    }
+    logger.info(f"Prédictions matérialisées: {resume}")
+    return resume
+
+
+def planifier(intervalle, force=False):
+    """
+    Exécute materialiser toutes les intervalle secondes, avec la version de
+    modèles pointée par CURRENT : une migration (empreinte des données) ou
+    un ré-entraînement est matérialisé au plus tard une période après. Une
+    exécution en échec (tables pas encore créées, base indisponible) est
+    retentée à la période suivante.
+    """
+    while True:
+        try:
+            registry.utiliser(localiser_version(registry.racine)[1])
+            materialiser(force=force)
+            force = False
+        except Exception as e:
+            logger.error(f"Échec de la matérialisation des prédictions: {e}")
+        time.sleep(intervalle)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Matérialise les prédictions dans "
+                    "Predictions_Journalieres")
+    parser.add_argument("--force", action="store_true",
+                        help="recalcule tous les couples, même inchangés")
+    parser.add_argument("--interval", type=float,
+                        default=config.materialize_interval,
+                        help="relance le job toutes les N secondes "
+                             "(0 : une seule exécution)")
+    args = parser.parse_args()
+    if args.interval > 0:
+        planifier(args.interval, force=args.force)
+    resume = materialiser(force=args.force)
+    if resume["failed_batches"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
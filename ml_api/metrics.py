@@ -0,0 +1,354 @@
+import bisect
+import threading
+import time
+from database import db
+from model_registry import registry
+from prediction_cache import prediction_cache
+from series_cache import series_cache
+from startup import demarrage
+from stats_snapshot import stats_snapshot
+
+
+# Bornes des histogrammes de durée, en secondes
+BUCKETS_SECONDES = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(noms, valeurs, extra=""):
+    paires = [f'{nom}="{_echapper(valeur)}"'
+              for nom, valeur in zip(noms, valeurs)]
+    if extra:
+        paires.append(extra)
+    return "{" + ",".join(paires) + "}" if paires else ""
+
+
+def _echapper(valeur):
+    return (str(valeur).replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n"))
+
+
+def _format_nombre(valeur):
+    if valeur == float("inf"):
+        return "+Inf"
+    return repr(float(valeur)) if isinstance(valeur, float) else str(valeur)
+
+
+class Histogram:
+    def __init__(self, nom, aide, labels=(), buckets=BUCKETS_SECONDES):
+        """
+        Histogramme Prometheus : un compteur par borne, la somme et le
+        total.
+        """
+        self.nom = nom
+        self.aide = aide
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._verrou = threading.Lock()
+        self.relais = None
+
+    def observe(self, valeurs_labels, valeur):
+        if self.relais is not None:
+            self.relais.append((self.nom, valeurs_labels, valeur))
+            return
+        # Compteurs non cumulés : le cumul est fait au moment de l'export
+        indice = bisect.bisect_left(self.buckets, valeur)
+        with self._verrou:
+            serie = self._series.get(valeurs_labels)
+            if serie is None:
+                serie = [0] * (len(self.buckets) + 1) + [0.0]
+                self._series[valeurs_labels] = serie
+            serie[indice] += 1
+            serie[-1] += valeur
+
+    def lignes(self):
+        yield f"# HELP {self.nom} {self.aide}"
+        yield f"# TYPE {self.nom} histogram"
+        with self._verrou:
+            series = {cle: list(serie) for cle, serie in self._series.items()}
+        for valeurs, serie in sorted(series.items()):
+            cumul = 0
+            bornes = self.buckets + (float("inf"),)
+            for borne, compte in zip(bornes, serie[:-1]):
+                cumul += compte
+                labels = _format_labels(self.labels, valeurs,
+                                        f'le="{_format_nombre(borne)}"')
+                yield f"{self.nom}_bucket{labels} {cumul}"
+            labels = _format_labels(self.labels, valeurs)
+            yield f"{self.nom}_sum{labels} {_format_nombre(serie[-1])}"
+            yield f"{self.nom}_count{labels} {cumul}"
+
+
+class Counter:
+    def __init__(self, nom, aide, labels=()):
+        self.nom = nom
+        self.aide = aide
+        self.labels = tuple(labels)
+        self._valeurs = {}
+        self._verrou = threading.Lock()
+        self.relais = None
+
+    def inc(self, valeurs_labels, valeur=1):
+        if self.relais is not None:
+            self.relais.append((self.nom, valeurs_labels, valeur))
+            return
+        with self._verrou:
+            self._valeurs[valeurs_labels] = (
+                self._valeurs.get(valeurs_labels, 0) + valeur)
+
+    def lignes(self):
+        yield f"# HELP {self.nom} {self.aide}"
+        yield f"# TYPE {self.nom} counter"
+        with self._verrou:
+            valeurs = dict(self._valeurs)
+        for cle, valeur in sorted(valeurs.items()):
+            labels = _format_labels(self.labels, cle)
+            yield f"{self.nom}{labels} {_format_nombre(valeur)}"
+
+
+class Chrono:
+    __slots__ = ("histogramme", "labels", "debut")
+
+    def __init__(self, histogramme, labels):
+        """Mesure la durée d'un bloc `with` dans l'histogramme donné."""
+        self.histogramme = histogramme
+        self.labels = labels
+
+    def __enter__(self):
+        self.debut = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogramme.observe(self.labels, time.perf_counter() - self.debut)
+        return False
+
+
+class Metrics:
+    def __init__(self):
+        """
+        Métriques du processus au format texte Prometheus. Les histogrammes
+        et compteurs sont mis à jour sur le chemin des requêtes (un verrou
+        et une recherche dichotomique) ; les jauges (pool, caches, modèles)
+        ne sont lues qu'au moment de l'export.
+        """
+        self._metriques = []
+        self._collecteurs = []
+
+    def histogram(self, nom, aide, labels=(), buckets=BUCKETS_SECONDES):
+        metrique = Histogram(nom, aide, labels, buckets)
+        self._metriques.append(metrique)
+        return metrique
+
+    def counter(self, nom, aide, labels=()):
+        metrique = Counter(nom, aide, labels)
+        self._metriques.append(metrique)
+        return metrique
+
+    def collecteur(self, fonction):
+        """
+        Enregistre une fonction appelée à chaque export. Elle retourne des
+        tuples (nom, type, aide, [(labels, valeur), ...]).
+        """
+        self._collecteurs.append(fonction)
+        return fonction
+
+    def relayer(self, observations):
+        """
+        Processus secondaire : les observations des histogrammes et
+        compteurs sont ajoutées à la liste donnée, que le processus
+        principal rejoue.
+        """
+        for metrique in self._metriques:
+            metrique.relais = observations
+
+    def rejouer(self, observations):
+        metriques = {metrique.nom: metrique for metrique in self._metriques}
+        for nom, valeurs_labels, valeur in observations:
+            metrique = metriques[nom]
+            if isinstance(metrique, Histogram):
+                metrique.observe(valeurs_labels, valeur)
+            else:
+                metrique.inc(valeurs_labels, valeur)
+
+    def render(self):
+        lignes = []
+        for metrique in self._metriques:
+            lignes.extend(metrique.lignes())
+        for fonction in self._collecteurs:
+            for nom, type_metrique, aide, echantillons in fonction():
+                lignes.append(f"# HELP {nom} {aide}")
+                lignes.append(f"# TYPE {nom} {type_metrique}")
+                for labels, valeur in echantillons:
+                    etiquettes = _format_labels(labels.keys(),
+                                                labels.values())
+                    lignes.append(
+                        f"{nom}{etiquettes} {_format_nombre(valeur)}")
+        return "\n".join(lignes) + "\n"
+
+
+metrics = Metrics()
+
+duree_etapes = metrics.histogram(
+    "predict_stage_seconds", "Durée de chaque étape du calcul des prédictions",
+    ("stage",))
+duree_modeles = metrics.histogram(
+    "predict_model_seconds",
+    "Durée du predict de chaque modèle ou groupe de modèles",
+    ("model",))
+requetes_http = metrics.counter(
+    "http_requests_total", "Requêtes HTTP traitées",
+    ("method", "route", "status"))
+duree_http = metrics.histogram(
+    "http_request_duration_seconds", "Durée des requêtes HTTP", ("route",))
+lectures_tenseur = metrics.counter(
+    "model_tensor_lookups_total",
+    "Appels de modèles servis par le tenseur précalculé (hit) ou, hors de "
+    "son domaine, par l'inférence (fallback)", ("model", "result"))
+
+
+def etape(nom):
+    return Chrono(duree_etapes, (nom,))
+
+
+def chrono_modele(nom):
+    return Chrono(duree_modeles, (nom,))
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        """
+        Middleware ASGI : compte les requêtes par route et statut et mesure
+        leur durée.
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        debut = time.perf_counter()
+        statut = [500]
+
+        async def envoyer(message):
+            if message["type"] == "http.response.start":
+                statut[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, envoyer)
+        finally:
+            # Le modèle de route (et non le chemin) borne le nombre de séries
+            route = scope.get("route")
+            chemin = getattr(route, "path", "non_trouvee")
+            duree_http.observe((chemin,), time.perf_counter() - debut)
+            requetes_http.inc((scope["method"], chemin, str(statut[0])))
+
+
+@metrics.collecteur
+def collecter_pool():
+    # Pool psycopg2 des routes sync et pool asyncpg des routes async
+    pools = {}
+    for nom, engine in (("sync", db.engine), ("async", db.engine_async)):
+        pool = getattr(engine, "pool", None)
+        if pool is not None and hasattr(pool, "checkedout"):
+            pools[nom] = pool
+    if not pools:
+        return []
+    return [
+        ("db_pool_size", "gauge", "Taille du pool de connexions",
+         [({"engine": nom}, pool.size()) for nom, pool in pools.items()]),
+        ("db_pool_checked_out", "gauge", "Connexions en cours d'utilisation",
+         [({"engine": nom}, pool.checkedout())
+          for nom, pool in pools.items()]),
+        ("db_pool_checked_in", "gauge", "Connexions disponibles dans le pool",
+         [({"engine": nom}, pool.checkedin())
+          for nom, pool in pools.items()]),
+        ("db_pool_overflow", "gauge",
+         "Connexions ouvertes au-delà de la taille du pool",
+         [({"engine": nom}, max(0, pool.overflow()))
+          for nom, pool in pools.items()]),
+    ]
+
+
+CACHES = {"prediction": prediction_cache, "series": series_cache}
+
+
+@metrics.collecteur
+def collecter_caches():
+    stats = {nom: cache.stats() for nom, cache in CACHES.items()}
+    return [
+        ("cache_entries", "gauge", "Entrées présentes dans le cache",
+         [({"cache": nom}, s["size"]) for nom, s in stats.items()]),
+        ("cache_hits_total", "counter", "Lectures servies par le cache",
+         [({"cache": nom}, s["hits"]) for nom, s in stats.items()]),
+        ("cache_misses_total", "counter", "Lectures absentes du cache",
+         [({"cache": nom}, s["misses"]) for nom, s in stats.items()]),
+        ("cache_evictions_total", "counter",
+         "Entrées évincées (taille maximale)",
+         [({"cache": nom}, s["evictions"]) for nom, s in stats.items()]),
+        ("cache_expirations_total", "counter", "Entrées expirées (TTL)",
+         [({"cache": nom}, s["expirations"]) for nom, s in stats.items()]),
+        ("cache_bytes", "gauge", "Taille des entrées du cache en octets",
+         [({"cache": nom}, s["bytes"]) for nom, s in stats.items()
+          if "bytes" in s]),
+        ("cache_invalidations_total", "counter",
+         "Vidages du cache après une nouvelle migration",
+         [({"cache": nom}, s["invalidations"]) for nom, s in stats.items()
+          if "invalidations" in s]),
+        ("cache_in_flight", "gauge",
+         "Calculs en cours pour une entrée absente du cache",
+         [({"cache": nom}, s["in_flight"]) for nom, s in stats.items()
+          if "in_flight" in s]),
+        ("cache_computations_total", "counter",
+         "Calculs lancés après un défaut de cache",
+         [({"cache": nom}, s["computations"]) for nom, s in stats.items()
+          if "computations" in s]),
+        ("cache_coalesced_total", "counter",
+         "Requêtes servies par un calcul identique déjà en cours "
+         "(calculs évités)",
+         [({"cache": nom}, s["coalesced"]) for nom, s in stats.items()
+          if "coalesced" in s]),
+    ]
+
+
+@metrics.collecteur
+def collecter_modeles():
+    stats = registry.stats()
+    chargements = [({"model": nom}, s["load_seconds"])
+                   for nom, s in {**stats["models"], **stats["groups"]}.items()
+                   if "load_seconds" in s]
+    return [
+        ("model_info", "gauge", "Version des modèles en service",
+         [({"version": stats["version"]}, 1)]),
+        ("model_load_seconds", "gauge", "Durée de chargement de chaque modèle",
+         chargements),
+    ]
+
+
+@metrics.collecteur
+def collecter_snapshot():
+    stats = stats_snapshot.stats()
+    if not stats["enabled"]:
+        return []
+    return [
+        ("stats_snapshot_info", "gauge",
+         "Snapshot des statistiques en service",
+         [({"version": stats["version"] or ""},
+           1 if stats["version"] else 0)]),
+        ("stats_snapshot_rows", "gauge", "Lignes du snapshot des statistiques",
+         [({}, stats["rows"])]),
+        ("stats_snapshot_reads_total", "counter",
+         "Séries lues dans le snapshot",
+         [({}, stats["hits"])]),
+    ]
+
+
+@metrics.collecteur
+def collecter_demarrage():
+    return [
+        ("startup_ready", "gauge", "1 une fois le démarrage de l'API terminé",
+         [({}, 1 if demarrage.pret else 0)]),
+        ("startup_step_seconds", "gauge", "Durée de chaque étape du démarrage",
+         [({"step": nom}, duree) for nom, duree in demarrage.durees.items()]),
+    ]
@@ -0,0 +1,475 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from config import config
+from fused_forecast import FusedForecaster
+from prediction_tensor import PredictionTensor
+
+
+logger = logging.getLogger(__name__)
+
+FICHIERS_MODELES = {
+    "new_cases": "new_cases_model.joblib",
+    "new_deaths": "new_deaths_model.joblib",
+    "infection_rate": "infection_rate_model.joblib",
+    "mortality_rate": "mortality_rate_model.joblib",
+    "total_cases": "total_cases_model.joblib",
+    "total_deaths": "total_deaths_model.joblib",
+    "peak_date": "peak_date_model.joblib",
+    "estimated_duration": "estimated_duration_model.joblib",
+    "cases_in_30d": "cases_in_30d_model.joblib",
+    "deaths_in_30d": "deaths_in_30d_model.joblib",
+    "geographic_spread": "geographic_spread_model.joblib",
+    "new_countries_next_week": "new_countries_next_week_model.joblib",
+}
+
+# Modèles regroupés par vecteur de features, évalués en une seule passe
+GROUPES = {
+    "journalier": {
+        "nouveaux_cas": "new_cases",
+        "nouveaux_deces": "new_deaths",
+        "total_cas": "total_cases",
+        "total_deces": "total_deaths",
+        "taux_infection": "infection_rate",
+        "taux_mortalite": "mortality_rate",
+    },
+    "debut_periode": {
+        "peak_date": "peak_date",
+        "estimated_duration_days": "estimated_duration",
+        "cases_in_30d": "cases_in_30d",
+        "deaths_in_30d": "deaths_in_30d",
+    },
+}
+MODELES_SEULS = ("geographic_spread", "new_countries_next_week")
+
+DOSSIER_COMPILE = ".compiled"
+FICHIER_MANIFESTE = "manifest.json"
+FICHIER_COURANT = "CURRENT"
+
+
+def calculer_version_modeles(dossier="models"):
+    """
+    Empreinte du contenu des fichiers de modèles : change à chaque
+    ré-entraînement.
+    """
+    empreinte = hashlib.sha1()
+    for nom in sorted(os.listdir(dossier)):
+        if not nom.endswith(".joblib"):
+            continue
+        empreinte.update(nom.encode("utf-8"))
+        with open(os.path.join(dossier, nom), "rb") as f:
+            for bloc in iter(lambda: f.read(1 << 20), b""):
+                empreinte.update(bloc)
+    return empreinte.hexdigest()[:12]
+
+
+def memoire_residente():
+    """Mémoire résidente du processus en octets (None hors Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def empreinte_fichier(chemin):
+    empreinte = hashlib.sha1()
+    with open(chemin, "rb") as f:
+        for bloc in iter(lambda: f.read(1 << 20), b""):
+            empreinte.update(bloc)
+    return empreinte.hexdigest()
+
+
+def lire_courant(racine):
+    """
+    Nom de la version pointée par racine/CURRENT, None pour l'ancien format
+    à plat.
+    """
+    try:
+        with open(os.path.join(racine, FICHIER_COURANT)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def localiser_version(racine):
+    """
+    (dossier, version) du jeu de modèles courant. Sans fichier CURRENT, les
+    modèles sont directement dans racine et la version est l'empreinte de
+    leur contenu.
+    """
+    version = lire_courant(racine)
+    if version is None:
+        return racine, calculer_version_modeles(racine)
+    return dossier_version(racine, version), version
+
+
+def dossier_version(racine, version):
+    return racine if version is None else os.path.join(racine, version)
+
+
+def creer_version(racine):
+    """
+    Crée racine/<horodatage>/ pour un nouvel entraînement. Les modèles de la
+    version courante y sont copiés : un modèle non ré-entraîné reste servi.
+    """
+    source = dossier_version(racine, lire_courant(racine))
+    horodatage = datetime.now().strftime("%Y%m%d-%H%M%S")
+    version, suffixe = horodatage, 0
+    while True:
+        dossier = os.path.join(racine, version)
+        try:
+            os.makedirs(dossier)
+            break
+        except FileExistsError:
+            suffixe += 1
+            version = f"{horodatage}-{suffixe}"
+    for fichier in FICHIERS_MODELES.values():
+        if os.path.exists(os.path.join(source, fichier)):
+            # Copie et non lien dur : joblib.dump réécrit le fichier en place
+            shutil.copy2(os.path.join(source, fichier),
+                         os.path.join(dossier, fichier))
+    return dossier, version
+
+
+def publier_version(racine, version, conserver=3):
+    """
+    Écrit le manifeste de la version puis fait pointer CURRENT dessus par
+    renommage atomique. Seules les `conserver` versions les plus récentes
+    sont gardées sur le disque.
+    """
+    dossier = os.path.join(racine, version)
+    manifeste = {
+        "version": version,
+        "created_at": datetime.now().isoformat(timespec="microseconds"),
+        "models": {fichier: empreinte_fichier(os.path.join(dossier, fichier))
+                   for fichier in sorted(FICHIERS_MODELES.values())
+                   if os.path.exists(os.path.join(dossier, fichier))},
+    }
+    with open(os.path.join(dossier, FICHIER_MANIFESTE), "w") as f:
+        json.dump(manifeste, f, indent=2)
+
+    temporaire = os.path.join(racine, f"{FICHIER_COURANT}.tmp")
+    with open(temporaire, "w") as f:
+        f.write(version)
+    os.replace(temporaire, os.path.join(racine, FICHIER_COURANT))
+
+    publiees = []
+    for nom in os.listdir(racine):
+        try:
+            with open(os.path.join(racine, nom, FICHIER_MANIFESTE)) as f:
+                publiees.append((json.load(f).get("created_at", ""), nom))
+        except (OSError, ValueError):
+            continue
+    for _, ancienne in sorted(publiees)[:-conserver]:
+        if ancienne != version:
+            shutil.rmtree(os.path.join(racine, ancienne), ignore_errors=True)
+    return manifeste
+
+
+class ModelSet:
+    def __init__(self, dossier, version):
+        """
+        Un jeu de modèles d'une version donnée, chargé paresseusement : un
+        fichier n'est lu qu'au premier usage. Les .joblib sont ouverts avec
+        mmap_mode="r" et les arbres compilés de chaque groupe sont écrits en
+        .npy dans <dossier>/.compiled puis relus en memory-map, de sorte que
+        les workers uvicorn qui servent la même version partagent les mêmes
+        pages en mémoire.
+        """
+        self.dossier = dossier
+        self.version = version
+        self._verrou = threading.RLock()
+        self._modeles = {}
+        self._groupes = {}
+        self._tenseur = None
+        self._stats = {}
+
+    def _mesurer(self, nom, chargement):
+        debut = time.perf_counter()
+        rss_avant = memoire_residente()
+        objet = chargement()
+        rss_apres = memoire_residente()
+        self._stats[nom] = {
+            "load_seconds": round(time.perf_counter() - debut, 6),
+            # Approximatif : variation de la mémoire résidente du processus
+            "resident_bytes": (
+                rss_apres - rss_avant
+                if rss_avant is not None and rss_apres is not None
+                else None),
+        }
+        return objet
+
+    def _lire(self, nom):
+        # Import différé : joblib et sklearn ne sont chargés qu'avec le
+        # premier modèle
+        import joblib
+
+        chemin = os.path.join(self.dossier, FICHIERS_MODELES[nom])
+        return joblib.load(chemin, mmap_mode="r")
+
+    def model(self, nom):
+        """Modèle sklearn, chargé au premier appel."""
+        modele = self._modeles.get(nom)
+        if modele is not None:
+            return modele
+        with self._verrou:
+            if nom not in self._modeles:
+                modele = self._mesurer(nom, lambda: self._lire(nom))
+                self._stats[nom]["file_bytes"] = os.path.getsize(
+                    os.path.join(self.dossier, FICHIERS_MODELES[nom]))
+                self._modeles[nom] = modele
+                logger.info(f"Modèle {nom} chargé")
+            return self._modeles[nom]
+
+    def group(self, nom):
+        """
+        FusedForecaster du groupe, relu depuis le cache compilé ou compilé.
+        """
+        groupe = self._groupes.get(nom)
+        if groupe is not None:
+            return groupe
+        with self._verrou:
+            if nom not in self._groupes:
+                self._groupes[nom] = self._mesurer(
+                    nom, lambda: self._charger_groupe(nom))
+                self._stats[nom]["mapped_bytes"] = self._groupes[nom].nbytes
+            return self._groupes[nom]
+
+    def _charger_groupe(self, nom):
+        membres = GROUPES[nom]
+
+        def charger_modele(cle):
+            return self.model(membres[cle])
+
+        dossier = os.path.join(self.dossier, DOSSIER_COMPILE,
+                               f"{nom}-{self.version}")
+        if os.path.isdir(dossier):
+            try:
+                return FusedForecaster.load(dossier, charger_modele)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Cache compilé illisible pour {nom}: {e}")
+
+        # Les modèles lus pour la compilation ne sont pas conservés : seuls
+        # les tableaux compilés restent en mémoire
+        groupe = FusedForecaster.compiler(
+            {cle: self._lire(modele) for cle, modele in membres.items()},
+            charger_modele=charger_modele)
+        try:
+            self._ecrire_groupe(nom, groupe, dossier)
+            return FusedForecaster.load(dossier, charger_modele)
+        except OSError as e:
+            logger.warning(f"Cache compilé non écrit pour {nom}: {e}")
+            return groupe
+
+    def _ecrire_groupe(self, nom, groupe, dossier):
+        # Écriture dans un dossier temporaire puis renommage : un autre worker
+        # ne voit jamais un cache à moitié écrit
+        temporaire = f"{dossier}.{os.getpid()}.tmp"
+        groupe.save(temporaire)
+        try:
+            os.rename(temporaire, dossier)
+        except OSError:
+            # Un autre worker a écrit le même cache entre-temps
+            shutil.rmtree(temporaire, ignore_errors=True)
+            if not os.path.isdir(dossier):
+                raise
+        parent = os.path.dirname(dossier)
+        for ancien in os.listdir(parent):
+            if (ancien.startswith(f"{nom}-") and
+                    ancien != os.path.basename(dossier) and
+                    not ancien.endswith(".tmp")):
+                shutil.rmtree(os.path.join(parent, ancien), ignore_errors=True)
+
+    @property
+    def tensor(self):
+        """
+        Tenseur de prédictions précalculé de la version, None s'il n'a pas
+        été construit.
+        """
+        if self._tenseur is None:
+            with self._verrou:
+                if self._tenseur is None:
+                    self._tenseur = PredictionTensor.load(
+                        self.dossier, self.version) or False
+        return self._tenseur or None
+
+    def inferer(self, nom, X):
+        """Sorties du groupe ou du modèle nom, calculées par les modèles."""
+        if nom in GROUPES:
+            return self.group(nom).predict(X)
+        return self.model(nom).predict(X)
+
+    def verifier(self):
+        """Lève FileNotFoundError si un fichier de modèle manque."""
+        manquants = [
+            fichier for fichier in FICHIERS_MODELES.values()
+            if not os.path.exists(os.path.join(self.dossier, fichier))]
+        if manquants:
+            raise FileNotFoundError(f"Modèles manquants dans {self.dossier}: "
+                                    f"{', '.join(manquants)}")
+
+    def warm_up(self):
+        """
+        Charge tous les groupes et modèles pour éviter la latence du premier
+        appel.
+        """
+        debut = time.perf_counter()
+        for nom in GROUPES:
+            self.group(nom).warm_up()
+        for nom in MODELES_SEULS:
+            self.model(nom)
+        self.tensor
+        logger.info(f"Modèles {self.version} préchargés en "
+                    f"{time.perf_counter() - debut:.2f}s")
+
+    def stats(self):
+        """Temps de chargement et taille de chaque modèle ou groupe chargé."""
+        with self._verrou:
+            return {
+                "version": self.version,
+                "models": {nom: {"loaded": nom in self._modeles,
+                                 **self._stats.get(nom, {})}
+                           for nom in FICHIERS_MODELES},
+                "groups": {nom: {"loaded": nom in self._groupes,
+                                 **self._stats.get(nom, {})}
+                           for nom in GROUPES},
+                "tensor": self._tenseur.stats() if self._tenseur else None,
+            }
+
+
+class ModelRegistry:
+    def __init__(self, racine="models"):
+        """
+        Donne accès au jeu de modèles courant et le remplace à chaud. Un
+        nouveau jeu est chargé et préchauffé en arrière-plan pendant que
+        l'ancien continue de servir, puis échangé d'un seul coup : une
+        requête qui a commencé avec un jeu le garde jusqu'au bout.
+        """
+        self.racine = racine
+        self._verrou = threading.Lock()
+        self._courant = None
+        self._chargement = None
+        self._derniere_erreur = None
+        self._courant_vu = None
+        self._arret = threading.Event()
+        self._surveillance = None
+
+    @property
+    def courant(self):
+        """Jeu de modèles actif, ouvert au premier accès."""
+        jeu = self._courant
+        if jeu is not None:
+            return jeu
+        with self._verrou:
+            if self._courant is None:
+                self._courant_vu = lire_courant(self.racine)
+                self._courant = ModelSet(*localiser_version(self.racine))
+            return self._courant
+
+    @property
+    def version(self):
+        return self.courant.version
+
+    def model(self, nom):
+        return self.courant.model(nom)
+
+    def group(self, nom):
+        return self.courant.group(nom)
+
+    def warm_up(self):
+        self.courant.warm_up()
+
+    def utiliser(self, version):
+        """
+        Met en service la version donnée, chargée sur place si besoin : un
+        processus d'inférence suit ainsi la version du processus principal.
+        """
+        if self.courant.version == version:
+            return
+        with self._verrou:
+            if self._courant.version == version:
+                return
+            dossier = dossier_version(self.racine, version)
+            if not os.path.isdir(dossier):
+                # Ancien format à plat : la version est l'empreinte du contenu
+                dossier, version = localiser_version(self.racine)
+            jeu = ModelSet(dossier, version)
+            jeu.warm_up()
+            self._courant_vu = lire_courant(self.racine)
+            self._courant = jeu
+        logger.info(f"Modèles {version} en service")
+
+    def reload(self):
+        """
+        Lance le chargement en arrière-plan de la version pointée par
+        CURRENT. Retourne l'état du rechargement.
+        """
+        with self._verrou:
+            if self._chargement is not None:
+                return {"status": "already_loading",
+                        "version": self._chargement}
+            self._courant_vu = lire_courant(self.racine)
+            dossier, version = localiser_version(self.racine)
+            if self._courant is not None and version == self._courant.version:
+                return {"status": "unchanged", "version": version}
+            self._chargement = version
+        threading.Thread(target=self._charger, args=(dossier, version),
+                         name="model-reload", daemon=True).start()
+        return {"status": "loading", "version": version}
+
+    def _charger(self, dossier, version):
+        try:
+            jeu = ModelSet(dossier, version)
+            jeu.verifier()
+            jeu.warm_up()
+        except Exception as e:
+            logger.error(f"Échec du chargement des modèles {version}: {e}")
+            with self._verrou:
+                self._chargement = None
+                self._derniere_erreur = f"{version}: {e}"
+            return
+        with self._verrou:
+            ancien = self._courant
+            self._courant = jeu
+            self._chargement = None
+            self._derniere_erreur = None
+        remplace = f" (remplace {ancien.version})" if ancien else ""
+        logger.info(f"Modèles {version} en service{remplace}")
+
+    def demarrer_surveillance(self, intervalle):
+        """Recharge automatiquement quand le fichier CURRENT change."""
+        if intervalle <= 0 or self._surveillance is not None:
+            return
+        self._arret.clear()
+        self._surveillance = threading.Thread(
+            target=self._surveiller, args=(intervalle,),
+            name="model-watch", daemon=True)
+        self._surveillance.start()
+
+    def _surveiller(self, intervalle):
+        while not self._arret.wait(intervalle):
+            try:
+                if lire_courant(self.racine) != self._courant_vu:
+                    self.reload()
+            except OSError as e:
+                logger.warning(f"Surveillance des modèles: {e}")
+
+    def arreter_surveillance(self):
+        self._arret.set()
+        if self._surveillance is not None:
+            self._surveillance.join()
+            self._surveillance = None
+
+    def stats(self):
+        return {"loading": self._chargement,
+                "last_error": self._derniere_erreur,
+                **self.courant.stats()}
+
+
+registry = ModelRegistry(config.models_dir)
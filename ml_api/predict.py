@@ -1,434 +1,561 @@
-import joblib
+import asyncio
 import numpy as np
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, select, Table, MetaData, and_
-from config import config
+from sqlalchemy import select, and_, or_, func
+from database import db
+from metrics import chrono_modele, etape, lectures_tenseur
+from model_registry import registry
+from reference_cache import reference_cache
+from series_cache import series_cache
+from smoothing import lisser_fusion, moyenne_glissante
 import logging
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-logger.info("Chargement des modèles...")
-try:
-    new_cases_model = joblib.load("models/new_cases_model.joblib")
-    new_deaths_model = joblib.load("models/new_deaths_model.joblib")
-    infection_rate_model = joblib.load("models/infection_rate_model.joblib")
-    mortality_rate_model = joblib.load("models/mortality_rate_model.joblib")
-    total_cases_model = joblib.load("models/total_cases_model.joblib")
-    total_deaths_model = joblib.load("models/total_deaths_model.joblib")
-    peak_date_model = joblib.load("models/peak_date_model.joblib")
-    estimated_duration_model = joblib.load(
-        "models/estimated_duration_model.joblib")
-    cases_in_30d_model = joblib.load("models/cases_in_30d_model.joblib")
-    deaths_in_30d_model = joblib.load("models/deaths_in_30d_model.joblib")
-    geographic_spread_model = joblib.load(
-        "models/geographic_spread_model.joblib")
-    new_countries_next_week_model = joblib.load(
-        "models/new_countries_next_week_model.joblib")
-    logger.info("Modèles chargés avec succès")
-except Exception as e:
-    logger.error(f"Erreur lors du chargement des modèles: {e}")
-    raise
-
 
 def get_country_id(country_name):
-    engine = create_engine(config.get_database_url())
-    meta = MetaData()
-    pays = Table('Pays', meta, autoload_with=engine)
-    with engine.connect() as conn:
-        result = conn.execute(select(pays.c.id_pays).where(
-            pays.c.nom_pays == country_name)).first()
-        if result:
-            return result[0]
-        raise ValueError(f"Pays inconnu: {country_name}")
+    return reference_cache.get_country_id(country_name)
 
 
 def get_virus_id(virus_name):
-    engine = create_engine(config.get_database_url())
-    meta = MetaData()
-    virus = Table('Virus', meta, autoload_with=engine)
-    with engine.connect() as conn:
-        result = conn.execute(select(virus.c.id_virus).where(
-            virus.c.nom_virus == virus_name)).first()
-        if result:
-            return result[0]
-        raise ValueError(f"Virus inconnu: {virus_name}")
+    return reference_cache.get_virus_id(virus_name)
 
 
-def get_latest_data_date(country_id, virus_id):
-    try:
-        engine = create_engine(config.get_database_url())
-        meta = MetaData()
-        stats = Table('Statistiques_Journalieres', meta, autoload_with=engine)
-
-        with engine.connect() as conn:
-            query = select(stats.c.date).where(
-                and_(
-                    stats.c.id_pays == country_id,
-                    stats.c.id_virus == virus_id
-                )
-            ).order_by(stats.c.date.desc()).limit(1)
-
-            result = conn.execute(query).first()
-            if result:
-                return result[0]
-            else:
-                return None
-    except Exception as e:
-        logger.error(
-            f"Erreur lors de la récupération de la dernière date: {e}")
-        return None
+def _as_date(value):
+    if isinstance(value, str):
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    return value
 
 
-def get_official_data(country_id, virus_id, date_start, date_end):
+def _requete_dernieres_dates(paires):
+    stats = db.stats
+    return select(
+        stats.c.id_pays,
+        stats.c.id_virus,
+        func.max(stats.c.date)
+    ).where(
+        or_(*[and_(stats.c.id_pays == country_id,
+                   stats.c.id_virus == virus_id)
+              for country_id, virus_id in paires])
+    ).group_by(stats.c.id_pays, stats.c.id_virus)
+
+
+def get_latest_data_dates(paires):
+    """
+    Dernière date disponible pour chaque couple (pays, virus), en une seule
+    requête.
+    """
+    paires = set(paires)
+    if not paires:
+        return {}
     try:
-        engine = create_engine(config.get_database_url())
-        meta = MetaData()
-        stats = Table('Statistiques_Journalieres', meta, autoload_with=engine)
-
-        with engine.connect() as conn:
-            query = select(
-                stats.c.date,
-                stats.c.nouveaux_cas,
-                stats.c.nouveaux_deces,
-                stats.c.total_cas,
-                stats.c.total_deces,
-                stats.c.taux_infection,
-                stats.c.taux_mortalite,
-                stats.c.croissance_cas,
-                stats.c.taux_mortalite_population,
-                stats.c.taux_infection_vs_global,
-                stats.c.taux_mortalite_pop_vs_global
-            ).where(
-                and_(
-                    stats.c.id_pays == country_id,
-                    stats.c.id_virus == virus_id,
-                    stats.c.date >= date_start,
-                    stats.c.date <= date_end
-                )
-            ).order_by(stats.c.date)
-
-            results = conn.execute(query).fetchall()
-            logger.info(
-                f"Données officielles récupérées: {len(results)} enregistrements")
-
-            # Construire le dictionnaire des données officielles
-            official_data = {}
-            for row in results:
-                date_str = row.date.strftime("%Y-%m-%d")
-                official_data[date_str] = {
-                    "nouveaux_cas": int(row.nouveaux_cas) if row.nouveaux_cas is not None else 0,
-                    "nouveaux_deces": int(row.nouveaux_deces) if row.nouveaux_deces is not None else 0,
-                    "total_cas": int(row.total_cas) if row.total_cas is not None else 0,
-                    "total_deces": int(row.total_deces) if row.total_deces is not None else 0,
-                    "taux_infection": float(row.taux_infection) if row.taux_infection is not None else 0.0,
-                    "taux_mortalite": float(row.taux_mortalite) if row.taux_mortalite is not None else 0.0,
-                    "croissance_cas": float(row.croissance_cas) if row.croissance_cas is not None else 0.0,
-                    "taux_mortalite_population": float(
-                        row.taux_mortalite_population) if row.taux_mortalite_population is not None else 0.0,
-                    "taux_infection_vs_global": float(
-                        row.taux_infection_vs_global) if row.taux_infection_vs_global is not None else 0.0,
-                    "taux_mortalite_pop_vs_global": float(
-                        row.taux_mortalite_pop_vs_global) if row.taux_mortalite_pop_vs_global is not None else 0.0
-                }
-
-            return official_data
+        with db.connection() as conn:
+            lignes = conn.execute(_requete_dernieres_dates(paires)).fetchall()
+            return {(row[0], row[1]): row[2] for row in lignes}
     except Exception as e:
         logger.error(
-            f"Erreur lors de la récupération des données officielles: {e}")
-        raise
+            f"Erreur lors de la récupération de la dernière date: {e}")
+        return {}
 
 
-def get_dates_to_predict(all_dates, country_id, virus_id):
-    latest_data_date = get_latest_data_date(country_id, virus_id)
+def get_latest_data_date(country_id, virus_id):
+    return get_latest_data_dates([(country_id, virus_id)]).get(
+        (country_id, virus_id))
+
 
+def filtrer_dates_a_predire(dates, latest_data_date):
+    """
+    Dates (datetime64[D], triées) strictement postérieures à la dernière
+    date en BDD.
+    """
     if latest_data_date is None:
         # Si aucune donnée n'existe, prédire toutes les dates
         logger.info(
             "Aucune donnée historique trouvée, prédiction de toutes les dates")
-        return all_dates
+        return dates
 
     logger.info(f"Dernière date avec données officielles: {latest_data_date}")
 
-    # Filtrer pour ne garder que les dates postérieures à la dernière date en BDD
-    dates_to_predict = []
-    for date in all_dates:
-        date_obj = datetime.strptime(date, "%Y-%m-%d").date()
-        if date_obj > latest_data_date:
-            dates_to_predict.append(date)
+    # Les dates sont triées : celles à prédire forment un suffixe
+    debut = np.searchsorted(
+        dates, np.datetime64(latest_data_date, "D"), side="right")
+    dates_to_predict = dates[debut:]
 
     logger.info(f"Dates à prédire: {len(dates_to_predict)} dates")
     return dates_to_predict
 
 
-def generate_predictions(country_id, virus_id, dates_to_predict):
-    if not dates_to_predict:
-        return {}
+def get_dates_to_predict(dates, country_id, virus_id):
+    latest_data_date = get_latest_data_date(country_id, virus_id)
+    return filtrer_dates_a_predire(dates, latest_data_date)
 
-    logger.info(
-        f"Génération des prédictions pour {len(dates_to_predict)} dates")
-
-    # Prépare les features pour toutes les dates d'un coup
-    X = []
-    X_geo = []
-    for date_str in dates_to_predict:
-        d = datetime.strptime(date_str, "%Y-%m-%d")
-        year = d.year
-        day_of_year = d.timetuple().tm_yday
-        X.append([country_id, virus_id, year, day_of_year])
-        X_geo.append([virus_id, year])
-
-    X = np.array(X)
-    X_geo = np.array(X_geo)
-
-    # Prédictions batch
-    pred_new_cases = new_cases_model.predict(X)
-    pred_new_deaths = new_deaths_model.predict(X)
-    pred_total_cases = total_cases_model.predict(X)
-    pred_total_deaths = total_deaths_model.predict(X)
-    pred_infection_rate = infection_rate_model.predict(X)
-    pred_mortality_rate = mortality_rate_model.predict(X)
-    pred_geo_spread = geographic_spread_model.predict(X_geo)
-
-    prediction_data = {}
-    for i, date_str in enumerate(dates_to_predict):
-        prediction_data[date_str] = {
-            "nouveaux_cas": max(0, int(pred_new_cases[i])),
-            "nouveaux_deces": max(0, int(pred_new_deaths[i])),
-            "total_cas": max(0, int(pred_total_cases[i])),
-            "total_deces": max(0, int(pred_total_deaths[i])),
-            "taux_infection": max(0.0, float(pred_infection_rate[i])),
-            "taux_mortalite": max(0.0, float(pred_mortality_rate[i])),
-            "geographic_spread": max(0, int(pred_geo_spread[i]))
-        }
 
-    return prediction_data
+def annee_et_jour(dates):
+    """Année et jour de l'année (1-366) d'un tableau datetime64[D]."""
+    debut_annee = dates.astype("datetime64[Y]")
+    year = debut_annee.astype(np.int64) + 1970
+    day_of_year = (dates - debut_annee.astype("datetime64[D]")
+                   ).astype(np.int64) + 1
+    return year, day_of_year
 
 
-def moving_average(data_dict, window_size=7):
-    """Lisse un dict {date: valeur} par moyenne glissante (sur les valeurs, garde les dates)."""
-    if not data_dict:
-        return {}
-    dates = sorted(data_dict.keys())
-    values = [data_dict[date] for date in dates]
-    if len(values) < window_size:
-        return dict(zip(dates, values))
-    smoothed = np.convolve(values, np.ones(
-        window_size)/window_size, mode='same')
-    return dict(zip(dates, smoothed))
-
-
-def lissage_officiel_prediction(official_dict, pred_dict, window_size=7, arrondi=False):
-    # Fusionne les deux dicts (dates triées)
-    all_dates = sorted(
-        set(list(official_dict.keys()) + list(pred_dict.keys())))
-    all_values = []
-    for date in all_dates:
-        if date in official_dict:
-            all_values.append(official_dict[date])
-        elif date in pred_dict:
-            all_values.append(pred_dict[date])
-        else:
-            all_values.append(0)
-    # Lissage sur toute la série
-    if len(all_values) < window_size:
-        smoothed = all_values
+def construire_features(country_ids, virus_ids, dates):
+    """Matrices de features construites colonne par colonne."""
+    year, day_of_year = annee_et_jour(dates)
+    country_ids = np.broadcast_to(country_ids, dates.shape)
+    virus_ids = np.broadcast_to(virus_ids, dates.shape)
+    X = np.column_stack([country_ids, virus_ids, year, day_of_year])
+    X_geo = np.column_stack([virus_ids, year])
+    return X, X_geo
+
+
+def entier_positif(valeurs, minimum=0):
+    """Equivalent vectorisé de max(minimum, int(v))."""
+    return np.maximum(np.trunc(valeurs), minimum).astype(np.int64)
+
+
+def _predictions_series(journalieres, pred_geo_spread):
+    return {
+        "nouveaux_cas": entier_positif(journalieres["nouveaux_cas"]),
+        "nouveaux_deces": entier_positif(journalieres["nouveaux_deces"]),
+        "total_cas": entier_positif(journalieres["total_cas"]),
+        "total_deces": entier_positif(journalieres["total_deces"]),
+        "taux_infection": np.maximum(journalieres["taux_infection"], 0.0),
+        "taux_mortalite": np.maximum(journalieres["taux_mortalite"], 0.0),
+        "geographic_spread": entier_positif(pred_geo_spread)
+    }
+
+
+def predire_modele(modeles, nom, X):
+    """
+    Sorties du groupe ou du modèle nom du jeu de modèles : lues dans le
+    tenseur précalculé quand toutes les lignes de X sont dans son domaine,
+    calculées par les modèles sinon.
+    """
+    tenseur = modeles.tensor
+    if tenseur is not None:
+        valeurs = tenseur.predire(nom, X)
+        lectures_tenseur.inc((nom, "fallback" if valeurs is None else "hit"))
+        if valeurs is not None:
+            return valeurs
+    return modeles.inferer(nom, X)
+
+
+def semaine_suivante(d_end):
+    week = d_end.isocalendar()[1] + 1
+    year = d_end.year
+    if week > 52:
+        week = 1
+        year += 1
+    return year, week
+
+
+def executer_modeles(contextes):
+    """
+    Exécute chaque modèle une seule fois pour tout un lot de requêtes : les
+    features de toutes les requêtes sont empilées puis les sorties redécoupées.
+    Retourne, pour chaque contexte, (predictions, scalaires).
+    """
+    country_ids = np.array([ctx["country_id"] for ctx in contextes])
+    virus_ids = np.array([ctx["virus_id"] for ctx in contextes])
+    longueurs = np.array([len(ctx["dates_to_predict"]) for ctx in contextes])
+    bornes = np.concatenate([[0], np.cumsum(longueurs)])
+    n = int(bornes[-1])
+
+    with etape("features"):
+        # Features journalières de toutes les requêtes, sans boucle par date
+        X, X_geo = construire_features(
+            np.repeat(country_ids, longueurs),
+            np.repeat(virus_ids, longueurs),
+            np.concatenate([ctx["dates_to_predict"] for ctx in contextes]))
+        X_end, _ = construire_features(
+            country_ids, virus_ids,
+            np.array([ctx["d_end"] for ctx in contextes],
+                     dtype="datetime64[D]"))
+        X_start, _ = construire_features(
+            country_ids, virus_ids,
+            np.array([ctx["d_start"] for ctx in contextes],
+                     dtype="datetime64[D]"))
+        X_week = np.array([[ctx["virus_id"], *semaine_suivante(ctx["d_end"])]
+                           for ctx in contextes])
+    if n:
+        logger.info(f"Génération des prédictions pour {n} dates")
+
+    # Un seul jeu de modèles pour toute la requête, même si un rechargement
+    # à chaud a lieu pendant le calcul
+    modeles = registry.courant
+    # Les totaux à la date de fin partagent la passe des modèles journaliers
+    with chrono_modele("journalier"):
+        journalieres = predire_modele(modeles, "journalier",
+                                      np.vstack([X, X_end]))
+    if n:
+        with chrono_modele("geographic_spread"):
+            pred_geo_spread = predire_modele(modeles, "geographic_spread",
+                                             X_geo)
+        predictions = _predictions_series(
+            {nom: valeurs[:n] for nom, valeurs in journalieres.items()},
+            pred_geo_spread)
+
+    with chrono_modele("debut_periode"):
+        debut_periode = predire_modele(modeles, "debut_periode", X_start)
+    pred_peak_day = debut_periode["peak_date"].astype(np.int64)
+    pred_duration = entier_positif(
+        debut_periode["estimated_duration_days"], minimum=1)
+    pred_cases_30d = entier_positif(debut_periode["cases_in_30d"])
+    pred_deaths_30d = entier_positif(debut_periode["deaths_in_30d"])
+    with chrono_modele("new_countries_next_week"):
+        pred_new_countries = entier_positif(
+            predire_modele(modeles, "new_countries_next_week", X_week))
+    totaux_cas = entier_positif(journalieres["total_cas"][n:])
+    totaux_deces = entier_positif(journalieres["total_deces"][n:])
+
+    sorties = []
+    for i, ctx in enumerate(contextes):
+        debut, fin = bornes[i], bornes[i + 1]
+        predictions_ctx = {}
+        if fin > debut:
+            predictions_ctx = {nom: valeurs[debut:fin]
+                               for nom, valeurs in predictions.items()}
+
+        peak_date = (np.datetime64(f"{ctx['d_start'].year}-01-01") +
+                     int(pred_peak_day[i]) - 1)
+
+        scalaires = {
+            "total_cases": int(totaux_cas[i]),
+            "total_deaths": int(totaux_deces[i]),
+            "peak_date": str(peak_date),
+            "estimated_duration_days": int(pred_duration[i]),
+            "cases_in_30d": int(pred_cases_30d[i]),
+            "deaths_in_30d": int(pred_deaths_30d[i]),
+            "new_countries_next_week": int(pred_new_countries[i]),
+        }
+        sorties.append((predictions_ctx, scalaires))
+
+    return sorties
+
+
+FIELD_TITLES = {
+    "total_cases": "Total des cas",
+    "total_deaths": "Total des décès",
+    "new_cases": "Nouveaux cas",
+    "new_deaths": "Nouveaux décès",
+    "transmission_rate": "Taux d'infection",
+    "mortality_rate": "Taux de mortalité",
+    "peak_date": "Date du pic",
+    "estimated_duration_days": "Durée estimée (jours)",
+    "cases_in_30d": "Cas dans 30 jours",
+    "deaths_in_30d": "Décès dans 30 jours",
+    "new_countries_next_week": "Nouveaux pays la semaine prochaine",
+    "geographic_spread": "Propagation géographique"
+}
+
+# Colonnes officielles utilisées pour chaque série de la réponse
+SERIES_OFFICIELLES = {
+    "new_cases": "nouveaux_cas",
+    "new_deaths": "nouveaux_deces",
+    "transmission_rate": "taux_infection",
+    "mortality_rate": "taux_mortalite",
+}
+SERIES_ARRONDIES = ("new_cases", "new_deaths")
+
+
+def donnees_officielles(ctx, serie):
+    """
+    Renseigne dans ctx les dates et séries officielles de la période (vues
+    sur la série en cache) et les dates à prédire.
+    """
+    dates, colonnes = serie.periode(ctx["d_start"], ctx["d_end"])
+    logger.info(
+        f"Données officielles récupérées: {len(dates)} enregistrements")
+    ctx["official_dates"] = dates
+    ctx["officielles"] = {
+        serie_reponse: colonnes[colonne]
+        for serie_reponse, colonne in SERIES_OFFICIELLES.items()}
+    # Sommes cumulées de la série en cache sur la période : le lissage ne
+    # recalcule que celles des dates prédites
+    debut, fin = serie.bornes(ctx["d_start"], ctx["d_end"])
+    ctx["cumuls_officiels"] = serie.cumuls[:, debut:fin + 1]
+    ctx["dates_to_predict"] = filtrer_dates_a_predire(ctx["dates"],
+                                                      serie.derniere_date)
+
+
+def calculer_series(ctx, predictions, scalaires):
+    """
+    Lissage des séries sur tableaux alignés, les quatre séries en une
+    passe. Retourne les dates officielles et prédites, les séries lissées
+    de chaque côté et les valeurs scalaires.
+    """
+    official_dates, officielles = ctx["official_dates"], ctx["officielles"]
+    dates_to_predict = ctx["dates_to_predict"]
+    sommes_off = ctx.get("cumuls_officiels")
+
+    series = {
+        "official_dates": official_dates,
+        "prediction_dates": dates_to_predict,
+        "official": {},
+        "predictions": None,
+        "scalaires": scalaires,
+    }
+
+    if len(dates_to_predict):
+        series["predictions"] = {}
+        # Lissage fusionné puis séparation
+        lissees_off, lissees_pred = lisser_fusion(
+            np.stack([officielles[serie] for serie in SERIES_OFFICIELLES]),
+            np.stack([predictions[colonne]
+                      for colonne in SERIES_OFFICIELLES.values()]),
+            window_size=200, sommes_off=sommes_off)
+        for ligne, serie in enumerate(SERIES_OFFICIELLES):
+            valeurs_off, valeurs_pred = lissees_off[ligne], lissees_pred[ligne]
+            if serie in SERIES_ARRONDIES:
+                valeurs_off = np.round(valeurs_off).astype(np.int64)
+                valeurs_pred = np.round(valeurs_pred).astype(np.int64)
+            series["official"][serie] = valeurs_off
+            series["predictions"][serie] = valeurs_pred
+        series["predictions"]["geographic_spread"] = (
+            predictions["geographic_spread"])
+    elif len(official_dates) < 7:
+        # Série trop courte : valeurs officielles non lissées
+        series["official"] = dict(officielles)
     else:
-        smoothed = np.convolve(all_values, np.ones(
-            window_size)/window_size, mode='same')
-    # Sépare à nouveau selon les dates d'origine
-    liss_off = {}
-    liss_pred = {}
-    for i, date in enumerate(all_dates):
-        value = smoothed[i]
-        if arrondi:
-            value = int(round(value))
-        if date in official_dict:
-            liss_off[date] = value
-        if date in pred_dict:
-            liss_pred[date] = value
-    return liss_off, liss_pred
+        # Pas de prédiction, lissage classique sur officiel
+        lissees = moyenne_glissante(
+            np.stack([officielles[serie] for serie in SERIES_OFFICIELLES]),
+            sommes=sommes_off)
+        for ligne, serie in enumerate(SERIES_OFFICIELLES):
+            series["official"][serie] = lissees[ligne]
+
+    return series
+
+
+def _bloc_reponse(dates, valeurs_series, scalaires, colonnes=False):
+    dates_str = np.datetime_as_string(dates, unit="D").tolist()
+    bloc = {"dates": dates_str} if colonnes else {}
+    bloc["total_cases"] = scalaires["total_cases"]
+    bloc["total_deaths"] = scalaires["total_deaths"]
+    for serie, valeurs in valeurs_series.items():
+        if colonnes:
+            bloc[serie] = valeurs.tolist()
+        else:
+            bloc[serie] = dict(zip(dates_str, valeurs.tolist()))
+    for cle in ("peak_date", "estimated_duration_days", "cases_in_30d",
+                "deaths_in_30d", "new_countries_next_week"):
+        bloc[cle] = scalaires[cle]
+    return bloc
 
 
-def predict_pandemic(country: str, virus: str, date_start: str, date_end: str):
+def assembler_resultat(ctx, series):
     """
-    Calcule des prédictions pour un pays et un virus donnés sur une période.
+    Réponse au format historique : chaque série est un dict {date: valeur}.
+    """
+    scalaires = series["scalaires"]
+    official_data = _bloc_reponse(
+        series["official_dates"], series["official"], scalaires)
+    predictions_data = {}
+    if series["predictions"] is not None:
+        predictions_data = _bloc_reponse(
+            series["prediction_dates"], series["predictions"], scalaires)
+
+    return {
+        "country": ctx["country"],
+        "virus": ctx["virus"],
+        "date_start": ctx["date_start"],
+        "date_end": ctx["date_end"],
+        "official": official_data,
+        "predictions": predictions_data,
+        "field_titles": FIELD_TITLES
+    }
+
+
+def assembler_colonnes(ctx, series):
+    """
+    Réponse en colonnes : un tableau "dates" et un tableau de valeurs
+    parallèle par série, sans field_titles (voir GET /field-titles).
+    """
+    scalaires = series["scalaires"]
+    predictions_data = {}
+    if series["predictions"] is not None:
+        predictions_data = _bloc_reponse(
+            series["prediction_dates"], series["predictions"], scalaires,
+            colonnes=True)
+
+    return {
+        "country": ctx["country"],
+        "virus": ctx["virus"],
+        "date_start": ctx["date_start"],
+        "date_end": ctx["date_end"],
+        "official": _bloc_reponse(series["official_dates"], series["official"],
+                                  scalaires, colonnes=True),
+        "predictions": predictions_data,
+    }
+
+
+def preparer_contexte(country, virus, date_start, date_end):
+    """Valide une requête et résout les identifiants pays/virus."""
+    # Validation des dates
+    d_start = datetime.strptime(date_start, "%Y-%m-%d")
+    d_end = datetime.strptime(date_end, "%Y-%m-%d")
+
+    if d_start > d_end:
+        raise ValueError(
+            "La date de début doit être antérieure à la date de fin")
+
+    return {
+        "country": country,
+        "virus": virus,
+        "date_start": date_start,
+        "date_end": date_end,
+        "d_start": d_start,
+        "d_end": d_end,
+        # Récupération des IDs
+        "country_id": get_country_id(country),
+        "virus_id": get_virus_id(virus),
+        # Toutes les dates de la période (datetime64[D])
+        "dates": np.arange(np.datetime64(d_start, "D"),
+                           np.datetime64(d_end, "D") + 1),
+    }
+
+
+def calculer_prediction(country, virus, date_start, date_end):
+    """
+    Calcule les séries lissées et les valeurs scalaires d'une requête.
+    Retourne (ctx, series), à mettre en forme avec assembler_resultat ou
+    assembler_colonnes.
     """
     try:
-        # Validation des dates
-        d_start = datetime.strptime(date_start, "%Y-%m-%d")
-        d_end = datetime.strptime(date_end, "%Y-%m-%d")
+        with etape("lookup"):
+            ctx = preparer_contexte(country, virus, date_start, date_end)
+        country_id, virus_id = ctx["country_id"], ctx["virus_id"]
 
-        if d_start > d_end:
-            raise ValueError(
-                "La date de début doit être antérieure à la date de fin")
+        # Données officielles et dernière date : série en cache
+        with etape("official_data"):
+            donnees_officielles(ctx, series_cache.serie(country_id, virus_id))
 
-        nb_days = (d_end - d_start).days + 1
+        return ctx, calculer_inference(ctx)
 
-        # Récupération des IDs
-        country_id = get_country_id(country)
-        virus_id = get_virus_id(virus)
-
-        # Génération de toutes les dates de la période
-        all_dates = [(d_start + timedelta(days=i)).strftime("%Y-%m-%d")
-                     for i in range(nb_days)]
-
-        # Récupération des données officielles
-        official_raw_data = get_official_data(
-            country_id, virus_id, date_start, date_end)
-
-        # Identification des dates à prédire
-        dates_to_predict = get_dates_to_predict(
-            all_dates, country_id, virus_id)
-
-        # Génération des prédictions uniquement pour les dates nécessaires
-        prediction_raw_data = generate_predictions(
-            country_id, virus_id, dates_to_predict)
-
-        total_cases = max(0, int(total_cases_model.predict(
-            np.array([[country_id, virus_id, d_end.year, d_end.timetuple().tm_yday]]))[0]))
-        total_deaths = max(0, int(total_deaths_model.predict(
-            np.array([[country_id, virus_id, d_end.year, d_end.timetuple().tm_yday]]))[0]))
-
-        peak_day_of_year = int(peak_date_model.predict(np.array(
-            [[country_id, virus_id, d_start.year, d_start.timetuple().tm_yday]]))[0])
-        peak_date = datetime(d_start.year, 1, 1) + \
-            timedelta(days=peak_day_of_year - 1)
-        peak_date_str = peak_date.strftime("%Y-%m-%d")
-
-        estimated_duration_days = max(1, int(estimated_duration_model.predict(np.array(
-            [[country_id, virus_id, d_start.year, d_start.timetuple().tm_yday]]))[0]))
-        cases_in_30d = max(0, int(cases_in_30d_model.predict(np.array(
-            [[country_id, virus_id, d_start.year, d_start.timetuple().tm_yday]]))[0]))
-        deaths_in_30d = max(0, int(deaths_in_30d_model.predict(np.array(
-            [[country_id, virus_id, d_start.year, d_start.timetuple().tm_yday]]))[0]))
-
-        week = d_end.isocalendar()[1] + 1
-        year = d_end.year
-        if week > 52:
-            week = 1
-            year += 1
-        new_countries_next_week = max(0, int(
-            new_countries_next_week_model.predict(np.array([[virus_id, year, week]]))[0]))
-
-        official_dates = [
-            date for date in all_dates if date in official_raw_data]
-
-        # Construction des dicts pour lissage fusionné
-        dict_new_cases_off = {
-            date: official_raw_data[date]["nouveaux_cas"] for date in official_dates}
-        dict_new_deaths_off = {
-            date: official_raw_data[date]["nouveaux_deces"] for date in official_dates}
-        dict_transmission_off = {
-            date: official_raw_data[date]["taux_infection"] for date in official_dates}
-        dict_mortality_off = {
-            date: official_raw_data[date]["taux_mortalite"] for date in official_dates}
-
-        if dates_to_predict:
-            all_new_cases = {}
-            all_new_deaths = {}
-            all_transmission_rate = {}
-            all_mortality_rate = {}
-            all_geographic_spread = {}
-
-            for date in dates_to_predict:
-                if date in prediction_raw_data:
-                    all_new_cases[date] = prediction_raw_data[date]["nouveaux_cas"]
-                    all_new_deaths[date] = prediction_raw_data[date]["nouveaux_deces"]
-                    all_transmission_rate[date] = prediction_raw_data[date]["taux_infection"]
-                    all_mortality_rate[date] = prediction_raw_data[date]["taux_mortalite"]
-                    d = datetime.strptime(date, "%Y-%m-%d")
-                    X_geo = np.array([[virus_id, d.year]])
-                    all_geographic_spread[date] = max(
-                        0, int(geographic_spread_model.predict(X_geo)[0]))
-                elif date in prediction_raw_data:
-                    all_new_cases[date] = prediction_raw_data[date]["nouveaux_cas"]
-                    all_new_deaths[date] = prediction_raw_data[date]["nouveaux_deces"]
-                    all_transmission_rate[date] = prediction_raw_data[date]["taux_infection"]
-                    all_mortality_rate[date] = prediction_raw_data[date]["taux_mortalite"]
-                    all_geographic_spread[date] = prediction_raw_data[date]["geographic_spread"]
-
-            # Lissage fusionné puis séparation
-            liss_new_cases_off, liss_new_cases_pred = lissage_officiel_prediction(
-                dict_new_cases_off, all_new_cases, window_size=200, arrondi=True)
-            liss_new_deaths_off, liss_new_deaths_pred = lissage_officiel_prediction(
-                dict_new_deaths_off, all_new_deaths, window_size=200, arrondi=True)
-            liss_transmission_off, liss_transmission_pred = lissage_officiel_prediction(
-                dict_transmission_off, all_transmission_rate, window_size=200)
-            liss_mortality_off, liss_mortality_pred = lissage_officiel_prediction(
-                dict_mortality_off, all_mortality_rate, window_size=200)
-
-            official_data = {
-                "total_cases": total_cases,
-                "total_deaths": total_deaths,
-                "new_cases": liss_new_cases_off,
-                "new_deaths": liss_new_deaths_off,
-                "transmission_rate": liss_transmission_off,
-                "mortality_rate": liss_mortality_off,
-                "peak_date": peak_date_str,
-                "estimated_duration_days": estimated_duration_days,
-                "cases_in_30d": cases_in_30d,
-                "deaths_in_30d": deaths_in_30d,
-                "new_countries_next_week": new_countries_next_week
-            }
-
-            predictions_data = {
-                "total_cases": total_cases,
-                "total_deaths": total_deaths,
-                "new_cases": liss_new_cases_pred,
-                "new_deaths": liss_new_deaths_pred,
-                "transmission_rate": liss_transmission_pred,
-                "mortality_rate": liss_mortality_pred,
-                "geographic_spread": all_geographic_spread,
-                "peak_date": peak_date_str,
-                "estimated_duration_days": estimated_duration_days,
-                "cases_in_30d": cases_in_30d,
-                "deaths_in_30d": deaths_in_30d,
-                "new_countries_next_week": new_countries_next_week
-            }
-        else:
-            # Pas de prédiction, lissage classique sur officiel
-            official_data = {
-                "total_cases": total_cases,
-                "total_deaths": total_deaths,
-                "new_cases": moving_average(dict_new_cases_off),
-                "new_deaths": moving_average(dict_new_deaths_off),
-                "transmission_rate": moving_average(dict_transmission_off),
-                "mortality_rate": moving_average(dict_mortality_off),
-                "peak_date": peak_date_str,
-                "estimated_duration_days": estimated_duration_days,
-                "cases_in_30d": cases_in_30d,
-                "deaths_in_30d": deaths_in_30d,
-                "new_countries_next_week": new_countries_next_week
-            }
-            predictions_data = {}
-
-        result = {
-            "country": country,
-            "virus": virus,
-            "date_start": date_start,
-            "date_end": date_end,
-            "official": official_data,
-            "predictions": predictions_data,
-            "field_titles": {
-                "total_cases": "Total des cas",
-                "total_deaths": "Total des décès",
-                "new_cases": "Nouveaux cas",
-                "new_deaths": "Nouveaux décès",
-                "transmission_rate": "Taux d'infection",
-                "mortality_rate": "Taux de mortalité",
-                "peak_date": "Date du pic",
-                "estimated_duration_days": "Durée estimée (jours)",
-                "cases_in_30d": "Cas dans 30 jours",
-                "deaths_in_30d": "Décès dans 30 jours",
-                "new_countries_next_week": "Nouveaux pays la semaine prochaine",
-                "geographic_spread": "Propagation géographique"
-            }
-        }
+    except Exception as e:
+        logger.error(f"Erreur lors de la prédiction: {e}")
+        raise
+
+
+async def preparer_prediction_async(country, virus, date_start, date_end):
+    """
+    Partie base de données de calculer_prediction, sur le pool asyncpg.
+    Retourne le contexte prêt pour calculer_inference.
+    """
+    try:
+        with etape("lookup"):
+            # Référentiels en mémoire, sauf nom inconnu ou migration à vérifier
+            ctx = await asyncio.to_thread(
+                preparer_contexte, country, virus, date_start, date_end)
 
-        return result
+        with etape("official_data"):
+            donnees_officielles(ctx, await series_cache.serie_async(
+                ctx["country_id"], ctx["virus_id"]))
+        return ctx
 
     except Exception as e:
         logger.error(f"Erreur lors de la prédiction: {e}")
         raise
+
+
+def calculer_inference(ctx):
+    """
+    Partie calcul de calculer_prediction : modèles puis lissage, sans
+    accès à la base. Retourne les séries.
+    """
+    # Génération des prédictions uniquement pour les dates nécessaires
+    [(predictions, scalaires)] = executer_modeles([ctx])
+
+    with etape("smoothing"):
+        return calculer_series(ctx, predictions, scalaires)
+
+
+def inference_synthetique(country_id=1, virus_id=1, jours=30):
+    """
+    Inférence complète sur une requête fictive, sans base : exécutée au
+    démarrage pour que la première vraie requête ne paie pas les
+    initialisations paresseuses (modèles, chemins de code NumPy et sklearn).
+    """
+    d_start = datetime(2020, 1, 1)
+    d_end = d_start + timedelta(days=jours - 1)
+    ctx = {
+        "country_id": country_id,
+        "virus_id": virus_id,
+        "d_start": d_start,
+        "d_end": d_end,
+        "dates_to_predict": np.arange(np.datetime64(d_start, "D"),
+                                      np.datetime64(d_end, "D") + 1),
+        "official_dates": np.array([], dtype="datetime64[D]"),
+        "officielles": {serie: np.array([], dtype=np.float64)
+                        for serie in SERIES_OFFICIELLES},
+    }
+    return calculer_inference(ctx)
+
+
+def predict_pandemic(country: str, virus: str, date_start: str, date_end: str):
+    """
+    Calcule des prédictions pour un pays et un virus donnés sur une période.
+    """
+    ctx, series = calculer_prediction(country, virus, date_start, date_end)
+    with etape("assembly"):
+        return assembler_resultat(ctx, series)
+
+
+def calculer_prediction_batch(requetes):
+    """
+    Calcule les prédictions de plusieurs requêtes (country, virus,
+    date_start, date_end) en une passe : une requête SQL pour toutes les
+    données officielles et un seul appel predict par modèle.
+    Retourne pour chaque requête (ctx, series), ou un élément
+    {"error": ...} si elle est invalide, sans bloquer les autres.
+    """
+    resultats = [None] * len(requetes)
+    contextes = []
+    with etape("lookup"):
+        for index, requete in enumerate(requetes):
+            try:
+                ctx = preparer_contexte(
+                    requete["country"], requete["virus"],
+                    requete["date_start"], requete["date_end"])
+            except ValueError as e:
+                resultats[index] = {**requete, "error": str(e)}
+                continue
+            ctx["index"] = index
+            contextes.append(ctx)
+
+    if not contextes:
+        return resultats
+
+    try:
+        with etape("official_data"):
+            # Séries absentes du cache lues en une seule requête
+            series = series_cache.series(
+                [(ctx["country_id"], ctx["virus_id"]) for ctx in contextes])
+            for ctx in contextes:
+                donnees_officielles(
+                    ctx, series[(ctx["country_id"], ctx["virus_id"])])
+
+        sorties = executer_modeles(contextes)
+        with etape("smoothing"):
+            for ctx, (predictions, scalaires) in zip(contextes, sorties):
+                resultats[ctx["index"]] = (
+                    ctx, calculer_series(ctx, predictions, scalaires))
+    except Exception as e:
+        logger.error(f"Erreur lors de la prédiction par lot: {e}")
+        raise
+
+    return resultats
+
+
+def predict_pandemic_batch(requetes):
+    """
+    Variante de calculer_prediction_batch au format de réponse historique.
+    """
+    resultats = calculer_prediction_batch(requetes)
+    with etape("assembly"):
+        return [resultat if isinstance(resultat, dict)
+                else assembler_resultat(*resultat)
+                for resultat in resultats]
@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from config import config
+from single_flight import SingleFlight
+
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionCache:
+    def __init__(self, maxsize=None, ttl=None):
+        """Cache LRU borné avec expiration (TTL) des réponses de /predict."""
+        self.maxsize = (config.prediction_cache_size if maxsize is None
+                        else maxsize)
+        self.ttl = config.prediction_cache_ttl if ttl is None else ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._vols = SingleFlight()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expire_at, value = entry
+            if expire_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    async def get_or_compute_async(self, key, compute):
+        """
+        Lecture du cache, sinon calcul par la coroutine compute(). Les
+        requêtes identiques qui manquent le cache en même temps partagent
+        un seul calcul.
+        """
+        value = self.get(key)
+        if value is None:
+            value = await self._vols.executer_async(
+                key, lambda: self._calculer_async(key, compute))
+        return value
+
+    async def _calculer_async(self, key, compute):
+        value = self._relire(key)
+        if value is None:
+            value = await compute()
+            self.set(key, value)
+        return value
+
+    def _relire(self, key):
+        # Un calcul identique a pu se terminer entre get() et
+        # executer_async() : relecture sans compter de hit ni de miss
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] >= time.monotonic():
+            return entry[1]
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                **self._vols.stats(),
+            }
+
+
+prediction_cache = PredictionCache()
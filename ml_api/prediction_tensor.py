@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+FORMAT_TENSEUR = 1
+DOSSIER_TENSEUR = ".tensor"
+FICHIER_MANIFESTE = "manifest.json"
+
+# Axes du domaine de chaque groupe ou modèle, dans l'ordre des colonnes de X
+# (voir construire_features et semaine_suivante dans predict.py)
+DOMAINES = {
+    "journalier": ("pays", "virus", "annee", "jour"),
+    "debut_periode": ("pays", "virus", "annee", "jour"),
+    "geographic_spread": ("virus", "annee"),
+    "new_countries_next_week": ("virus", "annee", "semaine"),
+}
+# Sorties servies telles quelles, gardées en float64. Les autres sont
+# tronquées en entier avant d'être servies : elles sont stockées en float32
+# si la troncature donne le même entier sur tout le domaine
+SORTIES_REELLES = ("taux_infection", "taux_mortalite")
+LIGNES_PAR_PASSE = 1 << 16
+
+
+def axes_domaine(pays, virus, premiere_annee, derniere_annee):
+    return {
+        "pays": np.unique(np.asarray(pays, dtype=np.int64)),
+        "virus": np.unique(np.asarray(virus, dtype=np.int64)),
+        "annee": np.arange(premiere_annee, derniere_annee + 1, dtype=np.int64),
+        "jour": np.arange(1, 367, dtype=np.int64),
+        "semaine": np.arange(1, 54, dtype=np.int64),
+    }
+
+
+def _compacter(nom, valeurs):
+    if nom in SORTIES_REELLES:
+        return valeurs
+    compactes = valeurs.astype(np.float32)
+    if np.array_equal(np.trunc(compactes.astype(np.float64)),
+                      np.trunc(valeurs)):
+        return compactes
+    return valeurs
+
+
+def construire_tenseur(modeles, pays, virus, premiere_annee, derniere_annee):
+    """
+    Évalue chaque groupe et modèle du ModelSet sur tout son domaine pour
+    les années données, puis écrit les sorties dans
+    <dossier des modèles>/.tensor. Retourne le manifeste.
+    """
+    axes = axes_domaine(pays, virus, premiere_annee, derniere_annee)
+    if not (len(axes["pays"]) and len(axes["virus"]) and len(axes["annee"])):
+        raise ValueError("Domaine du tenseur vide")
+    debut = time.perf_counter()
+    dossier = os.path.join(modeles.dossier, DOSSIER_TENSEUR)
+    temporaire = f"{dossier}.{os.getpid()}.tmp"
+    shutil.rmtree(temporaire, ignore_errors=True)
+    os.makedirs(temporaire)
+    sorties = {}
+    try:
+        for nom_axe in ("pays", "virus"):
+            np.save(os.path.join(temporaire, f"{nom_axe}.npy"), axes[nom_axe])
+        for domaine, noms_axes in DOMAINES.items():
+            forme = tuple(len(axes[nom_axe]) for nom_axe in noms_axes)
+            grilles = np.meshgrid(*[axes[nom_axe] for nom_axe in noms_axes],
+                                  indexing="ij")
+            X = np.column_stack([grille.ravel() for grille in grilles])
+            morceaux = {}
+            for ligne in range(0, len(X), LIGNES_PAR_PASSE):
+                valeurs = modeles.inferer(
+                    domaine, X[ligne:ligne + LIGNES_PAR_PASSE])
+                if not isinstance(valeurs, dict):
+                    valeurs = {domaine: valeurs}
+                for nom, morceau in valeurs.items():
+                    morceaux.setdefault(nom, []).append(morceau)
+            for nom, liste in morceaux.items():
+                tableau = _compacter(nom, np.concatenate(liste).reshape(forme))
+                np.save(os.path.join(temporaire, f"{nom}.npy"), tableau)
+                sorties[nom] = {"domain": domaine, "dtype": tableau.dtype.name}
+
+        manifeste = {
+            "format": FORMAT_TENSEUR,
+            "version": modeles.version,
+            "created_at": datetime.now().isoformat(timespec="microseconds"),
+            "years": [int(premiere_annee), int(derniere_annee)],
+            "outputs": sorties,
+        }
+        with open(os.path.join(temporaire, FICHIER_MANIFESTE), "w") as f:
+            json.dump(manifeste, f, indent=2)
+        shutil.rmtree(dossier, ignore_errors=True)
+        os.rename(temporaire, dossier)
+    except BaseException:
+        shutil.rmtree(temporaire, ignore_errors=True)
+        raise
+    logger.info(f"Tenseur de prédictions {modeles.version} construit en "
+                f"{time.perf_counter() - debut:.1f}s")
+    return manifeste
+
+
+class PredictionTensor:
+    def __init__(self, axes, sorties, tableaux, version):
+        """
+        Sorties de tous les modèles précalculées sur leur domaine (pays,
+        virus, année, jour...) pour une fenêtre d'années : une prédiction
+        devient une lecture indexée. Tableaux en memory-map, partagés entre
+        processus. Les features hors du domaine retournent None et passent
+        par les modèles.
+        """
+        self.axes = axes
+        self.sorties = sorties
+        self.tableaux = tableaux
+        self.version = version
+
+    @classmethod
+    def load(cls, dossier_modeles, version):
+        """
+        Tenseur de la version, None s'il est absent ou construit pour une
+        autre version.
+        """
+        dossier = os.path.join(dossier_modeles, DOSSIER_TENSEUR)
+        try:
+            with open(os.path.join(dossier, FICHIER_MANIFESTE)) as f:
+                manifeste = json.load(f)
+            if (manifeste.get("format") != FORMAT_TENSEUR or
+                    manifeste.get("version") != version):
+                logger.warning(
+                    f"Tenseur de prédictions ignoré: construit pour "
+                    f"{manifeste.get('version')}, modèles {version}")
+                return None
+
+            def ouvrir(nom):
+                return np.load(os.path.join(dossier, f"{nom}.npy"),
+                               mmap_mode="r").view(np.ndarray)
+
+            premiere_annee, derniere_annee = manifeste["years"]
+            axes = axes_domaine(ouvrir("pays"), ouvrir("virus"),
+                                premiere_annee, derniere_annee)
+            sorties = {}
+            for nom, description in manifeste["outputs"].items():
+                sorties.setdefault(description["domain"], []).append(nom)
+            tableaux = {nom: ouvrir(nom) for nom in manifeste["outputs"]}
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Tenseur de prédictions illisible: {e}")
+            return None
+        logger.info(f"Tenseur de prédictions {version} ouvert "
+                    f"({premiere_annee}-{derniere_annee})")
+        return cls(axes, sorties, tableaux, version)
+
+    def _indices(self, noms_axes, X):
+        indices = []
+        for colonne, nom_axe in enumerate(noms_axes):
+            axe = self.axes[nom_axe]
+            valeurs = X[:, colonne]
+            position = np.minimum(np.searchsorted(axe, valeurs), len(axe) - 1)
+            if not np.array_equal(axe[position], valeurs):
+                return None
+            indices.append(position)
+        return tuple(indices)
+
+    def predire(self, nom, X):
+        """
+        Sorties du groupe ({sortie: valeurs}) ou du modèle (valeurs) nom
+        pour les features X, comme leur predict ; None si une ligne est
+        hors du domaine précalculé.
+        """
+        noms_axes = DOMAINES.get(nom)
+        X = np.asarray(X)
+        if (noms_axes is None or nom not in self.sorties or X.ndim != 2 or
+                X.shape[1] != len(noms_axes)):
+            return None
+        indices = self._indices(noms_axes, X)
+        if indices is None:
+            return None
+        valeurs = {sortie: self.tableaux[sortie][indices].astype(
+                       np.float64, copy=False)
+                   for sortie in self.sorties[nom]}
+        return valeurs[nom] if nom in valeurs else valeurs
+
+    @property
+    def nbytes(self):
+        return sum(tableau.nbytes for tableau in self.tableaux.values())
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "years": [int(self.axes["annee"][0]), int(self.axes["annee"][-1])],
+            "bytes": self.nbytes,
+        }
+
+
+def main():
+    """
+    Construit le tenseur de la version courante sur les pays et virus de la
+    base.
+    """
+    from config import config
+    from model_registry import registry
+    from reference_cache import reference_cache
+
+    logging.basicConfig(level=logging.INFO)
+    if not (config.prediction_tensor_first_year and
+            config.prediction_tensor_last_year):
+        raise SystemExit("PREDICTION_TENSOR_FIRST_YEAR et "
+                         "PREDICTION_TENSOR_LAST_YEAR requis")
+    reference_cache.load()
+    manifeste = construire_tenseur(
+        registry.courant, list(reference_cache.pays.values()),
+        list(reference_cache.virus.values()),
+        config.prediction_tensor_first_year,
+        config.prediction_tensor_last_year)
+    print(f"✅ Tenseur {manifeste['version']} écrit ({manifeste['years'][0]}-"
+          f"{manifeste['years'][1]}, {len(manifeste['outputs'])} sorties)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import logging
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime
+from config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+class FoldedProfiler:
+    def __init__(self):
+        """
+        Profil déterministe d'un thread via sys.setprofile, agrégé en piles
+        « repliées » (format de flamegraph.pl et speedscope) : une ligne
+        "f1;f2;f3 poids" par pile, le poids étant le temps propre en µs.
+        """
+        self.piles = {}
+        self._cles = [""]
+        self._dernier = 0.0
+
+    @staticmethod
+    def _nom(frame, evenement, arg):
+        if evenement.startswith("c_"):
+            module = getattr(arg, "__module__", None) or "builtins"
+            return f"{module}.{getattr(arg, '__qualname__', repr(arg))}"
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+    def _evenement(self, frame, evenement, arg):
+        maintenant = time.perf_counter()
+        cle = self._cles[-1]
+        if cle:
+            self.piles[cle] = (self.piles.get(cle, 0.0) +
+                               maintenant - self._dernier)
+        if evenement in ("call", "c_call"):
+            nom = self._nom(frame, evenement, arg)
+            self._cles.append(f"{cle};{nom}" if cle else nom)
+        elif len(self._cles) > 1:
+            # return, c_return, c_exception d'un appel ouvert pendant le profil
+            self._cles.pop()
+        self._dernier = time.perf_counter()
+
+    def run(self, fonction):
+        self._dernier = time.perf_counter()
+        sys.setprofile(self._evenement)
+        try:
+            return fonction()
+        finally:
+            sys.setprofile(None)
+
+    def folded(self):
+        return "".join(f"{pile} {max(1, round(duree * 1e6))}\n"
+                       for pile, duree in sorted(self.piles.items()))
+
+
+def echantillonner():
+    """Tirage selon PROFILE_SAMPLE_RATE (0 par défaut : jamais)."""
+    taux = config.profile_sample_rate
+    return taux > 0 and random.random() < taux
+
+
+def _nettoyer(dossier, garder):
+    fichiers = sorted(nom for nom in os.listdir(dossier)
+                      if nom.endswith(".folded"))
+    for ancien in fichiers[:-garder]:
+        try:
+            os.remove(os.path.join(dossier, ancien))
+        except OSError:
+            pass
+
+
+def ecrire_profil(profileur, etiquettes):
+    """
+    Écrit le profil dans PROFILE_DIR et retourne le nom du fichier (None en
+    cas d'échec).
+    """
+    nom = "_".join([datetime.now().strftime("%Y%m%d-%H%M%S-%f"),
+                    *(re.sub(r"[^A-Za-z0-9-]+", "-", str(e))
+                      for e in etiquettes)])
+    nom = f"{nom}.folded"
+    try:
+        os.makedirs(config.profile_dir, exist_ok=True)
+        with open(os.path.join(config.profile_dir, nom), "w") as f:
+            f.write(profileur.folded())
+        _nettoyer(config.profile_dir, config.profile_max_files)
+    except OSError as e:
+        logger.warning(f"Profil non écrit: {e}")
+        return None
+    logger.info(f"Profil écrit: {nom}")
+    return nom
+
+
+def profiler(fonction, *etiquettes):
+    """
+    Exécute fonction sous le profileur et écrit le profil dans PROFILE_DIR,
+    même si fonction échoue. Retourne (résultat, nom du fichier).
+    """
+    profileur = FoldedProfiler()
+    try:
+        resultat = profileur.run(fonction)
+    finally:
+        nom = ecrire_profil(profileur, etiquettes)
+    return resultat, nom
@@ -0,0 +1,122 @@
+import hashlib
+import logging
+import threading
+import time
+from sqlalchemy import select
+from config import config
+from database import db
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceCache:
+    def __init__(self, poll_interval=None):
+        """Dictionnaires nom -> id des tables Pays et Virus, gardés en mémoire
+        et rechargés uniquement quand une nouvelle migration est enregistrée
+        dans Migration_Status."""
+        self.poll_interval = (config.reference_cache_poll_interval
+                              if poll_interval is None else poll_interval)
+        self.pays = {}
+        self.virus = {}
+        self.etags = {}
+        self.version = None
+        self._charge = False
+        self._derniere_verification = 0.0
+        self._lock = threading.Lock()
+
+    def migration_version(self, conn):
+        """Empreinte de la dernière migration (checksum, date, statut)."""
+        migration = db.migration_status
+        if migration is None:
+            return None
+        row = conn.execute(
+            select(migration.c.checksum, migration.c.migrated_at,
+                   migration.c.status)
+            .order_by(migration.c.migrated_at.desc()).limit(1)).first()
+        return tuple(str(v) for v in row) if row else None
+
+    def load(self):
+        """Charge (ou recharge) les deux référentiels depuis la base."""
+        with db.connection() as conn:
+            version = self.migration_version(conn)
+            pays = dict(conn.execute(
+                select(db.pays.c.nom_pays, db.pays.c.id_pays)
+                .order_by(db.pays.c.id_pays)).fetchall())
+            virus = dict(conn.execute(
+                select(db.virus.c.nom_virus, db.virus.c.id_virus)
+                .order_by(db.virus.c.id_virus)).fetchall())
+        with self._lock:
+            self.pays = pays
+            self.virus = virus
+            self.etags = {
+                "countries": self._etag(pays),
+                "viruses": self._etag(virus),
+            }
+            self.version = version
+            self._charge = True
+            self._derniere_verification = time.monotonic()
+        logger.info(
+            f"Référentiels chargés: {len(pays)} pays, {len(virus)} virus")
+
+    def refresh_if_stale(self):
+        """
+        Vérifie au plus une fois par intervalle si une migration a eu lieu.
+        """
+        if not self._charge:
+            self.load()
+            return
+        now = time.monotonic()
+        if now - self._derniere_verification < self.poll_interval:
+            return
+        self._derniere_verification = now
+        with db.connection() as conn:
+            version = self.migration_version(conn)
+        if version != self.version:
+            logger.info("Nouvelle migration détectée, rechargement des "
+                        "référentiels")
+            self.load()
+
+    def get_country_id(self, country_name):
+        return self._lookup("pays", country_name,
+                            f"Pays inconnu: {country_name}")
+
+    def get_virus_id(self, virus_name):
+        return self._lookup("virus", virus_name,
+                            f"Virus inconnu: {virus_name}")
+
+    def countries(self):
+        self.refresh_if_stale()
+        return list(self.pays), self.etags["countries"]
+
+    def viruses(self):
+        self.refresh_if_stale()
+        return list(self.virus), self.etags["viruses"]
+
+    def _lookup(self, referentiel, nom, message):
+        self.refresh_if_stale()
+        identifiant = getattr(self, referentiel).get(nom)
+        if identifiant is not None:
+            return identifiant
+        # Ligne ajoutée hors migration (API GraphQL) : une requête ponctuelle,
+        # et rechargement complet seulement si le nom existe réellement
+        table = db.pays if referentiel == "pays" else db.virus
+        colonne_nom, colonne_id = (("nom_pays", "id_pays")
+                                   if referentiel == "pays"
+                                   else ("nom_virus", "id_virus"))
+        with db.connection() as conn:
+            row = conn.execute(select(table.c[colonne_id]).where(
+                table.c[colonne_nom] == nom)).first()
+        if row is None:
+            raise ValueError(message)
+        self.load()
+        return row[0]
+
+    @staticmethod
+    def _etag(referentiel):
+        empreinte = hashlib.sha1(
+            "\n".join(referentiel).encode("utf-8")).hexdigest()
+        return f'"{empreinte}"'
+
+
+reference_cache = ReferenceCache()
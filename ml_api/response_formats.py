@@ -0,0 +1,138 @@
+import gzip
+import json
+import brotli
+import msgpack
+from predict import assembler_colonnes, assembler_resultat
+
+
+FORMATS = {
+    "json": "application/json",
+    "columnar": "application/vnd.analyzeit.columnar+json",
+    "msgpack": "application/msgpack",
+}
+# Types acceptés dans l'en-tête Accept pour chaque format
+TYPES_ACCEPT = {
+    "application/json": "json",
+    "application/*": "json",
+    "*/*": "json",
+    "application/vnd.analyzeit.columnar+json": "columnar",
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+}
+ENCODAGES = ("br", "gzip")
+# En dessous, la compression coûte plus qu'elle ne rapporte
+TAILLE_MIN_COMPRESSION = 1024
+
+
+def encoder_json(contenu):
+    """Même encodage que JSONResponse de Starlette."""
+    return json.dumps(contenu, ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def qualites(entete):
+    """
+    Valeurs q d'un en-tête Accept ou Accept-Encoding, par élément en
+    minuscules et dans l'ordre de l'en-tête. Un q illisible vaut 0.
+    """
+    resultat = {}
+    for element in (entete or "").split(","):
+        nom, _, parametres = element.partition(";")
+        nom = nom.strip().lower()
+        if not nom:
+            continue
+        qualite = 1.0
+        for parametre in parametres.split(";"):
+            cle, _, valeur = parametre.strip().partition("=")
+            if cle.strip().lower() == "q":
+                try:
+                    qualite = float(valeur)
+                except ValueError:
+                    qualite = 0.0
+        resultat.setdefault(nom, qualite)
+    return resultat
+
+
+def negocier_format(format_demande, accept):
+    """
+    Format de la réponse : paramètre format s'il est donné, sinon le type de
+    plus grand q non nul de l'en-tête Accept (le premier cité à égalité),
+    sinon le JSON historique. Lève ValueError si le format est inconnu.
+    """
+    if format_demande:
+        if format_demande not in FORMATS:
+            raise ValueError(f"Format inconnu: {format_demande}")
+        return format_demande
+    meilleur, meilleure_qualite = "json", 0.0
+    for type_media, qualite in qualites(accept).items():
+        format_accepte = TYPES_ACCEPT.get(type_media)
+        if format_accepte and qualite > meilleure_qualite:
+            meilleur, meilleure_qualite = format_accepte, qualite
+    return meilleur
+
+
+def negocier_encodage(accept_encoding):
+    """
+    Encodage de plus grand q non nul accepté par le client (br puis gzip à
+    égalité), ou None. « * » ne vaut que pour les encodages non cités : il
+    ne lève pas un br;q=0 explicite.
+    """
+    acceptes = qualites(accept_encoding)
+    meilleur, meilleure_qualite = None, 0.0
+    for encodage in ENCODAGES:
+        qualite = acceptes.get(encodage, acceptes.get("*", 0.0))
+        if qualite > meilleure_qualite:
+            meilleur, meilleure_qualite = encodage, qualite
+    return meilleur
+
+
+def compresser(corps, encodage):
+    if encodage == "br":
+        return brotli.compress(corps, quality=5)
+    return gzip.compress(corps, compresslevel=6)
+
+
+class ResultatPrediction:
+    def __init__(self, ctx, series):
+        """
+        Résultat mis en cache : les séries NumPy de la requête, plus le
+        dernier corps servi au format JSON historique (déjà compressé). Un
+        second client qui demande la même variante reçoit les mêmes octets
+        sans nouvelle sérialisation ; les autres formats sont encodés à
+        chaque requête, pour qu'une entrée du cache ne garde jamais plus
+        d'un corps.
+        """
+        self.ctx = {cle: ctx[cle]
+                    for cle in ("country", "virus", "date_start", "date_end")}
+        self.series = series
+        self._corps = None
+
+    def legacy(self):
+        return assembler_resultat(self.ctx, self.series)
+
+    def columnar(self):
+        return assembler_colonnes(self.ctx, self.series)
+
+    def corps(self, format_reponse, encodage=None):
+        """
+        Octets de la réponse dans le format demandé et encodage réellement
+        appliqué : None si encodage est None ou si le corps est trop petit
+        pour valoir une compression.
+        """
+        cle = (format_reponse, encodage)
+        memo = self._corps
+        if memo is not None and memo[0] == cle:
+            return memo[1], memo[2]
+        if format_reponse == "json":
+            corps = encoder_json(self.legacy())
+        elif format_reponse == "columnar":
+            corps = encoder_json(self.columnar())
+        else:
+            corps = msgpack.packb(self.columnar())
+        if encodage and len(corps) >= TAILLE_MIN_COMPRESSION:
+            corps = compresser(corps, encodage)
+        else:
+            encodage = None
+        if format_reponse == "json":
+            self._corps = (cle, corps, encodage)
+        return corps, encodage
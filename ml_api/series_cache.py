@@ -0,0 +1,317 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+import numpy as np
+from sqlalchemy import Float, select, and_, or_, cast, func
+from config import config
+from database import db
+from reference_cache import reference_cache
+from single_flight import SingleFlight
+from smoothing import sommes_prefixes
+from stats_snapshot import stats_snapshot
+
+
+logger = logging.getLogger(__name__)
+
+# Colonnes de Statistiques_Journalieres gardées en mémoire : comptes entiers
+# et taux (Numeric(10, 4) en base)
+COLONNES_ENTIERES = ("nouveaux_cas", "nouveaux_deces", "total_cas",
+                     "total_deces")
+COLONNES_REELLES = ("taux_infection", "taux_mortalite", "croissance_cas",
+                    "taux_mortalite_population", "taux_infection_vs_global",
+                    "taux_mortalite_pop_vs_global")
+COLONNES_SERIE = COLONNES_ENTIERES + COLONNES_REELLES
+# Colonnes lissées par /predict (SERIES_OFFICIELLES de predict.py, même
+# ordre), dont la série garde les sommes cumulées
+COLONNES_CUMULEES = ("nouveaux_cas", "nouveaux_deces", "taux_infection",
+                     "taux_mortalite")
+EPOQUE_ORDINALE = date(1970, 1, 1).toordinal()
+
+
+def colonnes_typees(table, colonnes):
+    """
+    Colonnes de statistiques converties par la base : NULL -> 0, comptes
+    entiers et taux en double precision. Le driver renvoie directement des
+    int et des float, sans Decimal à convertir valeur par valeur.
+    """
+    return [func.coalesce(table.c[colonne], 0).label(colonne)
+            if colonne in COLONNES_ENTIERES
+            else func.coalesce(cast(table.c[colonne], Float),
+                               0.0).label(colonne)
+            for colonne in colonnes]
+
+
+def transposer(lignes, largeur):
+    """
+    Lignes -> liste de colonnes (tuples), largeur colonnes vides si aucune
+    ligne.
+    """
+    return list(zip(*lignes)) or [()] * largeur
+
+
+def en_tableaux(valeurs, colonnes):
+    """
+    valeurs : colonnes lues (date, *colonnes) de colonnes_typees, voir
+    transposer. Retourne (dates, {colonne: tableau}), avec une seule
+    conversion NumPy par colonne.
+    """
+    # Par les ordinaux : np.array(dates, "datetime64[D]") est bien plus lent
+    ordinaux = np.fromiter(map(date.toordinal, valeurs[0]), dtype=np.int64,
+                           count=len(valeurs[0]))
+    dates = (ordinaux - EPOQUE_ORDINALE).astype("datetime64[D]")
+    return dates, {colonne: np.array(valeurs[indice],
+                                     dtype=np.int64
+                                     if colonne in COLONNES_ENTIERES
+                                     else np.float64)
+                   for indice, colonne in enumerate(colonnes, start=1)}
+
+
+class SerieOfficielle:
+    __slots__ = ("dates", "colonnes", "cumuls", "nbytes")
+
+    def __init__(self, dates, colonnes, cumuls=None):
+        """
+        Données officielles d'un couple (pays, virus) : dates triées
+        (datetime64[D]) et une colonne contiguë par statistique. Les
+        tableaux sont en lecture seule, les tranches retournées sont des vues.
+        cumuls : sommes cumulées (len(COLONNES_CUMULEES), n + 1) des
+        colonnes lissées, calculées une fois pour toutes les périodes si
+        elles ne sont pas fournies (snapshot).
+        """
+        if cumuls is None:
+            cumuls = sommes_prefixes([colonnes[colonne]
+                                      for colonne in COLONNES_CUMULEES])
+        self.dates = dates
+        self.colonnes = colonnes
+        self.cumuls = cumuls
+        for tableau in (dates, *colonnes.values(), self.cumuls):
+            tableau.flags.writeable = False
+        self.nbytes = (dates.nbytes +
+                       sum(c.nbytes for c in colonnes.values()) +
+                       self.cumuls.nbytes)
+
+    @classmethod
+    def depuis_lignes(cls, lignes):
+        """
+        lignes : (date, *COLONNES_SERIE) de colonnes_typees, triées par date.
+        """
+        valeurs = transposer(lignes, 1 + len(COLONNES_SERIE))
+        return cls(*en_tableaux(valeurs, COLONNES_SERIE))
+
+    def bornes(self, date_start, date_end):
+        """
+        Indices [debut, fin) des dates entre deux dates incluses, par
+        recherche dichotomique.
+        """
+        debut = np.searchsorted(self.dates, np.datetime64(date_start, "D"),
+                                side="left")
+        fin = np.searchsorted(self.dates, np.datetime64(date_end, "D"),
+                              side="right")
+        return int(debut), int(fin)
+
+    def periode(self, date_start, date_end):
+        """(dates, {colonne: valeurs}) entre deux dates incluses."""
+        debut, fin = self.bornes(date_start, date_end)
+        return (self.dates[debut:fin],
+                {colonne: valeurs[debut:fin]
+                 for colonne, valeurs in self.colonnes.items()})
+
+    @property
+    def derniere_date(self):
+        """
+        Dernière date disponible (datetime.date), None si la série est vide.
+        """
+        return self.dates[-1].item() if len(self.dates) else None
+
+
+def _requete_series(paires):
+    stats = db.stats
+    return select(
+        stats.c.id_pays, stats.c.id_virus, stats.c.date,
+        *colonnes_typees(stats, COLONNES_SERIE)
+    ).where(
+        or_(*[and_(stats.c.id_pays == country_id, stats.c.id_virus == virus_id)
+              for country_id, virus_id in paires])
+    ).order_by(stats.c.id_pays, stats.c.id_virus, stats.c.date)
+
+
+def _decouper(paires, lignes):
+    """
+    Lignes triées par (pays, virus, date) -> {(pays, virus): SerieOfficielle},
+    découpées sur les tableaux de tout le résultat.
+    """
+    valeurs = transposer(lignes, 3 + len(COLONNES_SERIE))
+    pays = np.array(valeurs[0], dtype=np.int64)
+    virus = np.array(valeurs[1], dtype=np.int64)
+    dates, colonnes = en_tableaux(valeurs[2:], COLONNES_SERIE)
+    series = {}
+    for paire in paires:
+        # Indexation booléenne : chaque série a ses propres tableaux, le
+        # cache ne retient pas le résultat entier
+        masque = (pays == paire[0]) & (virus == paire[1])
+        series[paire] = SerieOfficielle(
+            dates[masque], {colonne: valeurs_colonne[masque]
+                            for colonne, valeurs_colonne in colonnes.items()})
+    return series
+
+
+class SeriesCache:
+    def __init__(self, max_bytes=None, ttl=None):
+        """
+        Séries officielles complètes par couple (pays, virus), en tableaux
+        NumPy. Une période est une tranche de la série en cache et la
+        dernière date son dernier élément : plus de requête SQL tant que la
+        série est en cache. LRU borné en octets, vidé à chaque nouvelle
+        migration (version de reference_cache) ; le TTL borne la durée de
+        vie des lignes ajoutées hors migration par l'API GraphQL. Quand le
+        snapshot de la migration est disponible, les séries y sont lues
+        directement, sans requête ni copie.
+        """
+        self.max_bytes = (config.series_cache_max_bytes if max_bytes is None
+                          else max_bytes)
+        self.ttl = config.series_cache_ttl if ttl is None else ttl
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+        self._vols = SingleFlight()
+        self._version = None
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _verifier_version(self):
+        # Appelé verrou pris
+        if self._version != reference_cache.version:
+            if self._series:
+                self.invalidations += 1
+                logger.info(
+                    "Nouvelle migration détectée, cache des séries vidé")
+            self._series.clear()
+            self.nbytes = 0
+            self._version = reference_cache.version
+
+    def _snapshot(self, paire):
+        tranches = stats_snapshot.tranches(*paire, COLONNES_CUMULEES)
+        if tranches is None:
+            return None
+        dates, colonnes, cumuls = tranches
+        # Vues sur le snapshot, sommes cumulées comprises : rien à garder en
+        # cache
+        return SerieOfficielle(
+            dates, {nom: colonnes[nom] for nom in COLONNES_SERIE}, cumuls)
+
+    def _lire(self, paire):
+        with self._lock:
+            self._verifier_version()
+            entree = self._series.get(paire)
+            if entree is None:
+                self.misses += 1
+                return None
+            expire_at, serie = entree
+            if expire_at < time.monotonic():
+                del self._series[paire]
+                self.nbytes -= serie.nbytes
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._series.move_to_end(paire)
+            self.hits += 1
+            return serie
+
+    def _ranger(self, series, version):
+        with self._lock:
+            self._verifier_version()
+            # Série lue avant une migration : servie mais pas gardée
+            if version != self._version:
+                return
+            expire_at = time.monotonic() + self.ttl
+            for paire, serie in series.items():
+                if serie.nbytes > self.max_bytes:
+                    continue
+                precedente = self._series.pop(paire, None)
+                if precedente is not None:
+                    self.nbytes -= precedente[1].nbytes
+                self._series[paire] = (expire_at, serie)
+                self.nbytes += serie.nbytes
+                while self.nbytes > self.max_bytes:
+                    _, (_, ancienne) = self._series.popitem(last=False)
+                    self.nbytes -= ancienne.nbytes
+                    self.evictions += 1
+
+    def _charger(self, paires):
+        version = reference_cache.version
+        with db.connection() as conn:
+            lignes = conn.execute(_requete_series(paires)).fetchall()
+        series = _decouper(paires, lignes)
+        self._ranger(series, version)
+        return series
+
+    async def _charger_async(self, paires):
+        version = reference_cache.version
+        async with db.connection_async() as conn:
+            lignes = (await conn.execute(_requete_series(paires))).fetchall()
+        series = _decouper(paires, lignes)
+        self._ranger(series, version)
+        return series
+
+    def serie(self, country_id, virus_id):
+        paire = (country_id, virus_id)
+        serie = self._snapshot(paire) or self._lire(paire)
+        if serie is None:
+            serie = self._vols.executer(
+                paire, lambda: self._charger([paire])[paire])
+        return serie
+
+    async def serie_async(self, country_id, virus_id):
+        """
+        Variante de serie qui lit les séries absentes sur le pool asyncpg.
+        """
+        paire = (country_id, virus_id)
+        serie = self._snapshot(paire) or self._lire(paire)
+        if serie is None:
+            serie = await self._vols.executer_async(
+                paire, lambda: self._serie_async(paire))
+        return serie
+
+    async def _serie_async(self, paire):
+        return (await self._charger_async([paire]))[paire]
+
+    def series(self, paires):
+        """
+        Plusieurs séries : celles absentes du cache sont lues en une seule
+        requête.
+        """
+        trouvees = {}
+        for paire in set(paires):
+            serie = self._snapshot(paire) or self._lire(paire)
+            if serie is not None:
+                trouvees[paire] = serie
+        manquantes = [paire for paire in set(paires) if paire not in trouvees]
+        if manquantes:
+            trouvees.update(self._charger(manquantes))
+        return trouvees
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._series),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+series_cache = SeriesCache()
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class _Vol:
+    __slots__ = ("futur", "attentes", "tache")
+
+    def __init__(self):
+        self.futur = Future()
+        self.attentes = 0
+        self.tache = None
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Regroupement des calculs identiques simultanés : le premier appel
+        pour une clé calcule, les suivants attendent la fin de ce calcul et
+        reçoivent le même résultat (ou la même exception). Utilisable depuis
+        des threads (executer) comme depuis la boucle asyncio (executer_async).
+        """
+        self._en_cours = {}
+        self._verrou = threading.Lock()
+        self.calculs = 0
+        self.partages = 0
+
+    def _rejoindre(self, cle):
+        """
+        Retourne (vol, True) si l'appelant doit calculer, (vol, False) s'il
+        attend.
+        """
+        with self._verrou:
+            vol = self._en_cours.get(cle)
+            if vol is None:
+                vol = self._en_cours[cle] = _Vol()
+                self.calculs += 1
+                return vol, True
+            vol.attentes += 1
+            self.partages += 1
+            return vol, False
+
+    def _terminer(self, cle, vol, resultat=None, erreur=None):
+        with self._verrou:
+            del self._en_cours[cle]
+        if erreur is not None:
+            vol.futur.set_exception(erreur)
+        else:
+            vol.futur.set_result(resultat)
+
+    def executer(self, cle, calcul):
+        vol, meneur = self._rejoindre(cle)
+        if not meneur:
+            return vol.futur.result()
+        try:
+            resultat = calcul()
+        except BaseException as e:
+            self._terminer(cle, vol, erreur=e)
+            raise
+        self._terminer(cle, vol, resultat)
+        return resultat
+
+    async def executer_async(self, cle, calcul):
+        """calcul est une fonction qui retourne une coroutine."""
+        vol, meneur = self._rejoindre(cle)
+        if meneur:
+            # Tâche à part : une requête annulée n'interrompt pas le calcul
+            # attendu par les autres
+            vol.tache = asyncio.ensure_future(self._mener(cle, vol, calcul))
+        return await asyncio.shield(asyncio.wrap_future(vol.futur))
+
+    async def _mener(self, cle, vol, calcul):
+        try:
+            resultat = await calcul()
+        except BaseException as e:
+            self._terminer(cle, vol, erreur=e)
+            return
+        self._terminer(cle, vol, resultat)
+
+    def stats(self):
+        with self._verrou:
+            return {
+                "in_flight": len(self._en_cours),
+                "waiting": sum(vol.attentes
+                               for vol in self._en_cours.values()),
+                "computations": self.calculs,
+                "coalesced": self.partages,
+            }
@@ -0,0 +1,91 @@
+from functools import lru_cache
+import numpy as np
+
+
+# Moyennes glissantes par sommes cumulées : chaque point coûte deux
+# lectures et une soustraction, quelle que soit la fenêtre. Les bornes des
+# fenêtres sont celles de np.convolve(valeurs, np.ones(w) / w, mode="same") :
+# w // 2 points avant, (w - 1) // 2 après, tronquées aux bords de la série,
+# la somme étant toujours divisée par w. Sur des comptes entiers les sommes
+# sont exactes (jusqu'à 2**53) : un compte lissé est l'arrondi au pair de
+# la moyenne exacte, alors que np.convolve, qui somme des produits par
+# 1 / w, peut s'écarter de 1 sur les demi-entiers (tests/test_smoothing.py).
+
+
+def sommes_prefixes(valeurs):
+    """
+    Sommes cumulées le long du dernier axe, précédées d'un 0 : pour un
+    tableau (k, n), S (k, n + 1) avec
+    somme(valeurs[:, i:j]) = S[:, j] - S[:, i].
+    """
+    valeurs = np.asarray(valeurs, dtype=np.float64)
+    sommes = np.zeros(valeurs.shape[:-1] + (valeurs.shape[-1] + 1,))
+    np.cumsum(valeurs, axis=-1, out=sommes[..., 1:])
+    return sommes
+
+
+def prolonger_prefixes(sommes, valeurs):
+    """Sommes cumulées de sommes suivies de valeurs, sans recalculer sommes."""
+    valeurs = np.asarray(valeurs, dtype=np.float64)
+    # Cumul séquentiel depuis la dernière somme : mêmes flottants qu'un
+    # cumul sur la série entière
+    suite = np.cumsum(np.concatenate([sommes[..., -1:], valeurs], axis=-1),
+                      axis=-1)
+    return np.concatenate([sommes, suite[..., 1:]], axis=-1)
+
+
+@lru_cache(maxsize=128)
+def bornes_fenetres(n, window_size):
+    """
+    Bornes [debut, fin) de la fenêtre de chaque point d'une série de n
+    points.
+    """
+    indices = np.arange(n)
+    debuts = np.maximum(indices - window_size // 2, 0)
+    fins = np.minimum(indices + (window_size - 1) // 2 + 1, n)
+    debuts.flags.writeable = False
+    fins.flags.writeable = False
+    return debuts, fins
+
+
+def moyennes_depuis_prefixes(sommes, window_size):
+    """
+    Moyennes glissantes de toutes les séries (lignes) dont sommes sont les
+    sommes cumulées.
+    """
+    debuts, fins = bornes_fenetres(sommes.shape[-1] - 1, window_size)
+    return (sommes[..., fins] - sommes[..., debuts]) / window_size
+
+
+def moyenne_glissante(valeurs, window_size=7, sommes=None):
+    """
+    Moyenne glissante d'une série (n,) ou de k séries (k, n) en une passe.
+    Une série plus courte que la fenêtre est retournée telle quelle.
+    sommes : sommes cumulées déjà calculées (sommes_prefixes(valeurs)).
+    """
+    if np.shape(valeurs)[-1] < window_size:
+        return valeurs
+    if sommes is None:
+        sommes = sommes_prefixes(valeurs)
+    return moyennes_depuis_prefixes(sommes, window_size)
+
+
+def lisser_fusion(valeurs_off, valeurs_pred, window_size=7, arrondi=False,
+                  sommes_off=None):
+    """
+    Lissage de la série fusionnée officielle puis prédite (les dates
+    officielles précèdent toujours les dates prédites), séparé à nouveau
+    en (officielles, prédites). Séries (n,) ou (k, n). sommes_off : sommes
+    cumulées des valeurs officielles, à réutiliser si déjà calculées.
+    """
+    n_off = np.shape(valeurs_off)[-1]
+    if n_off + np.shape(valeurs_pred)[-1] < window_size:
+        valeurs = np.concatenate([valeurs_off, valeurs_pred], axis=-1)
+    else:
+        if sommes_off is None:
+            sommes_off = sommes_prefixes(valeurs_off)
+        valeurs = moyennes_depuis_prefixes(
+            prolonger_prefixes(sommes_off, valeurs_pred), window_size)
+    if arrondi:
+        valeurs = np.round(valeurs).astype(np.int64)
+    return valeurs[..., :n_off], valeurs[..., n_off:]
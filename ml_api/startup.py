@@ -0,0 +1,98 @@
+import asyncio
+import inspect
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class Demarrage:
+    def __init__(self):
+        """
+        État du démarrage de l'API : étapes exécutées dans l'ordre (import,
+        base, référentiels, modèles, inférence de préchauffage, pool), avec
+        la durée de chacune. En mode arrière-plan (STARTUP_BACKGROUND), le
+        port est ouvert avant la fin des étapes : /health/live répond tout
+        de suite, /health/ready et les autres routes attendent l'état "ready".
+        """
+        self.etat = "starting"
+        self.etape = None
+        self.erreur = None
+        self.durees = {}
+        self._debut = time.perf_counter()
+        self._tache = None
+
+    @property
+    def pret(self):
+        return self.etat == "ready"
+
+    @property
+    def ecoule(self):
+        """
+        Secondes depuis l'import de ce module, au début de celui de l'API.
+        """
+        return time.perf_counter() - self._debut
+
+    def noter(self, etape, duree):
+        self.durees[etape] = round(duree, 3)
+
+    async def executer(self, etapes):
+        """
+        Exécute les étapes (nom, fonction) : les fonctions synchrones dans
+        un thread, pour que la boucle continue de répondre pendant le
+        chargement. Lève l'exception de l'étape qui échoue.
+        """
+        try:
+            for nom, fonction in etapes:
+                self.etape = nom
+                debut = time.perf_counter()
+                if inspect.iscoroutinefunction(fonction):
+                    await fonction()
+                else:
+                    await asyncio.to_thread(fonction)
+                self.noter(nom, time.perf_counter() - debut)
+        except Exception as e:
+            self.etat = "failed"
+            self.erreur = f"{self.etape}: {e}"
+            logger.error(f"Échec du démarrage à l'étape {self.etape}: {e}")
+            raise
+        self.etape = None
+        self.noter("total", self.ecoule)
+        self.etat = "ready"
+        logger.info(f"API prête en {self.durees['total']:.2f}s "
+                    f"({self.durees})")
+
+    def lancer(self, etapes):
+        """
+        Exécute les étapes en arrière-plan ; l'échec reste visible dans
+        /health/ready.
+        """
+        async def executer_sans_lever():
+            try:
+                await self.executer(etapes)
+            except Exception:
+                pass
+
+        self._tache = asyncio.create_task(executer_sans_lever())
+
+    async def arreter(self):
+        """Abandonne un démarrage en arrière-plan encore en cours."""
+        if self._tache is not None and not self._tache.done():
+            self._tache.cancel()
+            try:
+                await self._tache
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self):
+        return {
+            "status": self.etat,
+            "step": self.etape,
+            "error": self.erreur,
+            "uptime_seconds": round(self.ecoule, 3),
+            "timings_seconds": dict(self.durees),
+        }
+
+
+demarrage = Demarrage()
@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import threading
+import numpy as np
+from config import config
+from reference_cache import reference_cache
+
+
+logger = logging.getLogger(__name__)
+
+# Format écrit par csv_to_postgres/snapshot.py
+FORMAT_SNAPSHOT = 2
+FICHIER_COURANT = "CURRENT"
+FICHIER_MANIFESTE = "manifest.json"
+
+
+class StatsSnapshot:
+    def __init__(self, racine=None):
+        """
+        Snapshot en colonnes de Statistiques_Journalieres exporté par la
+        migration : un .npy par colonne, lignes triées par (pays, virus,
+        date), les sommes cumulées de chaque série pour les colonnes
+        lissées, et un index des tranches de chaque série. Les tableaux sont
+        ouverts en memory-map : une série est une vue sans copie, et les
+        pages sont partagées entre processus. Le snapshot n'est utilisé
+        que s'il correspond à la dernière migration terminée.
+        """
+        self.racine = config.stats_snapshot_dir if racine is None else racine
+        self._lock = threading.Lock()
+        self._version_reference = object()
+        self._charge = None
+        self.hits = 0
+
+    def _a_jour(self):
+        """Snapshot valide pour la migration courante, ou None."""
+        version = reference_cache.version
+        charge = self._charge
+        if version == self._version_reference:
+            return charge
+        with self._lock:
+            if version != self._version_reference:
+                self._charge = self._ouvrir(version)
+                self._version_reference = version
+            return self._charge
+
+    def _ouvrir(self, version_migration):
+        # version_migration : (checksum, migrated_at, status) de
+        # Migration_Status
+        if version_migration is None or version_migration[2] != "completed":
+            return None
+        try:
+            with open(os.path.join(self.racine, FICHIER_COURANT)) as f:
+                nom = f.read().strip()
+            dossier = os.path.join(self.racine, nom)
+            with open(os.path.join(dossier, FICHIER_MANIFESTE)) as f:
+                manifeste = json.load(f)
+            if (manifeste.get("format") != FORMAT_SNAPSHOT or
+                    manifeste.get("checksum") != version_migration[0]):
+                logger.info(f"Snapshot {nom} ne correspond pas à la "
+                            f"dernière migration")
+                return None
+
+            def ouvrir(fichier):
+                # ndarray plutôt que np.memmap : pas de surcoût à chaque
+                # tranche
+                return np.load(os.path.join(dossier, fichier),
+                               mmap_mode="r").view(np.ndarray)
+
+            dates = ouvrir("dates.npy")
+            colonnes = {nom_colonne: ouvrir(f"{nom_colonne}.npy")
+                        for nom_colonne in manifeste["columns"]}
+            cumuls = ouvrir("cumuls.npy")
+            cumulees = tuple(manifeste["cumulated_columns"])
+            lignes_index = np.load(os.path.join(dossier, "index.npy"))
+            index = {(int(pays), int(virus)): (int(debut), int(fin),
+                                               int(debut_cumul),
+                                               int(fin_cumul))
+                     for (pays, virus, debut, fin, debut_cumul,
+                          fin_cumul) in lignes_index}
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Snapshot des statistiques indisponible: {e}")
+            return None
+        logger.info(f"Snapshot {nom} ouvert: {len(dates)} lignes, "
+                    f"{len(index)} séries")
+        return {"version": nom, "dates": dates, "colonnes": colonnes,
+                "cumuls": cumuls, "cumulees": cumulees, "index": index}
+
+    def tranches(self, country_id, virus_id, cumulees=()):
+        """
+        (dates, {colonne: valeurs}, cumuls) de la série, en vues sur le
+        snapshot ; None si le snapshot est désactivé ou ne correspond pas à
+        la base. cumuls : sommes cumulées (len(cumulees), n + 1) des
+        colonnes cumulees, None si le snapshot n'a pas ces colonnes dans
+        cet ordre.
+        """
+        if not self.racine:
+            return None
+        charge = self._a_jour()
+        if charge is None:
+            return None
+        # Série absente du snapshot : aucune ligne pour ce couple
+        debut, fin, debut_cumul, fin_cumul = charge["index"].get(
+            (country_id, virus_id), (0, 0, 0, 0))
+        self.hits += 1
+        cumuls = None
+        if tuple(cumulees) == charge["cumulees"]:
+            cumuls = charge["cumuls"][:, debut_cumul:fin_cumul]
+            if not cumuls.shape[-1]:
+                # Série absente : une seule somme, nulle
+                cumuls = np.zeros((len(cumulees), 1))
+        return (charge["dates"][debut:fin],
+                {nom: valeurs[debut:fin]
+                 for nom, valeurs in charge["colonnes"].items()},
+                cumuls)
+
+    def stats(self):
+        charge = self._charge if self.racine else None
+        return {
+            "enabled": bool(self.racine),
+            "version": charge["version"] if charge else None,
+            "rows": len(charge["dates"]) if charge else 0,
+            "series": len(charge["index"]) if charge else 0,
+            "hits": self.hits,
+        }
+
+
+stats_snapshot = StatsSnapshot()
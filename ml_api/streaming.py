@@ -0,0 +1,226 @@
+import logging
+from itertools import chain
+import numpy as np
+from config import config
+from model_registry import registry
+from predict import (SERIES_ARRONDIES, SERIES_OFFICIELLES,
+                     _predictions_series, construire_features,
+                     executer_modeles, predire_modele, preparer_contexte)
+from response_formats import encoder_json
+from series_cache import series_cache
+from smoothing import bornes_fenetres, prolonger_prefixes
+
+
+logger = logging.getLogger(__name__)
+
+COLONNES_FLUX = tuple(SERIES_OFFICIELLES) + ("geographic_spread",)
+
+
+class LissageParBlocs:
+    def __init__(self, n_total, window_size, series, arrondies=(),
+                 origine=None):
+        """
+        Moyenne glissante de smoothing.py calculée au fil des blocs reçus,
+        par sommes cumulées prolongées à chaque bloc : un point n'est émis
+        qu'une fois ses voisins disponibles. Seuls les derniers points et
+        leurs sommes sont gardés en mémoire. origine : sommes cumulées des
+        séries au premier point (celles de SerieOfficielle.cumuls), pour
+        des moyennes identiques au bit près à celles de /predict.
+        """
+        self.n = n_total
+        self.w = window_size
+        # Même règle que lisser_fusion : pas de lissage sur une série courte
+        self.actif = n_total >= window_size
+        self.gauche = window_size // 2
+        self.droite = (window_size - 1) // 2
+        self.series = tuple(series)
+        self.arrondies = tuple(arrondies)
+        self.debut = 0
+        self.recu = 0
+        self.emis = 0
+        self.tampons = None
+        # Sommes cumulées des séries lissées, indices debut à recu inclus
+        self.sommes = np.zeros((len(self.series), 1))
+        if origine is not None:
+            self.sommes[:, 0] = origine
+
+    def ajouter(self, bloc):
+        """
+        Ajoute un bloc {colonne: tableau} (colonnes à lisser et colonnes
+        transmises telles quelles). Retourne (indice du premier point,
+        {colonne: tableau}) pour les points désormais prêts, ou None.
+        """
+        if self.tampons is None:
+            self.tampons = {nom: np.asarray(valeurs)
+                            for nom, valeurs in bloc.items()}
+        else:
+            self.tampons = {nom: np.concatenate([self.tampons[nom], bloc[nom]])
+                            for nom in self.tampons}
+        self.recu += len(next(iter(bloc.values())))
+        if self.actif:
+            self.sommes = prolonger_prefixes(
+                self.sommes, np.stack([bloc[nom] for nom in self.series]))
+
+        limite = self.recu
+        if self.actif and self.recu < self.n:
+            limite = self.recu - self.droite
+        if limite <= self.emis:
+            return None
+
+        a, b = self.emis - self.debut, limite - self.debut
+        sortie = {nom: valeurs[a:b] for nom, valeurs in self.tampons.items()}
+        if self.actif:
+            debuts, fins = bornes_fenetres(self.n, self.w)
+            fins = fins[self.emis:limite] - self.debut
+            debuts = debuts[self.emis:limite] - self.debut
+            moyennes = (self.sommes[:, fins] -
+                        self.sommes[:, debuts]) / self.w
+            for ligne, nom in enumerate(self.series):
+                sortie[nom] = moyennes[ligne]
+        for nom in self.arrondies:
+            sortie[nom] = np.round(sortie[nom]).astype(np.int64)
+
+        premier = self.emis
+        self.emis = limite
+        # Début de fenêtre le plus à gauche des prochains points
+        garder = max(0, self.emis - self.gauche)
+        if garder > self.debut:
+            self.tampons = {nom: valeurs[garder - self.debut:]
+                            for nom, valeurs in self.tampons.items()}
+            self.sommes = self.sommes[:, garder - self.debut:]
+            self.debut = garder
+        return premier, sortie
+
+
+def blocs_officiels(ctx, taille_bloc):
+    """
+    Données officielles de la période par blocs, en vues sur la série en
+    cache lue par /predict.
+    """
+    serie = ctx["serie"]
+    debut, fin = ctx["bornes_officielles"]
+    for premier in range(debut, fin, taille_bloc):
+        dernier = min(premier + taille_bloc, fin)
+        bloc = {"dates": serie.dates[premier:dernier]}
+        for nom, colonne in SERIES_OFFICIELLES.items():
+            bloc[nom] = serie.colonnes[colonne][premier:dernier]
+        bloc["geographic_spread"] = np.zeros(dernier - premier,
+                                             dtype=np.int64)
+        yield bloc
+
+
+def blocs_predits(ctx, modeles, taille_bloc):
+    """Prédictions calculées bloc par bloc sur les dates à prédire."""
+    for debut in range(0, ctx["n_predites"], taille_bloc):
+        dates = ctx["premiere_date_predite"] + np.arange(
+            debut, min(debut + taille_bloc, ctx["n_predites"]))
+        X, X_geo = construire_features(ctx["country_id"], ctx["virus_id"],
+                                       dates)
+        predictions = _predictions_series(
+            predire_modele(modeles, "journalier", X),
+            predire_modele(modeles, "geographic_spread", X_geo))
+        bloc = {"dates": dates}
+        for serie, colonne in SERIES_OFFICIELLES.items():
+            bloc[serie] = predictions[colonne]
+        bloc["geographic_spread"] = predictions["geographic_spread"]
+        yield bloc
+
+
+def preparer_flux(country, virus, date_start, date_end):
+    """
+    Valide la requête et calcule ce qui précède le premier octet : nombre de
+    points officiels et prédits, valeurs scalaires. Lève ValueError si la
+    requête est invalide ou dépasse l'horizon maximal.
+    """
+    ctx = preparer_contexte(country, virus, date_start, date_end)
+    dates = ctx.pop("dates")
+    if len(dates) > config.predict_max_horizon_days:
+        raise ValueError(
+            f"Période trop longue: {len(dates)} jours "
+            f"(maximum {config.predict_max_horizon_days})")
+
+    # Même série en cache que /predict : mêmes données officielles, même
+    # dernière date et mêmes sommes cumulées
+    serie = series_cache.serie(ctx["country_id"], ctx["virus_id"])
+    ctx["serie"] = serie
+    ctx["bornes_officielles"] = serie.bornes(ctx["d_start"], ctx["d_end"])
+    ctx["n_officielles"] = (ctx["bornes_officielles"][1] -
+                            ctx["bornes_officielles"][0])
+
+    # Dates à prédire : suffixe de la période après la dernière date en base
+    latest_data_date = serie.derniere_date
+    debut = 0
+    if latest_data_date is not None:
+        debut = int(np.searchsorted(
+            dates, np.datetime64(latest_data_date, "D"), side="right"))
+    ctx["premiere_date_predite"] = dates[0] + debut
+    ctx["n_predites"] = len(dates) - debut
+
+    ctx["dates_to_predict"] = dates[:0]
+    [(_, ctx["scalaires"])] = executer_modeles([ctx])
+    return ctx
+
+
+def _ligne(type_ligne, dates, colonnes):
+    ligne = {"type": type_ligne,
+             "dates": np.datetime_as_string(dates, unit="D").tolist()}
+    for nom, valeurs in colonnes.items():
+        ligne[nom] = valeurs.tolist()
+    return encoder_json(ligne) + b"\n"
+
+
+def _lignes_pretes(pret, n_officielles):
+    premier, sortie = pret
+    coupure = max(0, min(len(sortie["dates"]), n_officielles - premier))
+    if coupure > 0:
+        yield _ligne("official", sortie["dates"][:coupure],
+                     {serie: sortie[serie][:coupure]
+                      for serie in SERIES_OFFICIELLES})
+    if coupure < len(sortie["dates"]):
+        yield _ligne("predictions", sortie["dates"][coupure:],
+                     {nom: sortie[nom][coupure:] for nom in COLONNES_FLUX})
+
+
+def generer_flux(ctx, taille_bloc):
+    """
+    Réponse NDJSON : une ligne "meta" (comptes et valeurs scalaires), des
+    lignes "official" puis "predictions" en colonnes, et une ligne "end".
+    Les valeurs sont celles de /predict au bit près : les sommes cumulées
+    du lissage partent de celles de la série en cache au début de la
+    période.
+    """
+    n_officielles, n_predites = ctx["n_officielles"], ctx["n_predites"]
+    yield encoder_json({
+        "type": "meta",
+        "country": ctx["country"],
+        "virus": ctx["virus"],
+        "date_start": ctx["date_start"],
+        "date_end": ctx["date_end"],
+        "official_count": n_officielles,
+        "prediction_count": n_predites,
+        **ctx["scalaires"],
+    }) + b"\n"
+
+    # Mêmes fenêtres que calculer_series
+    origine = ctx["serie"].cumuls[:, ctx["bornes_officielles"][0]]
+    if n_predites:
+        lissage = LissageParBlocs(n_officielles + n_predites, 200,
+                                  SERIES_OFFICIELLES, SERIES_ARRONDIES,
+                                  origine=origine)
+    else:
+        lissage = LissageParBlocs(n_officielles, 7, SERIES_OFFICIELLES,
+                                  origine=origine)
+
+    try:
+        modeles = registry.courant
+        for bloc in chain(blocs_officiels(ctx, taille_bloc),
+                          blocs_predits(ctx, modeles, taille_bloc)):
+            pret = lissage.ajouter(bloc)
+            if pret:
+                yield from _lignes_pretes(pret, n_officielles)
+    except Exception as e:
+        # Le statut HTTP est déjà parti : l'erreur est signalée dans le flux
+        logger.error(f"Erreur pendant le flux de prédictions: {e}")
+        yield encoder_json({"type": "error", "detail": str(e)}) + b"\n"
+        return
+    yield encoder_json({"type": "end"}) + b"\n"
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Modules de l'API importés à plat, comme depuis ml_api/ ; base SQLite en
+# mémoire : les tests n'ouvrent aucune connexion à Postgres
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
@@ -0,0 +1,99 @@
+import numpy as np
+
+
+# Implémentations figées servant de référence aux tests : lissage historique
+# de /predict sur dicts {date: valeur} (np.convolve) et générateur de séries
+# synthétiques. Copies volontairement indépendantes du code servi et des
+# scripts de benchmark : ne pas les modifier.
+
+
+def moving_average(data_dict, window_size=7):
+    """Lisse un dict {date: valeur} par moyenne glissante (sur les valeurs,
+    garde les dates)."""
+    if not data_dict:
+        return {}
+    dates = sorted(data_dict.keys())
+    values = [data_dict[date] for date in dates]
+    if len(values) < window_size:
+        return dict(zip(dates, values))
+    smoothed = np.convolve(values, np.ones(
+        window_size)/window_size, mode='same')
+    return dict(zip(dates, smoothed))
+
+
+def lissage_officiel_prediction(official_dict, pred_dict, window_size=7,
+                                arrondi=False):
+    # Fusionne les deux dicts (dates triées)
+    all_dates = sorted(
+        set(list(official_dict.keys()) + list(pred_dict.keys())))
+    all_values = []
+    for date in all_dates:
+        if date in official_dict:
+            all_values.append(official_dict[date])
+        elif date in pred_dict:
+            all_values.append(pred_dict[date])
+        else:
+            all_values.append(0)
+    # Lissage sur toute la série
+    if len(all_values) < window_size:
+        smoothed = all_values
+    else:
+        smoothed = np.convolve(all_values, np.ones(
+            window_size)/window_size, mode='same')
+    # Sépare à nouveau selon les dates d'origine
+    liss_off = {}
+    liss_pred = {}
+    for i, date in enumerate(all_dates):
+        value = smoothed[i]
+        if arrondi:
+            value = int(round(value))
+        if date in official_dict:
+            liss_off[date] = value
+        if date in pred_dict:
+            liss_pred[date] = value
+    return liss_off, liss_pred
+
+
+def generer_virus(rng, populations, jours):
+    """
+    Séries synthétiques d'un virus pour tous les pays, en tableaux (pays,
+    jours) : vagues gaussiennes bruitées, décès tirés parmi les cas,
+    cumuls et taux dérivés comme dans la migration.
+    """
+    t = np.arange(jours)
+    vagues = np.zeros((len(populations), jours))
+    for ligne in vagues:
+        for _ in range(rng.integers(2, 6)):
+            centre, largeur = rng.uniform(0, jours), rng.uniform(15, 90)
+            ligne += (rng.uniform(0.2, 1.0) *
+                      np.exp(-((t - centre) / largeur) ** 2))
+    attendus = populations[:, None] * 2e-4 * (vagues + 0.02)
+    cas = rng.poisson(attendus)
+    deces = rng.binomial(cas, rng.uniform(0.002, 0.03, (len(populations), 1)))
+    total_cas, total_deces = np.cumsum(cas, axis=1), np.cumsum(deces, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precedents = np.concatenate([cas[:, :1], cas[:, :-1]], axis=1)
+        croissance = np.where(precedents > 0,
+                              (cas - precedents) / precedents * 100, 0.0)
+        taux_mortalite = np.where(total_cas > 0,
+                                  total_deces / total_cas * 100, 0.0)
+    taux_infection = total_cas / populations[:, None] * 100
+    taux_mortalite_population = total_deces / populations[:, None] * 1e5
+
+    def relatif(valeurs):
+        # Rapport à la moyenne de tous les pays le même jour
+        return (valeurs / np.maximum(valeurs.mean(axis=0), 1e-9)).round(4)
+
+    return {
+        "nouveaux_cas": cas,
+        "nouveaux_deces": deces,
+        "total_cas": total_cas,
+        "total_deces": total_deces,
+        # Bornés à Numeric(10, 4)
+        "croissance_cas": np.clip(croissance, -999999, 999999).round(4),
+        "taux_mortalite": taux_mortalite.round(4),
+        "taux_infection": taux_infection.round(4),
+        "taux_mortalite_population": taux_mortalite_population.round(4),
+        "taux_infection_vs_global": relatif(taux_infection),
+        "taux_mortalite_pop_vs_global": relatif(taux_mortalite_population),
+    }
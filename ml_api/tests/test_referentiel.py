@@ -0,0 +1,28 @@
+import pytest
+
+from app import etag_correspond
+
+
+ETAG = '"abc123"'
+
+
+@pytest.mark.parametrize("entete", [
+    '"abc123"',
+    'W/"abc123"',
+    '"autre", "abc123"',
+    '"autre",W/"abc123"',
+    '*',
+])
+def test_if_none_match_correspond(entete):
+    assert etag_correspond(entete, ETAG)
+
+
+@pytest.mark.parametrize("entete", [
+    None,
+    '',
+    '"autre"',
+    '"abc123-v2", W/"autre"',
+    'abc123',
+])
+def test_if_none_match_ne_correspond_pas(entete):
+    assert not etag_correspond(entete, ETAG)
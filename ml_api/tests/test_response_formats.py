@@ -0,0 +1,80 @@
+import pytest
+
+from response_formats import (TAILLE_MIN_COMPRESSION, ResultatPrediction,
+                              negocier_encodage, negocier_format)
+
+
+@pytest.mark.parametrize("accept, attendu", [
+    (None, "json"),
+    ("application/msgpack", "msgpack"),
+    ("application/msgpack;q=0, application/json", "json"),
+    ("application/msgpack;q=0", "json"),
+    ("application/json;q=0.5, application/msgpack", "msgpack"),
+    ("application/msgpack;q=0.2, */*;q=0.8", "json"),
+    ("application/vnd.analyzeit.columnar+json, application/msgpack",
+     "columnar"),
+    ("application/msgpack;q=abc, application/json;q=0.1", "json"),
+    ("text/html, application/x-msgpack;q=0.9", "msgpack"),
+])
+def test_negocier_format_suit_les_valeurs_q(accept, attendu):
+    assert negocier_format(None, accept) == attendu
+
+
+def test_negocier_format_parametre_prioritaire():
+    assert negocier_format("columnar", "application/msgpack") == "columnar"
+    with pytest.raises(ValueError):
+        negocier_format("xml", None)
+
+
+@pytest.mark.parametrize("accept_encoding, attendu", [
+    (None, None),
+    ("gzip, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("br;q=0, *", "gzip"),
+    ("br;q=0, gzip;q=0, *", None),
+    ("*;q=0.5, gzip", "gzip"),
+    ("*", "br"),
+    ("identity", None),
+])
+def test_negocier_encodage(accept_encoding, attendu):
+    assert negocier_encodage(accept_encoding) == attendu
+
+
+class Resultat(ResultatPrediction):
+    def __init__(self, taille):
+        self.taille = taille
+        self.encodages = 0
+        super().__init__({"country": "France", "virus": "COVID",
+                          "date_start": "2022-01-01",
+                          "date_end": "2022-01-31"}, None)
+
+    def legacy(self):
+        self.encodages += 1
+        return {"valeurs": [1] * self.taille}
+
+    def columnar(self):
+        self.encodages += 1
+        return {"valeurs": [1] * self.taille}
+
+
+def test_corps_petit_jamais_compresse():
+    corps, encodage = Resultat(3).corps("json", "br")
+    assert encodage is None
+    assert len(corps) < TAILLE_MIN_COMPRESSION
+
+
+def test_un_seul_corps_memorise_par_entree():
+    resultat = Resultat(TAILLE_MIN_COMPRESSION)
+    corps, encodage = resultat.corps("json", "gzip")
+    assert encodage == "gzip"
+    assert resultat.corps("json", "gzip") == (corps, "gzip")
+    assert resultat.encodages == 1
+    # Les autres formats ne sont pas gardés
+    resultat.corps("msgpack", "gzip")
+    resultat.corps("msgpack", "gzip")
+    assert resultat.encodages == 3
+    # Une autre variante JSON remplace la précédente
+    resultat.corps("json", "br")
+    resultat.corps("json", "gzip")
+    assert resultat.encodages == 5
@@ -0,0 +1,175 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from reference import (generer_virus, lissage_officiel_prediction,
+                       moving_average)
+from smoothing import lisser_fusion, moyenne_glissante, sommes_prefixes
+
+
+# Parité avec les anciennes fonctions sur dicts (np.convolve), figées dans
+# tests/reference.py. Les sommes cumulées donnent la moyenne exacte de
+# chaque fenêtre de comptes entiers ; np.convolve somme des produits par
+# 1 / w et s'en écarte de quelques ulps. Deux écarts sont donc admis :
+# - séries arrondies (nouveaux cas et décès) : le résultat est l'arrondi au
+#   pair de la moyenne exacte ; l'ancien diffère de 1 quand la moyenne
+#   exacte tombe sur un demi-entier (ex. 1991 contre 1990) ;
+# - taux : écart relatif d'au plus RTOL_TAUX, écart absolu d'au plus
+#   ATOL_TAUX fois la somme de la série (annulation des sommes cumulées).
+RTOL_TAUX = 1e-12
+ATOL_TAUX = 1e-15
+
+PREMIERE_DATE = date(2020, 1, 1)
+
+
+def en_dict(valeurs, decalage=0):
+    return {(PREMIERE_DATE + timedelta(days=decalage + i)).isoformat(): v
+            for i, v in enumerate(valeurs.tolist())}
+
+
+def moyenne_exacte_arrondie(valeurs, window_size):
+    """
+    Arrondi au pair, en entiers exacts, des moyennes fenêtrées de
+    np.convolve(mode="same").
+    """
+    n = len(valeurs)
+    if n < window_size:
+        # Série plus courte que la fenêtre : non lissée
+        return valeurs
+    sommes = np.concatenate([[0], np.cumsum(valeurs.astype(np.int64))])
+    arrondis = []
+    for i in range(n):
+        somme = int(sommes[min(i + (window_size - 1) // 2 + 1, n)] -
+                    sommes[max(i - window_size // 2, 0)])
+        quotient, reste = divmod(somme, window_size)
+        if (2 * reste > window_size or
+                (2 * reste == window_size and quotient % 2)):
+            quotient += 1
+        arrondis.append(quotient)
+    return np.array(arrondis)
+
+
+def demi_entiers(valeurs, window_size):
+    """Points dont la moyenne exacte de la fenêtre est un demi-entier."""
+    n = len(valeurs)
+    if n < window_size:
+        return np.zeros(n, dtype=bool)
+    sommes = np.concatenate([[0], np.cumsum(valeurs.astype(np.int64))])
+    indices = np.arange(n)
+    fenetres = (sommes[np.minimum(indices + (window_size - 1) // 2 + 1, n)] -
+                sommes[np.maximum(indices - window_size // 2, 0)])
+    return 2 * (fenetres % window_size) == window_size
+
+
+@pytest.fixture(scope="module")
+def series():
+    """Séries synthétiques de tests/reference.py : 6 pays sur trois ans."""
+    populations = np.array([5e5, 2e6, 8e6, 3e7, 6e7, 3e8])
+    return generer_virus(np.random.default_rng(7), populations, 3 * 365 + 1)
+
+
+def assert_taux_proches(obtenu, attendu, valeurs):
+    atol = ATOL_TAUX * float(np.abs(valeurs).sum())
+    np.testing.assert_allclose(obtenu, attendu, rtol=RTOL_TAUX, atol=atol)
+
+
+@pytest.mark.parametrize("window_size", (7, 199, 200))
+def test_moyenne_glissante_taux(series, window_size):
+    for valeurs in series["taux_infection"]:
+        attendu = list(moving_average(en_dict(valeurs), window_size).values())
+        assert_taux_proches(moyenne_glissante(valeurs, window_size),
+                            attendu, valeurs)
+
+
+@pytest.mark.parametrize("window_size", (7, 200))
+def test_moyenne_glissante_plusieurs_series(series, window_size):
+    valeurs = series["taux_mortalite"]
+    lissees = moyenne_glissante(valeurs, window_size)
+    for ligne, serie in enumerate(valeurs):
+        np.testing.assert_array_equal(lissees[ligne],
+                                      moyenne_glissante(serie, window_size))
+    np.testing.assert_array_equal(
+        moyenne_glissante(valeurs, window_size,
+                          sommes=sommes_prefixes(valeurs)), lissees)
+
+
+@pytest.mark.parametrize("n", (1, 6, 199))
+def test_fenetre_plus_large_que_la_serie(series, n):
+    valeurs = series["taux_infection"][0, :n]
+    attendu = list(moving_average(en_dict(valeurs), 200).values())
+    np.testing.assert_array_equal(moyenne_glissante(valeurs, 200), attendu)
+    off, pred = lissage_officiel_prediction(
+        en_dict(valeurs[:n // 2]), en_dict(valeurs[n // 2:], n // 2),
+        window_size=200)
+    lisse_off, lisse_pred = lisser_fusion(valeurs[:n // 2], valeurs[n // 2:],
+                                          window_size=200)
+    np.testing.assert_array_equal(lisse_off, list(off.values()))
+    np.testing.assert_array_equal(lisse_pred, list(pred.values()))
+
+
+def test_une_seule_date():
+    valeurs = np.array([42.0])
+    np.testing.assert_array_equal(moyenne_glissante(valeurs, 7), [42.0])
+    lisse_off, lisse_pred = lisser_fusion(valeurs, np.empty(0),
+                                          window_size=200, arrondi=True)
+    np.testing.assert_array_equal(lisse_off, [42])
+    assert len(lisse_pred) == 0
+    lisse_off, lisse_pred = lisser_fusion(np.empty(0), valeurs,
+                                          window_size=200)
+    assert len(lisse_off) == 0
+    np.testing.assert_array_equal(lisse_pred, [42.0])
+
+
+def test_demi_entier_arrondi_au_pair():
+    # Sommes des fenêtres [1], [1, 2], [2, 5], [5, 6] divisées par 2 :
+    # 0.5, 1.5, 3.5, 5.5
+    lisse_off, lisse_pred = lisser_fusion(np.array([1, 2]),
+                                          np.array([5.0, 6.0]),
+                                          window_size=2, arrondi=True)
+    np.testing.assert_array_equal(np.concatenate([lisse_off, lisse_pred]),
+                                  [0, 2, 4, 6])
+
+
+# (officielles, prédites) : prédictions seules, officielles seules, vue par
+# défaut du tableau de bord et séries plus longues que la fenêtre
+DECOUPAGES = ((0, 60), (400, 0), (300, 100), (900, 197), (1096, 0))
+
+
+@pytest.mark.parametrize("n_off,n_pred", DECOUPAGES)
+@pytest.mark.parametrize("window_size", (199, 200))
+def test_lisser_fusion_taux(series, n_off, n_pred, window_size):
+    for valeurs in series["taux_mortalite"]:
+        valeurs = valeurs[:n_off + n_pred]
+        off, pred = lissage_officiel_prediction(
+            en_dict(valeurs[:n_off]), en_dict(valeurs[n_off:], n_off),
+            window_size)
+        lisse_off, lisse_pred = lisser_fusion(
+            valeurs[:n_off], valeurs[n_off:], window_size,
+            sommes_off=sommes_prefixes(valeurs[:n_off]))
+        assert_taux_proches(lisse_off, list(off.values()), valeurs)
+        assert_taux_proches(lisse_pred, list(pred.values()), valeurs)
+
+
+@pytest.mark.parametrize("colonne", ("nouveaux_cas", "nouveaux_deces"))
+@pytest.mark.parametrize("n_off,n_pred", DECOUPAGES)
+@pytest.mark.parametrize("window_size", (7, 199, 200))
+def test_lisser_fusion_comptes_arrondis(series, colonne, n_off, n_pred,
+                                        window_size):
+    for valeurs in series[colonne]:
+        valeurs = valeurs[:n_off + n_pred]
+        lisse_off, lisse_pred = lisser_fusion(
+            valeurs[:n_off], valeurs[n_off:].astype(np.float64), window_size,
+            arrondi=True)
+        obtenu = np.concatenate([lisse_off, lisse_pred])
+        np.testing.assert_array_equal(
+            obtenu, moyenne_exacte_arrondie(valeurs, window_size))
+
+        off, pred = lissage_officiel_prediction(
+            en_dict(valeurs[:n_off]), en_dict(valeurs[n_off:], n_off),
+            window_size, arrondi=True)
+        ancien = np.array(list(off.values()) + list(pred.values()))
+        ecarts = obtenu != ancien
+        # Uniquement sur les demi-entiers exacts, et d'une unité
+        assert not (ecarts & ~demi_entiers(valeurs, window_size)).any()
+        assert (np.abs(obtenu - ancien)[ecarts] == 1).all()
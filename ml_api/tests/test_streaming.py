@@ -0,0 +1,108 @@
+import json
+from datetime import date
+
+import numpy as np
+import pytest
+
+from model_registry import registry
+from predict import SERIES_OFFICIELLES, calculer_prediction
+from reference import generer_virus
+from reference_cache import reference_cache
+from response_formats import ResultatPrediction
+from series_cache import COLONNES_SERIE, SerieOfficielle, series_cache
+from streaming import generer_flux, preparer_flux
+
+
+# La série officielle couvre 2020-01-01 à 2022-09-26 (1000 jours)
+JOURS = 1000
+SCALAIRES = ("total_cases", "total_deaths", "peak_date",
+             "estimated_duration_days", "cases_in_30d", "deaths_in_30d",
+             "new_countries_next_week")
+PERIODES = (
+    # Officielles puis prédites, fenêtre de 200 points
+    ("2021-06-01", "2023-12-31"),
+    # Officielles puis prédites, plus courtes que la fenêtre
+    ("2022-09-01", "2022-11-30"),
+    # Officielles seules, fenêtre de 7 points
+    ("2020-03-01", "2022-09-26"),
+    # Officielles seules, plus courtes que la fenêtre
+    ("2021-01-01", "2021-01-04"),
+    # Prédites seules
+    ("2024-01-01", "2024-12-31"),
+)
+
+
+class ModelesFactices:
+    """Sorties déterministes des groupes et modèles, sans sklearn."""
+    tensor = None
+
+    def inferer(self, nom, X):
+        X = np.asarray(X, dtype=np.float64)
+        if nom == "journalier":
+            base = (1000 + 400 * np.sin(X[:, 3] / 9) +
+                    37.3 * (X[:, 2] - 2020))
+            return {"nouveaux_cas": base, "nouveaux_deces": base / 37,
+                    "total_cas": base * 100, "total_deces": base * 3,
+                    "taux_infection": base / 7919,
+                    "taux_mortalite": base / 1e4 + 0.3}
+        if nom == "debut_periode":
+            return {"peak_date": X[:, 3] + 20,
+                    "estimated_duration_days": X[:, 3] / 3 + 10,
+                    "cases_in_30d": X[:, 3] * 50,
+                    "deaths_in_30d": X[:, 3]}
+        return X[:, 1] * 3.3
+
+
+@pytest.fixture
+def serie(monkeypatch):
+    valeurs = generer_virus(np.random.default_rng(11), np.array([6.7e7]),
+                            JOURS)
+    serie = SerieOfficielle(
+        np.datetime64(date(2020, 1, 1), "D") + np.arange(JOURS),
+        {colonne: valeurs[colonne][0] for colonne in COLONNES_SERIE})
+    monkeypatch.setattr(series_cache, "serie",
+                        lambda country_id, virus_id: serie)
+    monkeypatch.setattr(reference_cache, "get_country_id", lambda nom: 1)
+    monkeypatch.setattr(reference_cache, "get_virus_id", lambda nom: 1)
+    monkeypatch.setattr(registry, "_courant", ModelesFactices())
+    return serie
+
+
+def reponse_predict(date_start, date_end):
+    resultat = ResultatPrediction(*calculer_prediction(
+        "France", "covid", date_start, date_end))
+    return json.loads(resultat.corps("columnar")[0])
+
+
+def reponse_flux(date_start, date_end, taille_bloc):
+    """Lignes du flux regroupées au format columnar de /predict."""
+    ctx = preparer_flux("France", "covid", date_start, date_end)
+    lignes = [json.loads(ligne) for ligne in generer_flux(ctx, taille_bloc)]
+    assert lignes[0]["type"] == "meta"
+    assert lignes[-1]["type"] == "end"
+    blocs = {"official": {}, "predictions": {}}
+    for ligne in lignes[1:-1]:
+        bloc = blocs[ligne.pop("type")]
+        for nom, valeurs in ligne.items():
+            bloc.setdefault(nom, []).extend(valeurs)
+    return lignes[0], blocs
+
+
+@pytest.mark.parametrize("date_start,date_end", PERIODES)
+@pytest.mark.parametrize("taille_bloc", (1, 7, 90, 5000))
+def test_flux_identique_a_predict(serie, date_start, date_end, taille_bloc):
+    attendu = reponse_predict(date_start, date_end)
+    meta, obtenu = reponse_flux(date_start, date_end, taille_bloc)
+
+    officiel = attendu["official"]
+    assert meta["official_count"] == len(officiel["dates"])
+    for cle in SCALAIRES:
+        assert meta[cle] == officiel[cle]
+    for nom in ("dates", *SERIES_OFFICIELLES):
+        # Égalité exacte : mêmes flottants, pas seulement proches
+        assert obtenu["official"].get(nom, []) == officiel[nom]
+
+    predites = attendu["predictions"]
+    assert meta["prediction_count"] == len(predites.get("dates", []))
+    for nom in ("dates", *SERIES_OFFICIELLES, "geographic_spread"):
+        assert obtenu["predictions"].get(nom, []) == predites.get(nom, [])
@@ -0,0 +1,111 @@
+import glob
+import os
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import (ExtraTreesRegressor, GradientBoostingRegressor,
+                              RandomForestRegressor)
+from sklearn.tree import DecisionTreeRegressor
+
+from fused_forecast import FusedForecaster
+from tree_inference import (CompiledModel, compiler, decomposer, sonde_parite,
+                            verifier_parite)
+
+
+DOSSIER_MODELES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models")
+MODELES_LIVRES = sorted(glob.glob(os.path.join(DOSSIER_MODELES, "*.joblib")))
+LIGNES = (1, 30, 1000)
+
+
+def features(n_lignes, seed=0):
+    """Features de /predict : pays, virus, année, jour de l'année."""
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.integers(1, 200, n_lignes),
+        rng.integers(1, 4, n_lignes),
+        rng.integers(2019, 2027, n_lignes),
+        rng.integers(1, 367, n_lignes),
+    ]).astype(np.float64)
+
+
+def cible(X):
+    return (X[:, 0] * 3.5 + np.sin(X[:, 3] / 20) * 100 +
+            X[:, 1] * (X[:, 2] - 2019))
+
+
+FIXTURES = {
+    "decision_tree": DecisionTreeRegressor(max_depth=12, random_state=0),
+    "random_forest": RandomForestRegressor(n_estimators=20, max_depth=10,
+                                           random_state=0),
+    "extra_trees": ExtraTreesRegressor(n_estimators=20, max_depth=10,
+                                       random_state=0),
+    "gradient_boosting": GradientBoostingRegressor(
+        n_estimators=30, max_depth=4, random_state=0),
+    "gradient_boosting_zero": GradientBoostingRegressor(
+        n_estimators=30, max_depth=4, init="zero", random_state=0),
+}
+
+
+@pytest.fixture(scope="module")
+def modeles_entraines():
+    X = features(2000, seed=1)
+    y = cible(X)
+    return {nom: modele.fit(X, y) for nom, modele in FIXTURES.items()}
+
+
+def matrice(modele, n_lignes):
+    """
+    n_lignes lignes : moitié réalistes, moitié sur les seuils de décision
+    des arbres.
+    """
+    n_sonde = n_lignes // 2
+    sonde = sonde_parite(decomposer(modele)[0], modele.n_features_in_,
+                         n_lignes=n_sonde, seed=n_lignes)
+    return np.vstack([features(n_lignes - n_sonde, seed=n_lignes), sonde])
+
+
+@pytest.mark.parametrize("nom", sorted(FIXTURES))
+@pytest.mark.parametrize("n_lignes", LIGNES)
+def test_modele_compile_identique_a_sklearn(modeles_entraines, nom, n_lignes):
+    modele = modeles_entraines[nom]
+    compile = compiler(modele)
+    # Pas de retour silencieux au predict sklearn
+    assert isinstance(compile, CompiledModel)
+    X = matrice(modele, n_lignes)
+    np.testing.assert_array_equal(compile.predict(X), modele.predict(X))
+
+
+@pytest.mark.parametrize("n_lignes", LIGNES)
+def test_groupe_compile_identique_a_sklearn(modeles_entraines, n_lignes):
+    groupe = FusedForecaster.compiler(modeles_entraines)
+    X = features(n_lignes, seed=n_lignes)
+    sorties = groupe.predict(X)
+    for nom, modele in modeles_entraines.items():
+        np.testing.assert_array_equal(sorties[nom], modele.predict(X))
+
+
+@pytest.mark.skipif(not MODELES_LIVRES,
+                    reason="aucun modèle dans ml_api/models")
+@pytest.mark.parametrize("chemin", MODELES_LIVRES, ids=os.path.basename)
+@pytest.mark.parametrize("n_lignes", LIGNES)
+def test_modeles_livres_identiques_a_sklearn(chemin, n_lignes):
+    modele = joblib.load(chemin)
+    if decomposer(modele) is None:
+        pytest.skip(f"{type(modele).__name__} n'est pas compilable")
+    compile = compiler(modele)
+    assert isinstance(compile, CompiledModel)
+    X = matrice(modele, n_lignes)
+    np.testing.assert_array_equal(compile.predict(X), modele.predict(X))
+
+
+def test_parite_refuse_un_ecart_d_un_ulp(modeles_entraines):
+    modele = modeles_entraines["random_forest"]
+    X = features(30)
+
+    def decale(X):
+        return np.nextafter(modele.predict(X), np.inf)
+
+    assert verifier_parite(modele, modele.predict, X)
+    assert not verifier_parite(modele, decale, X)
@@ -4,6 +4,8 @@ from sqlalchemy.orm import declarative_base, sessionmaker
 import numpy as np
 from config import config
 from model_comparison import ModelComparison
+from model_registry import ModelSet, creer_version, publier_version
+from prediction_tensor import construire_tenseur
 import os
 import warnings
 
@@ -117,11 +119,13 @@ def prepare_features(df):
 
 
 def create_models_directory():
-    if not os.path.exists('models'):
-        os.makedirs('models')
-        print("📁 Répertoire 'models' créé")
-    else:
-        print("📁 Répertoire 'models' existe déjà")
+    """
+    Crée le dossier de la nouvelle version de modèles
+    (models/<horodatage>/).
+    """
+    dossier, version = creer_version(config.models_dir)
+    print(f"📁 Répertoire '{dossier}' créé pour la version {version}")
+    return dossier, version
 
 
 def safe_train_model(comparator, X, y, model_name, save_path, min_samples=100):
@@ -163,7 +167,7 @@ def safe_train_model(comparator, X, y, model_name, save_path, min_samples=100):
 
 
 def main():
-    create_models_directory()
+    dossier, version = create_models_directory()
     session = get_session()
     df = fetch_training_data(session)
     df = prepare_features(df)
@@ -190,12 +194,18 @@ def main():
 
     # ENTRAÎNEMENT DES MODÈLES PRINCIPAUX
     models_to_train = [
-        ("Nouveaux Cas", "nouveaux_cas", "models/new_cases_model.joblib"),
-        ("Nouveaux Décès", "nouveaux_deces", "models/new_deaths_model.joblib"),
-        ("Taux Infection", "taux_infection", "models/infection_rate_model.joblib"),
-        ("Taux Mortalité", "taux_mortalite", "models/mortality_rate_model.joblib"),
-        ("Total Cas", "total_cas", "models/total_cases_model.joblib"),
-        ("Total Décès", "total_deces", "models/total_deaths_model.joblib")
+        ("Nouveaux Cas", "nouveaux_cas",
+         os.path.join(dossier, "new_cases_model.joblib")),
+        ("Nouveaux Décès", "nouveaux_deces",
+         os.path.join(dossier, "new_deaths_model.joblib")),
+        ("Taux Infection", "taux_infection",
+         os.path.join(dossier, "infection_rate_model.joblib")),
+        ("Taux Mortalité", "taux_mortalite",
+         os.path.join(dossier, "mortality_rate_model.joblib")),
+        ("Total Cas", "total_cas",
+         os.path.join(dossier, "total_cases_model.joblib")),
+        ("Total Décès", "total_deces",
+         os.path.join(dossier, "total_deaths_model.joblib"))
     ]
 
     trained_models = 0
@@ -236,7 +246,10 @@ def main():
                 X_peak = df_peak[basic_features].values
                 y_peak = df_peak["peak_day_of_year"].values
                 safe_train_model(comparator, X_peak, y_peak,
-                                 "Date Pic", "models/peak_date_model.joblib", 50)
+                                 "Date Pic",
+                                 os.path.join(dossier,
+                                              "peak_date_model.joblib"),
+                                 50)
             else:
                 print("Aucune donnée après merge pour les dates de pic.")
         else:
@@ -273,7 +286,10 @@ def main():
                 X_duration = df_duration[basic_features].values
                 y_duration = df_duration["duration"].values
                 safe_train_model(comparator, X_duration, y_duration, "Durée Estimée",
-                                 "models/estimated_duration_model.joblib", 50)
+                                 os.path.join(
+                                     dossier,
+                                     "estimated_duration_model.joblib"),
+                                 50)
             else:
                 print("Aucune donnée après merge pour les durées.")
         else:
@@ -314,9 +330,11 @@ def main():
         y_cases_30d = df_rolling["cases_in_30d"].values
         y_deaths_30d = df_rolling["deaths_in_30d"].values
         safe_train_model(comparator, X_rolling, y_cases_30d,
-                         "Cas 30 Jours", "models/cases_in_30d_model.joblib")
+                         "Cas 30 Jours",
+                         os.path.join(dossier, "cases_in_30d_model.joblib"))
         safe_train_model(comparator, X_rolling, y_deaths_30d,
-                         "Décès 30 Jours", "models/deaths_in_30d_model.joblib")
+                         "Décès 30 Jours",
+                         os.path.join(dossier, "deaths_in_30d_model.joblib"))
 
     except Exception as e:
         print(f"Erreur calcul prédictions rolling: {e}")
@@ -334,7 +352,9 @@ def main():
             X_geo = geo_spread[["id_virus", "year"]].values
             y_geo = geo_spread["num_countries_affected"].values
             safe_train_model(comparator, X_geo, y_geo, "Propagation Géographique",
-                             "models/geographic_spread_model.joblib", 20)
+                             os.path.join(dossier,
+                                          "geographic_spread_model.joblib"),
+                             20)
         else:
             print(
                 f"Pas assez de données pour la propagation géographique ({len(geo_spread)} < 20).")
@@ -364,7 +384,10 @@ def main():
                 "id_virus", "year", "week"]].values
             y_new_countries = new_countries_week["new_countries"].values
             safe_train_model(comparator, X_new_countries, y_new_countries, "Nouveaux Pays Semaine",
-                             "models/new_countries_next_week_model.joblib", 20)
+                             os.path.join(
+                                 dossier,
+                                 "new_countries_next_week_model.joblib"),
+                             20)
         else:
             print(
                 f"Pas assez de données pour les nouveaux pays ({len(new_countries_week)} < 20).")
@@ -374,6 +397,27 @@ def main():
 
     comparator.generate_comparison_report()
 
+    # 6. TENSEUR DE PRÉDICTIONS
+    # Sorties de tous les modèles précalculées sur la fenêtre d'années :
+    # /predict les lit au lieu d'exécuter les modèles
+    premiere_annee = config.prediction_tensor_first_year
+    derniere_annee = config.prediction_tensor_last_year
+    if premiere_annee and derniere_annee:
+        print(f"\nConstruction du tenseur de prédictions "
+              f"({premiere_annee}-{derniere_annee})...")
+        try:
+            manifeste = construire_tenseur(
+                ModelSet(dossier, version), df["id_pays"].unique(),
+                df["id_virus"].unique(), premiere_annee, derniere_annee)
+            print(f"   ✅ Tenseur écrit ({len(manifeste['outputs'])} sorties)")
+        except Exception as e:
+            print(f"   ❌ Erreur tenseur de prédictions: {e}")
+
+    # La version n'est servie qu'une fois complète : ml_api la charge via
+    # POST /admin/models/reload ou la surveillance de models/CURRENT
+    publier_version(config.models_dir, version)
+    print(f"🚀 Version {version} publiée dans {config.models_dir}/CURRENT")
+
 
 if __name__ == "__main__":
     main()
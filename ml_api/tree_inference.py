@@ -0,0 +1,223 @@
+import logging
+import os
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# Au-delà, le predict multithreadé de sklearn reprend l'avantage
+LIGNES_MAX_COMPILE = 2048
+
+
+def decomposer(modele):
+    """
+    Décompose un modèle à base d'arbres sous la forme
+    predict(X) = (init + Σ echelle * arbre(X)) / diviseur.
+    Retourne (arbres, echelle, diviseur, init) ou None si le modèle n'est
+    pas un ensemble d'arbres de régression à une sortie. init est la
+    constante de départ du gradient boosting (None pour les autres modèles).
+    """
+    # Import différé : sklearn (plusieurs secondes) n'est chargé que pour
+    # compiler, pas au démarrage de l'API
+    from sklearn.dummy import DummyRegressor
+    from sklearn.ensemble import (ExtraTreesRegressor,
+                                  GradientBoostingRegressor,
+                                  RandomForestRegressor)
+    from sklearn.tree import DecisionTreeRegressor, ExtraTreeRegressor
+
+    if getattr(modele, "n_outputs_", 1) != 1:
+        return None
+    if isinstance(modele, (DecisionTreeRegressor, ExtraTreeRegressor)):
+        return [modele.tree_], 1.0, 1, None
+    if isinstance(modele, (RandomForestRegressor, ExtraTreesRegressor)):
+        arbres = [estimateur.tree_ for estimateur in modele.estimators_]
+        return arbres, 1.0, len(arbres), None
+    if isinstance(modele, GradientBoostingRegressor):
+        arbres = [estimateur.tree_ for estimateur in modele.estimators_[:, 0]]
+        if isinstance(modele.init_, str) and modele.init_ == "zero":
+            init = None
+        elif isinstance(modele.init_, DummyRegressor):
+            init = float(np.ravel(modele.init_.constant_)[0])
+        else:
+            return None
+        return arbres, modele.learning_rate, 1, init
+    return None
+
+
+TABLEAUX = ("feature", "threshold", "enfants", "value", "racines",
+            "profondeurs")
+
+
+class CompiledTrees:
+    def __init__(self, arbres):
+        """
+        Copie un ensemble d'arbres sklearn dans des tableaux NumPy plats
+        (feature, threshold, left, right, value). Les feuilles bouclent sur
+        elles-mêmes : le parcours vectorisé avance toutes les lignes et tous
+        les arbres d'un niveau à chaque itération, sans branchement.
+        """
+        features, thresholds, lefts, rights = [], [], [], []
+        values, racines = [], []
+        decalage = 0
+        profondeurs = []
+        for arbre in arbres:
+            n = arbre.node_count
+            feuilles = arbre.children_left < 0
+            indices = np.arange(n) + decalage
+            features.append(np.where(feuilles, 0, arbre.feature))
+            thresholds.append(np.where(feuilles, 0.0, arbre.threshold))
+            lefts.append(np.where(feuilles, indices,
+                                  arbre.children_left + decalage))
+            rights.append(np.where(feuilles, indices,
+                                   arbre.children_right + decalage))
+            values.append(arbre.value[:, 0, 0])
+            racines.append(decalage)
+            profondeurs.append(arbre.max_depth)
+            decalage += n
+
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds).astype(np.float64)
+        self.value = np.concatenate(values).astype(np.float64)
+        self.racines = np.array(racines, dtype=np.intp)
+        self.profondeurs = np.array(profondeurs, dtype=np.intp)
+        # enfants[2 * noeud] : fils gauche, enfants[2 * noeud + 1] : fils droit
+        self.enfants = np.empty(2 * decalage, dtype=np.intp)
+        self.enfants[0::2] = np.concatenate(lefts)
+        self.enfants[1::2] = np.concatenate(rights)
+        self._indexer_paquets()
+
+    def _indexer_paquets(self):
+        self.paquets = [(int(profondeur),
+                         np.flatnonzero(self.profondeurs == profondeur))
+                        for profondeur in np.unique(self.profondeurs)]
+
+    def save(self, dossier):
+        """Écrit chaque tableau dans un .npy (relisible en memory-map)."""
+        os.makedirs(dossier, exist_ok=True)
+        for nom in TABLEAUX:
+            np.save(os.path.join(dossier, f"{nom}.npy"), getattr(self, nom))
+
+    @classmethod
+    def load(cls, dossier, mmap_mode="r"):
+        """
+        Relit les tableaux en memory-map : les pages sont partagées par le
+        cache du système entre tous les workers qui ouvrent les mêmes fichiers.
+        """
+        arbres = cls.__new__(cls)
+        for nom in TABLEAUX:
+            tableau = np.load(os.path.join(dossier, f"{nom}.npy"),
+                              mmap_mode=mmap_mode)
+            # Vue ndarray sur la même projection : évite le surcoût de la
+            # sous-classe np.memmap à chaque take
+            setattr(arbres, nom, tableau.view(np.ndarray))
+        arbres._indexer_paquets()
+        return arbres
+
+    @property
+    def nbytes(self):
+        return sum(tableau.nbytes for tableau in (
+            self.feature, self.threshold, self.enfants, self.value))
+
+    def apply(self, X32):
+        """Indices des feuilles atteintes, de forme (n_arbres, n_lignes)."""
+        n_lignes, n_features = X32.shape
+        # Comparaison en float64 comme sklearn (X float32 promu, seuils
+        # float64)
+        X_plat = X32.astype(np.float64).ravel()
+        feuilles = np.empty((len(self.racines), n_lignes), dtype=np.intp)
+        # Les arbres sont parcourus par paquets de même profondeur : un arbre
+        # de profondeur 3 ne fait pas 10 itérations inutiles
+        for profondeur, arbres in self.paquets:
+            debut_lignes = np.tile(np.arange(n_lignes) * n_features,
+                                   len(arbres))
+            noeuds = np.repeat(self.racines[arbres], n_lignes)
+            for _ in range(profondeur):
+                x = X_plat.take(debut_lignes + self.feature.take(noeuds))
+                a_droite = x > self.threshold.take(noeuds)
+                noeuds = self.enfants.take(2 * noeuds + a_droite)
+            feuilles[arbres] = noeuds.reshape(len(arbres), n_lignes)
+        return feuilles
+
+    def leaf_values(self, X32):
+        return self.value.take(self.apply(X32))
+
+
+def accumuler(valeurs_arbres, echelle, diviseur, init):
+    """
+    Combine les valeurs des feuilles (n_arbres, n_lignes) dans le même ordre
+    d'opérations que sklearn (init puis ajout arbre par arbre) pour obtenir
+    exactement les mêmes flottants.
+    """
+    termes = valeurs_arbres if echelle == 1.0 else echelle * valeurs_arbres
+    if init is not None:
+        termes = np.vstack([np.full((1, termes.shape[1]), init), termes])
+    sortie = np.add.accumulate(termes, axis=0)[-1]
+    if diviseur != 1:
+        sortie = sortie / diviseur
+    return sortie
+
+
+def sonde_parite(arbres, n_features, n_lignes=256, seed=0):
+    """
+    Matrice de contrôle construite autour des seuils de décision des arbres.
+    """
+    rng = np.random.default_rng(seed)
+    colonnes = []
+    for feature in range(n_features):
+        seuils = np.concatenate([
+            arbre.threshold[arbre.feature == feature] for arbre in arbres])
+        if len(seuils) == 0:
+            seuils = np.zeros(1)
+        candidats = np.concatenate([seuils - 0.5, seuils + 0.5,
+                                    np.round(seuils)])
+        colonnes.append(rng.choice(candidats, size=n_lignes))
+    return np.column_stack(colonnes)
+
+
+def verifier_parite(modele, predict_compile, X):
+    """
+    Vrai si la prédiction compilée est identique, au bit près, à celle de
+    sklearn sur X.
+    """
+    attendu = modele.predict(X)
+    obtenu = predict_compile(X)
+    return np.array_equal(obtenu, attendu)
+
+
+class CompiledModel:
+    def __init__(self, modele):
+        """Modèle sklearn à base d'arbres évalué par parcours vectorisé."""
+        decomposition = decomposer(modele)
+        if decomposition is None:
+            raise TypeError(f"Modèle non compilable: {type(modele).__name__}")
+        arbres, self.echelle, self.diviseur, self.init = decomposition
+        self.modele = modele
+        self.arbres = CompiledTrees(arbres)
+
+    def predict(self, X):
+        X32 = np.ascontiguousarray(X, dtype=np.float32)
+        if X32.shape[0] == 0:
+            return np.empty(0)
+        if X32.shape[0] > LIGNES_MAX_COMPILE:
+            return self.modele.predict(X)
+        return accumuler(self.arbres.leaf_values(X32),
+                         self.echelle, self.diviseur, self.init)
+
+
+def compiler(modele, verifier=True):
+    """
+    Retourne une version compilée du modèle si possible (et identique à
+    sklearn sur une matrice de contrôle), sinon le modèle d'origine.
+    """
+    decomposition = decomposer(modele)
+    if decomposition is None:
+        return modele
+    compile = CompiledModel(modele)
+    if verifier:
+        X = sonde_parite(decomposition[0], modele.n_features_in_)
+        if not verifier_parite(modele, compile.predict, X):
+            logger.warning(
+                f"Écart avec sklearn pour {type(modele).__name__}, "
+                f"modèle non compilé")
+            return modele
+    return compile